@@ -6,7 +6,7 @@ from flask_cors import CORS
 from itsdangerous import BadSignature, SignatureExpired
 
 from app.config import Config
-from app.db import close_session, init_db
+from app.db import close_session, get_db, init_db, pool_status
 from app.api.auth import verify_token
 
 
@@ -57,7 +57,11 @@ def create_app() -> Flask:
 
     @app.get("/api/health")
     def health():
-        return jsonify({"ok": True})
+        db = get_db(app)
+        data = {"ok": True, "db_pool": pool_status(db.engine)}
+        if db.replica_engine is not None:
+            data["db_replica_pool"] = pool_status(db.replica_engine)
+        return jsonify(data)
 
     @app.errorhandler(Exception)
     def handle_exception(err: Exception):
@@ -14,11 +14,22 @@ from datetime import datetime
 from typing import Optional
 
 from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context
-from sqlalchemy import and_, insert, select, update, func, or_
+from sqlalchemy import and_, select, update, func
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.db import get_db, get_session
+from app.db import get_read_session, get_session, get_table, session_scope
+from app.services.bulk_writer import insert_questions
+from app.services.chapter_tree import load_subtrees, subtree_condition
+from app.services.count_cache import cached_total, filter_key
+from app.services.pagination import fetch_page, parse_page_args
 from app.services.deepseek import get_deepseek_client
+from app.services.dict_cache import get_dict_cache
+from app.services.exposure import exposed_counts, exposure_weight
+from app.services.near_dup import get_near_dup_index
+from app.services.paper_snapshot import QUESTION_FIELDS, load_paper, papers_containing, refresh_snapshots
+from app.services.question_search import keyword_rank
+from app.services.sampling import candidate_ids, invalidate, sample_ids
+from app.services.similar_index import get_similar_index
 
 ai_bp = Blueprint("ai", __name__)
 
@@ -30,10 +41,7 @@ MAX_FILL_ATTEMPTS = 3
 
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 def _extract_json_list(text: str) -> list[dict]:
@@ -147,19 +155,28 @@ def _pick_first(d: dict, keys: list[str]) -> Optional[str]:
     return None
 
 
+def _insert_questions(app, rows: list[dict]) -> list[int]:
+    """在独立的短事务中写入一批题目并立即归还连接，返回新题目ID。"""
+    if not rows:
+        return []
+    with session_scope(app) as session:
+        return insert_questions(session, rows, return_ids=True)
+
+
 def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], rules: list[dict], create_user: str):
     with app.app_context():
         _job_update(job_id, {"status": "running", "started_at": datetime.now().isoformat(timespec="seconds")})
         _job_event(job_id, "job_start", "开始生成")
         qb = _table("question_bank")
         ch = _table("textbook_chapter")
-        session = get_session(current_app)
         inserted = 0
         created_ids: list[int] = []
 
+        # 每次访问数据库都使用独立短事务，等待模型返回期间不占用连接
         try:
             stmt = select(ch.c.chapter_id, ch.c.chapter_name, ch.c.content).where(ch.c.chapter_id.in_(chapter_ids))
-            chapters = session.execute(stmt).mappings().all()
+            with session_scope(app) as session:
+                chapters = [dict(r) for r in session.execute(stmt).mappings().all()]
             if not chapters:
                 _job_update(job_id, {"status": "error", "error": "所选章节不存在"})
                 _job_event(job_id, "job_error", "所选章节不存在")
@@ -187,7 +204,8 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
                         .order_by(qb.c.question_id.desc())
                         .limit(3)
                     )
-                    sample = session.execute(sample_stmt).mappings().all()
+                    with session_scope(app) as session:
+                        sample = [dict(r) for r in session.execute(sample_stmt).mappings().all()]
                     source_ids = [str(s["question_id"]) for s in sample]
 
                     system_prompt = "你是一位大学出题助理。你必须严格输出 JSON 数组，不要输出任何多余文本，严格按照题型输出，不要出错题型，除了单选题和多项题任何题型都不要有选项。"
@@ -234,7 +252,8 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
                     client = get_deepseek_client()
                     target_count = int(count)
                     collected: list[dict] = []
-                    seen_contents: set[str] = set()
+                    # 同一规则内与题库中的近似重复题都直接丢弃，缺口由补齐重试填上
+                    dup = get_near_dup_index(app).checker(subject_id)
                     attempt = 0
 
                     def call_model(prompt: str, attempt_no: int, missing: int) -> str:
@@ -291,6 +310,7 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
 
                         _job_event(job_id, "parse_ok", f"解析成功：{len(items)}条（第{attempt}次）", {"count": len(items), "attempt": attempt})
 
+                        dup_count = 0
                         for it in items:
                             if len(collected) >= target_count:
                                 break
@@ -299,10 +319,9 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
                             content = _pick_first(it, ["question_content", "content", "stem", "question", "题干"])
                             if not content:
                                 continue
-                            content_key = re.sub(r"\s+", " ", content).strip()
-                            if content_key in seen_contents:
+                            if dup.check(content) is not None:
+                                dup_count += 1
                                 continue
-                            seen_contents.add(content_key)
 
                             answer = _pick_first(it, ["question_answer", "answer", "答案"])
                             analysis = _pick_first(it, ["question_analysis", "analysis", "解析"])
@@ -332,6 +351,8 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
                                 }
                             )
 
+                        if dup_count:
+                            _job_event(job_id, "rule_dedup", f"过滤近似重复题：{dup_count}条", {"duplicates": dup_count, "attempt": attempt})
                         _job_event(job_id, "rule_progress", f"已收集：{len(collected)}/{target_count}", {"collected": len(collected), "target": target_count})
 
                     if len(collected) < target_count:
@@ -339,8 +360,8 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
                         raise ValueError(f"生成题目不足：需要{target_count}，实际{len(collected)}")
 
                     now = datetime.now()
-                    for it in collected:
-                        data = {
+                    rows = [
+                        {
                             "subject_id": subject_id,
                             "chapter_id": chapter_id,
                             "type_id": it.get("type_id", type_id),
@@ -358,16 +379,15 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
                             "create_time": now,
                             "update_time": now,
                         }
-                        res = session.execute(insert(qb).values(**data))
-                        if res.inserted_primary_key:
-                            created_ids.append(res.inserted_primary_key[0])
-                        inserted += 1
+                        for it in collected
+                    ]
+                    created_ids.extend(_insert_questions(app, rows))
+                    inserted += len(rows)
 
                     _job_update(job_id, {"inserted": inserted, "question_ids": created_ids})
                     _job_event(job_id, "progress", f"已入库：{inserted}题", {"inserted": inserted})
                     _job_event(job_id, "rule_end", "本规则完成")
 
-            session.commit()
             _job_update(
                 job_id,
                 {
@@ -379,7 +399,6 @@ def _run_generation(app, job_id: str, subject_id: int, chapter_ids: list[int], r
             )
             _job_event(job_id, "job_done", f"任务完成：新增{inserted}题", {"inserted": inserted})
         except Exception as err:
-            session.rollback()
             _job_update(
                 job_id,
                 {
@@ -428,9 +447,7 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
         _job_update(job_id, {"status": "running", "started_at": datetime.now().isoformat(timespec="seconds")})
         _job_event(job_id, "job_start", "开始生成变式题目")
         
-        qb = _table("question_bank")
         ch = _table("textbook_chapter")
-        session = get_session(current_app)
         inserted = 0
         created_ids: list[int] = []
 
@@ -441,7 +458,8 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
                 tasks = predefined_tasks
             elif chapter_ids:
                 stmt = select(ch.c.chapter_id, ch.c.chapter_name, ch.c.content).where(ch.c.chapter_id.in_(chapter_ids))
-                rows = session.execute(stmt).mappings().all()
+                with session_scope(app) as session:
+                    rows = [dict(r) for r in session.execute(stmt).mappings().all()]
                 if not rows:
                     raise ValueError("所选章节不存在")
                 # Default target: 5 per chapter
@@ -504,7 +522,7 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
 
                 client = get_deepseek_client()
                 collected = []
-                seen_contents = set()
+                dup = get_near_dup_index(app).checker(subject_id)
                 attempt = 0
                 
                 while len(collected) < target_count_per_chapter and attempt < 3:
@@ -535,6 +553,7 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
                         
                         items = _extract_json_list(raw_text)
                         
+                        dup_count = 0
                         for it in items:
                             if len(collected) >= target_count_per_chapter: break
                             
@@ -542,9 +561,10 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
                             content = _pick_first(it, ["question_content", "content", "题干"])
                             if not content: continue
                             
-                            # Check duplicates
-                            if content in seen_contents: continue
-                            seen_contents.add(content)
+                            # 与本批次及题库中的题目近似重复则丢弃
+                            if dup.check(content) is not None:
+                                dup_count += 1
+                                continue
                             
                             answer = _pick_first(it, ["question_answer", "answer", "答案"])
                             analysis = _pick_first(it, ["question_analysis", "analysis", "解析"])
@@ -563,6 +583,8 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
                             })
                             
                         _job_event(job_id, "parse_ok", f"解析成功：{len(items)}条")
+                        if dup_count:
+                            _job_event(job_id, "rule_dedup", f"过滤近似重复题：{dup_count}条", {"duplicates": dup_count, "attempt": attempt})
                         
                     except Exception as e:
                         _job_event(job_id, "ai_error", f"生成出错：{str(e)}")
@@ -573,8 +595,8 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
                     collected = collected[:target_count_per_chapter]
 
                 now = datetime.now()
-                for it in collected:
-                    data = {
+                rows = [
+                    {
                         "subject_id": subject_id,
                         "chapter_id": cid, # Can be None
                         "type_id": it["type_id"],
@@ -589,12 +611,10 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
                         "create_time": now,
                         "update_time": now,
                     }
-                    res = session.execute(insert(qb).values(**data))
-                    if res.inserted_primary_key:
-                        created_ids.append(res.inserted_primary_key[0])
-                    inserted += 1
-                
-                session.commit()
+                    for it in collected
+                ]
+                created_ids.extend(_insert_questions(app, rows))
+                inserted += len(rows)
                 _job_event(job_id, "progress", f"章节/任务 {cname} 完成，入库 {len(collected)} 题")
 
             _job_update(job_id, {
@@ -606,8 +626,7 @@ def _run_variant_generation(app, job_id: str, subject_id: int, chapter_ids: list
             _job_event(job_id, "job_done", f"全部完成，共生成 {inserted} 题")
 
         except Exception as e:
-            session.rollback()
-            _job_update(job_id, {"status": "error", "error": str(e)})
+            _job_update(job_id, {"status": "error", "error": str(e), "inserted": inserted, "question_ids": created_ids})
             _job_event(job_id, "job_error", str(e))
 
 
@@ -621,32 +640,29 @@ def generate_from_paper():
 
     if not paper_id or not subject_id:
         return jsonify({"error": {"message": "paper_id 和 subject_id 必填", "type": "BadRequest"}}), 400
+    try:
+        paper_id = int(paper_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": {"message": "paper_id 格式错误", "type": "BadRequest"}}), 400
 
     # Fetch paper content
     try:
         session = get_session(current_app)
-        # Join with question bank to get content
-        pqr = _table("paper_question_relation")
-        qb = _table("question_bank")
         ch = _table("textbook_chapter")
-        
-        stmt = (
-            select(
-                qb.c.question_content, 
-                qb.c.type_id, 
-                qb.c.question_score,
-                qb.c.chapter_id,
-                ch.c.chapter_name
-            )
-            .join(pqr, pqr.c.question_id == qb.c.question_id)
-            .outerjoin(ch, ch.c.chapter_id == qb.c.chapter_id)
-            .where(pqr.c.paper_id == paper_id)
-            .order_by(pqr.c.question_sort)
-        )
-        rows = session.execute(stmt).mappings().all()
-        
+
+        loaded = load_paper(current_app, session, paper_id)
+        rows = loaded[1] if loaded is not None else []
         if not rows:
             return jsonify({"error": {"message": "试卷为空或不存在", "type": "NotFound"}}), 404
+
+        # 章节名不进快照（章节可改名），按快照中的章节ID单独取
+        chapter_ids = sorted({int(r["chapter_id"]) for r in rows if r["chapter_id"] is not None})
+        chapter_names = {}
+        if chapter_ids:
+            chapter_names = {
+                int(cid): name
+                for cid, name in session.execute(select(ch.c.chapter_id, ch.c.chapter_name).where(ch.c.chapter_id.in_(chapter_ids)))
+            }
             
         # Group by chapter_id
         # { chapter_id: { "name": str, "questions": [] } }
@@ -659,7 +675,7 @@ def generate_from_paper():
             if cid not in grouped:
                 grouped[cid] = {
                     "chapter_id": cid if cid != 0 else None,
-                    "chapter_name": r["chapter_name"] if r["chapter_name"] else "未分类章节",
+                    "chapter_name": chapter_names.get(cid) or "未分类章节",
                     "questions": []
                 }
             
@@ -850,19 +866,17 @@ def generate_answer_sheet_preview():
     paper_id = payload.get("paper_id")
     if not paper_id:
         return jsonify({"error": {"message": "paper_id 必填", "type": "BadRequest"}}), 400
+    try:
+        paper_id = int(paper_id)
+    except (TypeError, ValueError):
+        return jsonify({"error": {"message": "paper_id 格式错误", "type": "BadRequest"}}), 400
 
     try:
         session = get_session(current_app)
-        pqr = _table("paper_question_relation")
-        qb = _table("question_bank")
-        
-        stmt = (
-            select(qb.c.question_content, qb.c.type_id, qb.c.question_score)
-            .join(pqr, pqr.c.question_id == qb.c.question_id)
-            .where(pqr.c.paper_id == paper_id)
-            .order_by(pqr.c.question_sort)
-        )
-        questions = session.execute(stmt).mappings().all()
+        loaded = load_paper(current_app, session, paper_id)
+        questions = loaded[1] if loaded is not None else []
+        # 流式输出可能持续数分钟，先结束事务归还连接
+        session.close()
         
         if not questions:
             return jsonify({"error": {"message": "试卷为空", "type": "NotFound"}}), 404
@@ -935,61 +949,27 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
         _job_update(job_id, {"status": "running", "started_at": datetime.now().isoformat(timespec="seconds")})
         _job_event(job_id, "job_start", f"开始生成（共{total_expected}题）", {"total_count": total_expected})
         qb = _table("question_bank")
-        ch = _table("textbook_chapter")
-        session = get_session(current_app)
         inserted = 0
         created_ids: list[int] = []
 
+        # 章节上下文一次取完；之后每个章节的参考题读取、入库各用一个短事务，模型调用期间不占用连接
         try:
             chapter_ids = list(chapter_dist.keys())
-            stmt = select(ch.c.chapter_id, ch.c.chapter_name, ch.c.content, ch.c.parent_chapter_id, ch.c.textbook_id).where(ch.c.chapter_id.in_(chapter_ids))
-            chapters_data = {r["chapter_id"]: dict(r) for r in session.execute(stmt).mappings().all()}
-            
-            if not chapters_data:
+            # 所选章节的子树（含自身）一次取完：用于查章节信息与把数量分摊到叶子章节
+            with session_scope(app) as session:
+                subtrees = load_subtrees(app, session, chapter_ids, ["chapter_name", "content"])
+
+            if not any(subtrees.values()):
                 _job_update(job_id, {"status": "error", "error": "所选章节不存在"})
                 _job_event(job_id, "job_error", "所选章节不存在")
                 return
 
-            # --- 递归获取子章节内容 ---
-            # 1. 找出涉及的教材ID
-            textbook_ids = set(c["textbook_id"] for c in chapters_data.values() if c.get("textbook_id"))
-            
-            # 2. 获取这些教材的所有章节以构建层级关系
             all_chapters_map = {} # {chapter_id: row}
-            children_map = {} # {parent_id: [child_id, ...]}
-            
-            if textbook_ids:
-                all_ch_stmt = select(ch.c.chapter_id, ch.c.chapter_name, ch.c.parent_chapter_id, ch.c.content).where(ch.c.textbook_id.in_(textbook_ids))
-                all_rows = session.execute(all_ch_stmt).mappings().all()
-                for row in all_rows:
-                    cid = row["chapter_id"]
-                    pid = row["parent_chapter_id"]
-                    all_chapters_map[cid] = row
-                    if pid:
-                        children_map.setdefault(pid, []).append(cid)
-            
-            def get_aggregated_content(root_id):
-                contents = []
-                # 根节点内容
-                root_c = all_chapters_map.get(root_id, {}).get("content")
-                if root_c:
-                    contents.append(root_c)
-                
-                # 递归子节点
-                stack = [root_id]
-                seen = {root_id}
-                while stack:
-                    curr = stack.pop()
-                    children = children_map.get(curr, [])
-                    for child in children:
-                        if child not in seen:
-                            seen.add(child)
-                            stack.append(child)
-                            c = all_chapters_map.get(child, {}).get("content")
-                            if c:
-                                contents.append(c)
-                return "\n".join(contents)
-            # -----------------------
+            leaves_map = {} # {chapter_id: [leaf_id, ...]}
+            for root, rows in subtrees.items():
+                for row in rows:
+                    all_chapters_map[row["chapter_id"]] = row
+                leaves_map[root] = [row["chapter_id"] for row in rows if row["is_leaf"]]
 
             # 对每条规则进行分配
             for rule_idx, rule in enumerate(rules):
@@ -1019,22 +999,11 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                 # --- 新增逻辑：将分配给父章节的 count 分摊给所有叶子子章节 ---
                 final_tasks = {} # {cid: count}
                 
-                def get_leaves(node_id):
-                    children = children_map.get(node_id, [])
-                    if not children:
-                        return [node_id]
-                    leaves = []
-                    for child in children:
-                        leaves.extend(get_leaves(child))
-                    return leaves
-
                 for cid, count in dist_counts.items():
                     if count <= 0:
                         continue
                     
-                    leaves = get_leaves(cid)
-                    # 过滤掉不在 all_chapters_map 里的（比如可能没查到）
-                    leaves = [l for l in leaves if l in all_chapters_map]
+                    leaves = leaves_map.get(cid) or []
                     
                     if not leaves:
                         # 只有自己
@@ -1080,11 +1049,11 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                         .order_by(qb.c.question_id.desc())
                         .limit(3)
                     )
-                    sample = session.execute(sample_stmt).mappings().all()
+                    with session_scope(app) as session:
+                        sample = [dict(r) for r in session.execute(sample_stmt).mappings().all()]
                     source_ids = [str(s["question_id"]) for s in sample]
 
                     # summary = chapter_info.get("content") or ""
-                    # summary = get_aggregated_content(cid)
                     # 修改为只使用当前章节（叶子节点）的内容，避免重复或混淆
                     summary = chapter_info.get("content") or ""
                     
@@ -1132,7 +1101,8 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                     client = get_deepseek_client()
                     target_count = int(count)
                     collected: list[dict] = []
-                    seen_contents: set[str] = set()
+                    # 同一规则内与题库中的近似重复题都直接丢弃，缺口由补齐重试填上
+                    dup = get_near_dup_index(app).checker(subject_id)
                     attempt = 0
 
                     def call_model(prompt: str, attempt_no: int, missing: int) -> str:
@@ -1189,6 +1159,7 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
 
                         _job_event(job_id, "parse_ok", f"解析成功：{len(items)}条（第{attempt}次）", {"count": len(items), "attempt": attempt})
 
+                        dup_count = 0
                         for it in items:
                             if len(collected) >= target_count:
                                 break
@@ -1197,10 +1168,9 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                             content = _pick_first(it, ["question_content", "content", "stem", "question", "题干"])
                             if not content:
                                 continue
-                            content_key = re.sub(r"\s+", " ", content).strip()
-                            if content_key in seen_contents:
+                            if dup.check(content) is not None:
+                                dup_count += 1
                                 continue
-                            seen_contents.add(content_key)
 
                             answer = _pick_first(it, ["question_answer", "answer", "答案"])
                             analysis = _pick_first(it, ["question_analysis", "analysis", "解析"])
@@ -1230,6 +1200,8 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                                 }
                             )
 
+                        if dup_count:
+                            _job_event(job_id, "rule_dedup", f"过滤近似重复题：{dup_count}条", {"duplicates": dup_count, "attempt": attempt})
                         _job_event(job_id, "rule_progress", f"已收集：{len(collected)}/{target_count}", {"collected": len(collected), "target": target_count})
 
                     if len(collected) < target_count:
@@ -1237,8 +1209,8 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                         # 不抛出异常，继续下一个章节
                     
                     now = datetime.now()
-                    for it in collected:
-                        data = {
+                    rows = [
+                        {
                             "subject_id": subject_id,
                             "chapter_id": cid,
                             "type_id": it.get("type_id", type_id),
@@ -1256,16 +1228,15 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
                             "create_time": now,
                             "update_time": now,
                         }
-                        res = session.execute(insert(qb).values(**data))
-                        if res.inserted_primary_key:
-                            created_ids.append(res.inserted_primary_key[0])
-                        inserted += 1
+                        for it in collected
+                    ]
+                    created_ids.extend(_insert_questions(app, rows))
+                    inserted += len(rows)
                     
                     _job_update(job_id, {"inserted": inserted, "question_ids": created_ids})
                     _job_event(job_id, "progress", f"已入库：{inserted}题", {"inserted": inserted})
                     # --- 结束单章节生成逻辑 ---
 
-            session.commit()
             _job_update(
                 job_id,
                 {
@@ -1277,7 +1248,6 @@ def _run_generation_v2(app, job_id: str, subject_id: int, chapter_dist: dict[int
             )
             _job_event(job_id, "job_done", f"任务完成：新增{inserted}题", {"inserted": inserted})
         except Exception as err:
-            session.rollback()
             _job_update(
                 job_id,
                 {
@@ -1341,13 +1311,12 @@ def job_events(job_id: str):
 def list_pending():
     qb = _table("question_bank")
     ch = _table("textbook_chapter")
-    sd = _table("subject_dict")
-    qtd = _table("question_type_dict")
-    qdd = _table("question_difficulty_dict")
     subject_id = request.args.get("subject_id", type=int)
     chapter_ids_str = request.args.get("chapter_id", type=str)
-    page = max(1, request.args.get("page", default=1, type=int))
-    page_size = min(100, max(1, request.args.get("page_size", default=20, type=int)))
+    try:
+        page_req = parse_page_args(request.args, default_size=20, max_size=100)
+    except ValueError as err:
+        return jsonify({"error": {"message": str(err), "type": "BadRequest"}}), 400
 
     where = [qb.c.review_status == 0]
     if subject_id is not None:
@@ -1371,10 +1340,7 @@ def list_pending():
             ch.c.textbook_id,
             qb.c.type_id,
             qb.c.difficulty_id,
-            sd.c.subject_name.label("subject_name"),
             ch.c.chapter_name.label("chapter_name"),
-            qtd.c.type_name.label("type_name"),
-            qdd.c.difficulty_name.label("difficulty_name"),
             qb.c.question_content,
             qb.c.question_answer,
             qb.c.question_analysis,
@@ -1384,29 +1350,38 @@ def list_pending():
             qb.c.create_user,
             qb.c.create_time,
         )
-        .select_from(
-            qb.outerjoin(ch, ch.c.chapter_id == qb.c.chapter_id)
-            .outerjoin(sd, sd.c.subject_id == qb.c.subject_id)
-            .outerjoin(qtd, qtd.c.type_id == qb.c.type_id)
-            .outerjoin(qdd, qdd.c.difficulty_id == qb.c.difficulty_id)
-        )
+        .select_from(qb.outerjoin(ch, ch.c.chapter_id == qb.c.chapter_id))
         .where(and_(*where))
     )
-    
-    stmt = (
-        stmt_base
-        .order_by(qb.c.question_id.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
-    )
 
     try:
-        # 使用不带分页的查询来计算总数
-        count_query = select(func.count()).select_from(stmt_base.subquery())
-        total = get_session(current_app).execute(count_query).scalar_one()
-        
-        rows = get_session(current_app).execute(stmt).mappings().all()
-        return jsonify({"items": [dict(r) for r in rows], "page": page, "page_size": page_size, "total": total})
+        # 筛选条件只涉及题库表，总数无需连接
+        count_query = select(func.count()).select_from(qb).where(and_(*where))
+        session = get_read_session(current_app)
+        total, estimated = None, False
+        if page_req.with_total:
+            total, estimated = cached_total(
+                current_app,
+                session,
+                filter_key("ai.pending", request.args),
+                count_query,
+                select(qb.c.question_id).where(and_(*where)),
+                ["question_bank"],
+                mode=request.args.get("total_mode", default="exact", type=str),
+            )
+
+        rows, next_cursor = fetch_page(session, stmt_base, qb.c.question_id, page_req)
+        get_dict_cache(current_app).decorate(rows)
+        return jsonify(
+            {
+                "items": rows,
+                "page": page_req.page,
+                "page_size": page_req.page_size,
+                "total": total,
+                "total_estimated": estimated,
+                "next_cursor": next_cursor,
+            }
+        )
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
@@ -1421,6 +1396,11 @@ def generate_smart_paper():
 
     if not subject_id or not textbook_id or not description:
         return jsonify({"error": {"message": "subject_id, textbook_id, description 必填", "type": "BadRequest"}}), 400
+    try:
+        # 曝光降权指数，含义同组卷策略的 exposure_weight
+        exposure_alpha = max(0.0, float(payload.get("exposure_weight") or 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": {"message": "exposure_weight 格式错误", "type": "BadRequest"}}), 400
 
     job_id = uuid.uuid4().hex
     with _jobs_lock:
@@ -1435,33 +1415,33 @@ def generate_smart_paper():
         }
     
     app = current_app._get_current_object()
-    _executor.submit(_do_smart_paper_job, app, job_id, subject_id, textbook_id, description)
+    _executor.submit(_do_smart_paper_job, app, job_id, subject_id, textbook_id, description, exposure_alpha)
 
     return jsonify({"job_id": job_id})
 
-def _do_smart_paper_job(app, job_id, subject_id, textbook_id, description):
+def _do_smart_paper_job(app, job_id, subject_id, textbook_id, description, exposure_alpha=0.0):
     with app.app_context():
         try:
             _job_update(job_id, {"status": "running", "started_at": datetime.now().isoformat(timespec="seconds")})
             _job_event(job_id, "job_start", "开始智能组卷分析...")
-            session = get_session(app)
             
             # 1. Fetch Metadata
             _job_event(job_id, "meta_fetch", "正在获取基础数据...")
-            
+            ch = _table("textbook_chapter")
+            dicts = get_dict_cache(app)
+            types = dicts.items("question_types")
+            diffs = dicts.items("difficulties")
+            # 基础数据读完即归还连接，AI 分析期间不占用连接
+            with session_scope(app) as session:
+                chapters = session.execute(select(ch.c.chapter_id, ch.c.chapter_name).where(ch.c.textbook_id == textbook_id)).all()
+
             # Types
-            qtd = _table("question_type_dict")
-            types = session.execute(select(qtd.c.type_id, qtd.c.type_name)).all()
-            type_info = ", ".join([f"{t.type_name}(ID={t.type_id})" for t in types])
+            type_info = ", ".join([f"{t['type_name']}(ID={t['type_id']})" for t in types])
 
             # Difficulties
-            qdd = _table("question_difficulty_dict")
-            diffs = session.execute(select(qdd.c.difficulty_id, qdd.c.difficulty_name)).all()
-            diff_info = ", ".join([f"{d.difficulty_name}(ID={d.difficulty_id})" for d in diffs])
+            diff_info = ", ".join([f"{d['difficulty_name']}(ID={d['difficulty_id']})" for d in diffs])
 
             # Chapters
-            ch = _table("textbook_chapter")
-            chapters = session.execute(select(ch.c.chapter_id, ch.c.chapter_name).where(ch.c.textbook_id == textbook_id)).all()
             chapter_info = "\n".join([f"- {c.chapter_name} (ID={c.chapter_id})" for c in chapters])
 
             # 2. AI Analysis
@@ -1546,6 +1526,11 @@ def _do_smart_paper_job(app, job_id, subject_id, textbook_id, description):
             
             # Pre-fetch all chapters if needed for filtering
             all_chapter_ids = [c.chapter_id for c in chapters]
+            used_ids: set[int] = set()
+            weight = None
+            if exposure_alpha > 0:
+                with session_scope(app) as session:
+                    weight = exposure_weight(exposed_counts(app, session), exposure_alpha)
 
             for section in plan.get("sections", []):
                 type_id = section.get("type_id")
@@ -1568,37 +1553,62 @@ def _do_smart_paper_job(app, job_id, subject_id, textbook_id, description):
                 if diff_id:
                     conditions.append(qb.c.difficulty_id == diff_id)
                 
+                scope: tuple = tuple(sorted(all_chapter_ids))
                 if c_ids:
                     # Validate chapter IDs
                     valid_cids = [cid for cid in c_ids if cid in all_chapter_ids]
                     if valid_cids:
-                         conditions.append(qb.c.chapter_id.in_(valid_cids))
+                         # 选中父章节时包含其全部子章节
+                         with session_scope(app) as session:
+                             conditions.append(subtree_condition(app, session, qb.c.chapter_id, valid_cids))
+                         scope = ("subtree",) + tuple(sorted(valid_cids))
                     else:
                          conditions.append(qb.c.chapter_id.in_(all_chapter_ids))
                 else:
                     conditions.append(qb.c.chapter_id.in_(all_chapter_ids))
 
-                if keywords:
-                    keyword_conditions = [qb.c.question_content.like(f"%{k}%") for k in keywords]
-                    if keyword_conditions:
-                        conditions.append(or_(*keyword_conditions))
-
-                stmt = select(
-                    qb.c.question_id, 
-                    qb.c.question_content, 
-                    qb.c.question_answer, 
-                    qb.c.question_analysis,
-                    qb.c.type_id,
-                    qb.c.difficulty_id,
-                    qb.c.chapter_id,
-                    qb.c.subject_id
-                ).where(and_(*conditions))
-                
-                # Randomize
-                stmt = stmt.order_by(func.random()).limit(count)
-                
-                rows = session.execute(stmt).mappings().all()
-                
+                keywords = [str(k) for k in keywords if str(k).strip()] if isinstance(keywords, list) else []
+
+                with session_scope(app) as session:
+                    chosen = []
+                    if keywords:
+                        # 有关键词时按相关度取最切题的题目（题干/解析词频，章节名命中加权），不足再随机补足
+                        boost_ids = [c.chapter_id for c in chapters if any(k in (c.chapter_name or "") for k in keywords)]
+                        ranked = keyword_rank(app, session, qb, conditions, keywords, boost_ids, limit=count + len(used_ids))
+                        chosen = [qid for qid in ranked if qid not in used_ids][:count]
+                    key = ("smart", subject_id, type_id, diff_id, scope)
+                    by_id = {}
+                    stale: set = set()
+                    for _ in range(3):
+                        if len(chosen) < count:
+                            # 先取候选ID（按条件缓存）并在内存中随机抽取，再按ID读取题目；
+                            # 不用 ORDER BY RAND()，那会对整个候选集排序
+                            ids = candidate_ids(app, session, key, select(qb.c.question_id).where(and_(*conditions)))
+                            chosen += sample_ids(ids, count - len(chosen), exclude=used_ids | stale | set(chosen), weight=weight)
+                        todo = [qid for qid in chosen if qid not in by_id]
+                        if not todo:
+                            break
+                        stmt = select(
+                            qb.c.question_id,
+                            qb.c.question_content,
+                            qb.c.question_answer,
+                            qb.c.question_analysis,
+                            qb.c.type_id,
+                            qb.c.difficulty_id,
+                            qb.c.chapter_id,
+                            qb.c.subject_id
+                        ).where(qb.c.question_id.in_(todo), qb.c.review_status == 1)
+                        by_id.update({r["question_id"]: r for r in session.execute(stmt).mappings().all()})
+                        missing = {qid for qid in todo if qid not in by_id}
+                        if not missing:
+                            break
+                        # 其它进程删除或撤销审核的题目：丢弃候选缓存，重新查库后补抽
+                        invalidate(app, key)
+                        stale |= missing
+                        chosen = [qid for qid in chosen if qid not in missing]
+                rows = [by_id[qid] for qid in chosen if qid in by_id]
+                used_ids.update(chosen)
+
                 for row in rows:
                     q = dict(row)
                     q["question_score"] = score # Override score based on plan
@@ -1626,8 +1636,6 @@ def _do_smart_paper_job(app, job_id, subject_id, textbook_id, description):
             traceback.print_exc()
             _job_update(job_id, {"status": "error", "error": str(e)})
             _job_event(job_id, "job_error", str(e))
-        finally:
-             close_session()
 
 
 @ai_bp.post("/verify")
@@ -1657,7 +1665,16 @@ def verify_question():
     try:
         session = get_session(current_app)
         session.execute(update(qb).where(qb.c.question_id == int(question_id)).values(**data))
+        if QUESTION_FIELDS.intersection(data):
+            refresh_snapshots(current_app, session, papers_containing(current_app, session, [int(question_id)]))
+        subject_id = None
+        if "question_content" in data:
+            # fields 不带 subject_id 时，索引按题目已存的科目归类
+            subject_id = session.execute(select(qb.c.subject_id).where(qb.c.question_id == int(question_id))).scalar()
         session.commit()
+        if "question_content" in data:
+            get_near_dup_index(current_app).update(int(question_id), data["question_content"], subject_id)
+            get_similar_index(current_app).update(int(question_id), data["question_content"], subject_id)
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
         get_session(current_app).rollback()
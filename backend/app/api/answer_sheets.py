@@ -8,7 +8,7 @@ from datetime import datetime
 from io import BytesIO
 import tempfile
 from flask import Blueprint, current_app, jsonify, request, send_file
-from sqlalchemy import and_, delete, func, insert, select, update
+from sqlalchemy import delete, func, insert, select, update
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from docx import Document
 from docx.enum.text import WD_ALIGN_PARAGRAPH
@@ -18,7 +18,10 @@ from docx.shared import Pt, Cm, RGBColor, Mm
 from docx.oxml.ns import qn
 from docx.oxml import OxmlElement
 
-from app.db import get_db, get_session
+from app.db import get_session, get_table
+from app.http_cache import conditional_json
+from app.services.bulk_writer import insert_rows, update_rows
+from app.services.paper_snapshot import load_paper
 
 try:
     from docx2pdf import convert as docx2pdf_convert
@@ -32,10 +35,7 @@ answer_sheets_bp = Blueprint("answer_sheets", __name__)
 
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 def _export_base_dir(sub_dir: str | int) -> str:
@@ -408,7 +408,7 @@ def list_styles():
     stmt = stmt.order_by(t.c.type_id.asc(), t.c.is_default.desc(), t.c.style_id.desc())
     try:
         rows = get_session(current_app).execute(stmt).mappings().all()
-        return jsonify({"items": [dict(r) for r in rows]})
+        return conditional_json({"items": [dict(r) for r in rows]})
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
@@ -590,19 +590,16 @@ def update_sheet_items(sheet_id: int):
     rel = _table("sheet_question_relation")
     session = get_session(current_app)
     try:
+        rows = []
         for it in items:
             if not it.get("question_id"):
                 continue
-            data = {}
+            data = {"question_id": int(it["question_id"])}
             for k in ["style_id", "area_sort", "area_score"]:
                 if k in it:
                     data[k] = it.get(k)
-            if data:
-                session.execute(
-                    update(rel)
-                    .where(and_(rel.c.sheet_id == sheet_id, rel.c.question_id == int(it["question_id"])))
-                    .values(**data)
-                )
+            rows.append(data)
+        update_rows(session, rel, "question_id", rows, where=rel.c.sheet_id == sheet_id)
         session.commit()
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
@@ -616,9 +613,6 @@ def create_sheet_from_paper(paper_id: int):
     create_user = payload.get("create_user") or "creator"
     template_config = payload.get("template_config") or "{}"
 
-    paper = _table("exam_paper")
-    pqr = _table("paper_question_relation")
-    qb = _table("question_bank")
     sheet = _table("exam_answer_sheet")
     rel = _table("sheet_question_relation")
     style = _table("answer_area_style")
@@ -627,9 +621,10 @@ def create_sheet_from_paper(paper_id: int):
     now = datetime.now()
 
     try:
-        p = session.execute(select(paper).where(paper.c.paper_id == paper_id)).mappings().first()
-        if p is None:
+        loaded = load_paper(current_app, session, paper_id)
+        if loaded is None:
             return jsonify({"error": {"message": "试卷不存在", "type": "NotFound"}}), 404
+        p, qs, _ = loaded
 
         existing = session.execute(select(sheet).where(sheet.c.paper_id == paper_id)).mappings().first()
         if existing:
@@ -651,31 +646,26 @@ def create_sheet_from_paper(paper_id: int):
             if not sheet_id:
                 raise RuntimeError("创建答题卡失败")
 
-        q_stmt = (
-            select(pqr.c.question_id, pqr.c.question_sort, pqr.c.question_score, qb.c.type_id)
-            .join(qb, qb.c.question_id == pqr.c.question_id)
-            .where(pqr.c.paper_id == paper_id)
-            .order_by(pqr.c.question_sort.asc())
-        )
-        qs = session.execute(q_stmt).mappings().all()
-
         default_styles = {
             int(r["type_id"]): int(r["style_id"])
             for r in session.execute(select(style.c.type_id, style.c.style_id).where(style.c.is_default == 1)).mappings().all()
         }
 
-        for q in qs:
-            type_id = int(q["type_id"])
-            session.execute(
-                insert(rel).values(
-                    sheet_id=sheet_id,
-                    question_id=int(q["question_id"]),
-                    style_id=default_styles.get(type_id),
-                    area_sort=int(q["question_sort"]),
-                    area_score=q["question_score"],
-                    create_time=now,
-                )
-            )
+        insert_rows(
+            session,
+            rel,
+            [
+                {
+                    "sheet_id": sheet_id,
+                    "question_id": int(q["question_id"]),
+                    "style_id": default_styles.get(int(q["type_id"])),
+                    "area_sort": int(q["question_sort"]),
+                    "area_score": q["question_score"],
+                    "create_time": now,
+                }
+                for q in qs
+            ],
+        )
 
         session.commit()
         return jsonify({"sheet_id": sheet_id, "item_count": len(qs)})
@@ -13,16 +13,13 @@ from sqlalchemy import insert, select, update, func
 from sqlalchemy.exc import SQLAlchemyError
 from werkzeug.security import check_password_hash, generate_password_hash
 
-from app.db import get_db, get_session
+from app.db import get_session, get_table
 
 auth_bp = Blueprint("auth", __name__)
 
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 def _serializer() -> URLSafeTimedSerializer:
@@ -2,24 +2,22 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 from flask import Blueprint, current_app, jsonify
-from sqlalchemy import select, func, desc, text
+from sqlalchemy import select, func, text
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.db import get_db, get_session
+from app.db import get_read_session, get_table
+from app.services.dict_cache import get_dict_cache
 
 dashboard_bp = Blueprint("dashboard", __name__)
 
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 @dashboard_bp.get("/stats")
 def get_stats():
-    session = get_session(current_app)
+    session = get_read_session(current_app)
     try:
         u = _table("user")
         s = _table("subject_dict")
@@ -51,7 +49,7 @@ def get_stats():
 @dashboard_bp.get("/trend")
 def get_trend():
     """Get question creation trend for last 30 days"""
-    session = get_session(current_app)
+    session = get_read_session(current_app)
     try:
         q = _table("question_bank")
         p = _table("exam_paper")
@@ -115,25 +113,24 @@ def get_trend():
 @dashboard_bp.get("/distribution")
 def get_distribution():
     """Get question distribution by subject"""
-    session = get_session(current_app)
+    session = get_read_session(current_app)
     try:
         q = _table("question_bank")
-        s = _table("subject_dict")
-        
-        stmt = (
-            select(
-                s.c.subject_name,
-                func.count(q.c.question_id).label("count")
-            )
-            .join(q, q.c.subject_id == s.c.subject_id)
-            .group_by(s.c.subject_name)
-            .order_by(desc("count"))
-        )
-        
+
+        # 只按 subject_id 分组，科目名称从字典缓存补充；字典中不存在的科目不统计
+        stmt = select(q.c.subject_id, func.count(q.c.question_id).label("count")).group_by(q.c.subject_id)
         rows = session.execute(stmt).all()
-        
+
+        dicts = get_dict_cache(current_app)
+        counts: dict[str, int] = {}
+        for subject_id, count in rows:
+            name = dicts.name("subject_name", subject_id)
+            if name is not None:
+                counts[name] = counts.get(name, 0) + int(count)
+        items = sorted(counts.items(), key=lambda x: x[1], reverse=True)
+
         return jsonify({
-            "items": [{"name": r[0], "value": r[1]} for r in rows]
+            "items": [{"name": k, "value": v} for k, v in items]
         })
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
@@ -1,10 +1,15 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import random
 import os
 import uuid
+from collections import Counter
+from collections.abc import Callable, Sequence
+from dataclasses import asdict
 from datetime import datetime
+from typing import Optional
 
 from io import BytesIO
 import tempfile
@@ -12,7 +17,16 @@ from flask import Blueprint, current_app, jsonify, request, send_file
 from sqlalchemy import and_, delete, func, insert, select, update, desc, distinct
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.db import get_db, get_session
+from app.db import get_read_session, get_session, get_table
+from app.http_cache import conditional_json, not_modified
+from app.services.bulk_writer import insert_rows, update_rows
+from app.services.chapter_tree import descendant_ids, subtree_condition
+from app.services.exposure import exposed_counts, exposure_table, exposure_weight, record_papers, release_papers
+from app.services.pagination import fetch_page, parse_page_args
+from app.services.paper_assembly import Candidate, Constraints, SectionSpec, assemble, parse_constraints
+from app.services.paper_selection import get_selection_cache
+from app.services.paper_snapshot import drop_snapshots, load_paper, refresh_snapshots
+from app.services.sampling import candidate_ids, invalidate, sample_ids
 from docx import Document
 from docx.enum.section import WD_SECTION, WD_ORIENT
 from docx.shared import Pt, Cm, RGBColor, Mm
@@ -30,12 +44,15 @@ except ImportError:
 
 papers_bp = Blueprint("papers", __name__)
 
+# 多版本组卷的卷别，同时限制一次最多生成的版本数
+VERSION_LABELS = "ABCDEF"
+
+# 抽中的题目已被删除或撤销审核时，重新查候选并抽题的次数上限
+_PICK_ATTEMPTS = 3
+
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 def _parse_strategy(payload: dict) -> dict:
@@ -58,7 +75,18 @@ def _parse_strategy(payload: dict) -> dict:
         "paper_desc": strategy.get("paper_desc") or "",
         "sections": [],
         "shuffle": bool(strategy.get("shuffle", True)),
+        "constraints": asdict(parse_constraints(strategy["constraints"])) if strategy.get("constraints") else None,
+        "versions": int(strategy.get("versions") or 1),
+        "max_overlap": float(strategy.get("max_overlap") or 0),
+        # 曝光降权指数：抽中概率按 (1 + 已用试卷数)^-exposure_weight 递减，0 为不降权
+        "exposure_weight": float(strategy.get("exposure_weight") or 0),
     }
+    if not 1 <= normalized["versions"] <= len(VERSION_LABELS):
+        raise ValueError(f"strategy.versions 必须在 1~{len(VERSION_LABELS)} 之间")
+    if not 0 <= normalized["max_overlap"] <= 1:
+        raise ValueError("strategy.max_overlap 必须在 0~1 之间（允许重复的题目占比）")
+    if normalized["exposure_weight"] < 0:
+        raise ValueError("strategy.exposure_weight 不能小于 0")
 
     for i, s in enumerate(sections, start=1):
         if not isinstance(s, dict):
@@ -88,62 +116,226 @@ def _parse_strategy(payload: dict) -> dict:
     return normalized
 
 
-def _pick_questions(strategy: dict) -> tuple[list[dict], float]:
-    qb = _table("question_bank")
-    session = get_session(current_app)
-    used: set[int] = set()
-    picked: list[dict] = []
-    total_score = 0.0
+def _section_where(qb, session, strategy: dict, section: dict) -> list:
+    where = [qb.c.review_status == 1, qb.c.subject_id == strategy["subject_id"], qb.c.type_id == section["type_id"]]
+    if section["difficulty_id"] is not None:
+        where.append(qb.c.difficulty_id == section["difficulty_id"])
+    if section["chapter_ids"]:
+        # 选中父章节即包含其全部子章节
+        where.append(subtree_condition(current_app, session, qb.c.chapter_id, section["chapter_ids"]))
+    return where
+
+
+def _pick_key(strategy: dict, section: dict) -> tuple:
+    return ("pick", strategy["subject_id"], section["type_id"], section["difficulty_id"], tuple(sorted(section["chapter_ids"])))
+
+
+def _load_candidates(qb, session, strategy: dict) -> list[list]:
+    """
+    每个部分的候选，所有版本共用这一次查询。无整卷约束时只查题目ID（走 ix_qb_pick 覆盖索引），
+    并按筛选条件缓存到题库下一次写入；有约束时再带上求解需要的分值/难度/章节。
+    """
+    raw = strategy.get("constraints")
+    if not raw:
+        return [
+            candidate_ids(
+                current_app,
+                session,
+                _pick_key(strategy, s),
+                select(qb.c.question_id).where(and_(*_section_where(qb, session, strategy, s))),
+            )
+            for s in strategy["sections"]
+        ]
 
+    exposed: set[int] = set()
+    if raw.get("max_exposure") is not None:
+        if exposure_table(current_app) is not None:
+            exposed = {qid for qid, n in exposed_counts(current_app, session).items() if n >= raw["max_exposure"]}
+        else:
+            # 曝光计数表尚未创建（迁移未执行）时实时统计
+            rel = _table("paper_question_relation")
+            exposed = {
+                int(x)
+                for x in session.execute(
+                    select(rel.c.question_id).group_by(rel.c.question_id).having(func.count() >= raw["max_exposure"])
+                ).scalars()
+            }
+
+    pools = []
     for section in strategy["sections"]:
-        where = [qb.c.review_status == 1, qb.c.subject_id == strategy["subject_id"], qb.c.type_id == section["type_id"]]
-        if section["difficulty_id"] is not None:
-            where.append(qb.c.difficulty_id == section["difficulty_id"])
-        if section["chapter_ids"]:
-            where.append(qb.c.chapter_id.in_(section["chapter_ids"]))
-
-        candidates_stmt = select(
-            qb.c.question_id,
-            qb.c.question_content,
-            qb.c.question_answer,
-            qb.c.question_analysis,
-            qb.c.question_score,
-            qb.c.chapter_id,
-            qb.c.type_id,
-            qb.c.difficulty_id,
-        ).where(and_(*where))
-
-        candidates = session.execute(candidates_stmt).mappings().all()
-        candidates = [dict(c) for c in candidates if int(c["question_id"]) not in used]
-
-        if len(candidates) < section["count"]:
-            raise ValueError(f"{section['name']} 可用题目不足：需要{section['count']}，实际{len(candidates)}")
-
-        chosen = random.sample(candidates, section["count"])
+        cols = [qb.c.question_id, qb.c.difficulty_id, qb.c.chapter_id]
+        if section["score_each"] is None:
+            cols.append(qb.c.question_score)
+        rows = session.execute(select(*cols).where(and_(*_section_where(qb, session, strategy, section)))).mappings().all()
+        pools.append(
+            [
+                Candidate(
+                    question_id=int(r["question_id"]),
+                    score=float(r.get("question_score") or 0),
+                    difficulty_id=r["difficulty_id"],
+                    chapter_id=r["chapter_id"],
+                )
+                for r in rows
+                if int(r["question_id"]) not in exposed
+            ]
+        )
+    return pools
+
+
+def _sample_sections(
+    strategy: dict,
+    pools: list[Sequence[int]],
+    reused: dict[int, tuple[str, ...]],
+    max_reuse: int,
+    label: str,
+    weight: Optional[Callable[[int], float]] = None,
+) -> tuple[list[list[int]], dict]:
+    """
+    无约束时随机抽题：优先抽其它版本没用过的题，不够时再从已用题中补，
+    补入的题使本卷与每个其它版本的重复数都不超过 max_reuse。weight 为曝光降权。
+    """
+    used: set[int] = set()
+    blocked = set(reused)
+    overlap: Counter = Counter()
+    chosen_sections = []
+    for section, pool in zip(strategy["sections"], pools):
+        n = section["count"]
+        chosen = sample_ids(pool, n, exclude=blocked, weight=weight)
+        if len(chosen) < n and not reused:
+            raise ValueError(f"{section['name']} 可用题目不足：需要{n}，实际{len(chosen)}")
+        if len(chosen) < n:
+            old = [x for x in pool if x not in used and x in reused]
+            random.shuffle(old)
+            for qid in old:
+                if len(chosen) >= n:
+                    break
+                if all(overlap[k] < max_reuse for k in reused[qid]):
+                    chosen.append(qid)
+                    overlap.update(reused[qid])
+            if len(chosen) < n:
+                raise ValueError(f"{section['name']} 可用题目不足，无法在与其它版本重复不超过{max_reuse}题的前提下组成{label}卷")
         if strategy.get("shuffle", True):
             random.shuffle(chosen)
+        used.update(chosen)
+        blocked.update(chosen)
+        chosen_sections.append(chosen)
+    return chosen_sections, dict(overlap)
+
+
+def _assemble_sections(
+    strategy: dict,
+    pools: list[list[Candidate]],
+    cover_map: dict,
+    reused: dict[int, tuple[str, ...]],
+    max_reuse: int,
+    label: str,
+    weight: Optional[Callable[[int], float]] = None,
+) -> tuple[list[list[int]], dict, dict]:
+    """带整卷约束时交给 paper_assembly 求解。"""
+    specs = [
+        SectionSpec(name=s["name"], count=s["count"], candidates=pool, score_each=s["score_each"])
+        for s, pool in zip(strategy["sections"], pools)
+    ]
+    result = assemble(specs, Constraints(**strategy["constraints"]), cover_map, reused=reused, max_reuse=max_reuse, weight=weight)
+    if not result.ok:
+        prefix = f"{label}卷" if reused else ""
+        raise ValueError(f"{prefix}无法满足组卷约束：" + "；".join(result.violations))
+
+    chosen_sections = []
+    for chosen in result.sections:
+        ids = [c.question_id for c in chosen]
+        if strategy.get("shuffle", True):
+            random.shuffle(ids)
+        chosen_sections.append(ids)
+    return chosen_sections, result.overlap, {"iterations": result.iterations, "elapsed_ms": round(result.elapsed_ms, 1)}
+
+
+def _pick_papers(strategy: dict) -> list[dict]:
+    """
+    按策略抽题，返回 strategy.versions 份试卷 [{paper_name, questions, total_score, overlap, assembly}]。
+    候选只查一次、抽中后一次性读取全部版本的题目内容，候选集再大也不会把题干、答案、解析整批读进内存。
+    任意两个版本的重复题数不超过 max_overlap × 题数，overlap 为 {前面的卷别: 重复题数}。
+    策略带 constraints 时由约束组卷引擎选题，assembly 为求解统计，否则为空字典。
+    """
+    qb = _table("question_bank")
+    session = get_session(current_app)
+    pools = _load_candidates(qb, session, strategy)
+    versions = strategy.get("versions") or 1
+    max_reuse = int(strategy.get("max_overlap", 0) * sum(s["count"] for s in strategy["sections"]) + 1e-9)
+    alpha = strategy.get("exposure_weight") or 0
+    weight = exposure_weight(exposed_counts(current_app, session), alpha) if alpha > 0 else None
+
+    cover_map: dict[int, tuple[int, ...]] = {}
+    if strategy.get("constraints"):
+        for root in strategy["constraints"]["cover_chapters"]:
+            for cid in descendant_ids(current_app, session, [root]):
+                cover_map[cid] = cover_map.get(cid, ()) + (root,)
+
+    # 其它进程删除或撤销审核的题目不会使本进程的候选缓存失效，抽中后读取时才发现：丢弃缓存、重新查候选后再抽
+    for _ in range(_PICK_ATTEMPTS):
+        drafts = []
+        reused: dict[int, tuple[str, ...]] = {}
+        for v in range(versions):
+            label = VERSION_LABELS[v]
+            report: dict = {}
+            if strategy.get("constraints"):
+                chosen_sections, overlap, report = _assemble_sections(strategy, pools, cover_map, reused, max_reuse, label, weight)
+            else:
+                chosen_sections, overlap = _sample_sections(strategy, pools, reused, max_reuse, label, weight)
+            name = strategy["paper_name"] if versions == 1 else f"{strategy['paper_name']}（{label}卷）"
+            drafts.append((name, chosen_sections, overlap, report))
+            for chosen in chosen_sections:
+                for qid in chosen:
+                    reused[qid] = reused.get(qid, ()) + (label,)
+
+        rows = {}
+        if reused:
+            stmt = select(
+                qb.c.question_id,
+                qb.c.question_content,
+                qb.c.question_answer,
+                qb.c.question_analysis,
+                qb.c.question_score,
+                qb.c.chapter_id,
+                qb.c.type_id,
+                qb.c.difficulty_id,
+            ).where(qb.c.question_id.in_(list(reused)), qb.c.review_status == 1)
+            rows = {int(r["question_id"]): r for r in session.execute(stmt).mappings().all()}
+        stale = {qid for qid in reused if qid not in rows}
+        if not stale:
+            break
+        if not strategy.get("constraints"):
+            for section in strategy["sections"]:
+                invalidate(current_app, _pick_key(strategy, section))
+        pools = _load_candidates(qb, session, strategy)
+    else:
+        raise ValueError("抽中的题目在组卷期间被删除或撤销审核，请重新组卷")
 
-        for c in chosen:
-            qid = int(c["question_id"])
-            used.add(qid)
-            score = section["score_each"] if section["score_each"] is not None else float(c.get("question_score") or 0)
-            total_score += score
-            picked.append(
-                {
-                    "question_id": qid,
-                    "question_sort": len(picked) + 1,
-                    "question_score": score,
-                    "question_content": c.get("question_content"),
-                    "question_answer": c.get("question_answer"),
-                    "question_analysis": c.get("question_analysis"),
-                    "chapter_id": c.get("chapter_id"),
-                    "type_id": c.get("type_id"),
-                    "difficulty_id": c.get("difficulty_id"),
-                    "section_name": section["name"],
-                }
-            )
-
-    return picked, total_score
+    papers = []
+    for name, chosen_sections, overlap, report in drafts:
+        picked: list[dict] = []
+        total_score = 0.0
+        for section, chosen in zip(strategy["sections"], chosen_sections):
+            for qid in chosen:
+                c = rows[qid]
+                score = section["score_each"] if section["score_each"] is not None else float(c.get("question_score") or 0)
+                total_score += score
+                picked.append(
+                    {
+                        "question_id": qid,
+                        "question_sort": len(picked) + 1,
+                        "question_score": score,
+                        "question_content": c.get("question_content"),
+                        "question_answer": c.get("question_answer"),
+                        "question_analysis": c.get("question_analysis"),
+                        "chapter_id": c.get("chapter_id"),
+                        "type_id": c.get("type_id"),
+                        "difficulty_id": c.get("difficulty_id"),
+                        "section_name": section["name"],
+                    }
+                )
+        papers.append({"paper_name": name, "questions": picked, "total_score": total_score, "overlap": overlap, "assembly": report})
+    return papers
 
 
 @papers_bp.post("/generate")
@@ -151,8 +343,38 @@ def generate_preview():
     payload = request.get_json(silent=True) or {}
     try:
         strategy = _parse_strategy(payload)
-        questions, total_score = _pick_questions(strategy)
-        return jsonify({"paper": {"paper_name": strategy["paper_name"], "subject_id": strategy["subject_id"], "total_score": total_score}, "questions": questions, "strategy": strategy})
+        papers = _pick_papers(strategy)
+        first = papers[0]
+        body = {"paper": {"paper_name": first["paper_name"], "subject_id": strategy["subject_id"], "total_score": first["total_score"]}, "questions": first["questions"], "strategy": strategy}
+        if first["assembly"]:
+            body["assembly"] = first["assembly"]
+        if len(papers) > 1:
+            body["versions"] = [
+                {
+                    "paper": {"paper_name": p["paper_name"], "subject_id": strategy["subject_id"], "total_score": p["total_score"]},
+                    "questions": p["questions"],
+                    "overlap": p["overlap"],
+                    **({"assembly": p["assembly"]} if p["assembly"] else {}),
+                }
+                for p in papers
+            ]
+        # 保存时带上 token 即按本次预览结果入库
+        body["token"] = get_selection_cache(current_app).put(
+            {
+                "subject_id": strategy["subject_id"],
+                "paper_desc": strategy["paper_desc"],
+                "papers": [
+                    {
+                        "paper_name": p["paper_name"],
+                        "total_score": p["total_score"],
+                        "overlap": p["overlap"],
+                        "questions": [{k: q[k] for k in ("question_id", "question_sort", "question_score")} for q in p["questions"]],
+                    }
+                    for p in papers
+                ],
+            }
+        )
+        return jsonify(body)
     except Exception as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 400
 
@@ -163,52 +385,88 @@ def generate_and_save():
     creator = payload.get("creator") or "creator"
     exam_duration = payload.get("exam_duration")
     is_closed_book = payload.get("is_closed_book")
-
-    try:
-        strategy = _parse_strategy(payload)
-        questions, total_score = _pick_questions(strategy)
-    except Exception as err:
-        return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 400
+    token = payload.get("token")
+
+    cache = get_selection_cache(current_app)
+    if token:
+        token = str(token)
+        selection = cache.take(token)
+        if selection is None:
+            return jsonify({"error": {"message": "预览已过期，请重新生成", "type": "PreviewExpired"}}), 410
+    else:
+        try:
+            strategy = _parse_strategy(payload)
+            selection = {"subject_id": strategy["subject_id"], "paper_desc": strategy["paper_desc"], "papers": _pick_papers(strategy)}
+        except Exception as err:
+            return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 400
 
     paper = _table("exam_paper")
     rel = _table("paper_question_relation")
+    qb = _table("question_bank")
     session = get_session(current_app)
     now = datetime.now()
 
-    paper_data = {
-        "paper_name": strategy["paper_name"],
-        "subject_id": strategy["subject_id"],
-        "total_score": total_score,
-        "exam_duration": exam_duration,
-        "is_closed_book": is_closed_book,
-        "creator": creator,
-        "review_status": 0,
-        "paper_desc": strategy.get("paper_desc") or "",
-        "create_time": now,
-        "update_time": now,
-    }
-
     try:
-        res = session.execute(insert(paper).values(**paper_data))
-        paper_id = res.inserted_primary_key[0] if res.inserted_primary_key else None
-        if not paper_id:
-            raise RuntimeError("创建试卷失败")
-
-        for q in questions:
-            session.execute(
-                insert(rel).values(
-                    paper_id=paper_id,
-                    question_id=q["question_id"],
-                    question_sort=q["question_sort"],
-                    question_score=q["question_score"],
-                    create_time=now,
-                )
+        # 预览之后题目可能被删除或撤回审核，保存前复查
+        qids = sorted({int(q["question_id"]) for p in selection["papers"] for q in p["questions"]})
+        valid = set()
+        for i in range(0, len(qids), 1000):
+            stmt = select(qb.c.question_id).where(and_(qb.c.question_id.in_(qids[i : i + 1000]), qb.c.review_status == 1))
+            valid.update(int(x) for x in session.execute(stmt).scalars())
+        if len(valid) != len(qids):
+            session.rollback()
+            if token:
+                return jsonify({"error": {"message": "预览中的部分题目已被删除或撤回审核，请重新生成", "type": "PreviewExpired"}}), 410
+            return jsonify({"error": {"message": "部分题目已被删除或撤回审核，请重新生成", "type": "BadRequest"}}), 400
+
+        # 多个版本在同一事务内保存，任一失败全部回滚
+        saved = []
+        for p in selection["papers"]:
+            paper_data = {
+                "paper_name": p["paper_name"],
+                "subject_id": selection["subject_id"],
+                "total_score": p["total_score"],
+                "exam_duration": exam_duration,
+                "is_closed_book": is_closed_book,
+                "creator": creator,
+                "review_status": 0,
+                "paper_desc": selection["paper_desc"],
+                "create_time": now,
+                "update_time": now,
+            }
+            res = session.execute(insert(paper).values(**paper_data))
+            paper_id = res.inserted_primary_key[0] if res.inserted_primary_key else None
+            if not paper_id:
+                raise RuntimeError("创建试卷失败")
+
+            insert_rows(
+                session,
+                rel,
+                [
+                    {
+                        "paper_id": paper_id,
+                        "question_id": q["question_id"],
+                        "question_sort": q["question_sort"],
+                        "question_score": q["question_score"],
+                        "create_time": now,
+                    }
+                    for q in p["questions"]
+                ],
             )
+            record_papers(current_app, session, [q["question_id"] for q in p["questions"]], now)
+            saved.append({"paper_id": paper_id, "paper_name": p["paper_name"], "total_score": p["total_score"], "question_count": len(p["questions"]), "overlap": p["overlap"]})
 
+        refresh_snapshots(current_app, session, [x["paper_id"] for x in saved], now)
         session.commit()
-        return jsonify({"paper_id": paper_id, "total_score": total_score, "question_count": len(questions)})
-    except SQLAlchemyError as err:
+        body = {"paper_id": saved[0]["paper_id"], "total_score": saved[0]["total_score"], "question_count": saved[0]["question_count"]}
+        if len(saved) > 1:
+            body["papers"] = saved
+        return jsonify(body)
+    except Exception as err:
+        # 任何失败（含 SQL 以外的异常）都回滚并放回令牌，用户可以重试
         session.rollback()
+        if token:
+            cache.restore(token, selection)
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
 
@@ -312,16 +570,22 @@ def create_manual_paper():
         if not paper_id:
             raise RuntimeError("创建试卷失败")
 
-        for it in sorted(normalized_items, key=lambda x: x["question_sort"]):
-            session.execute(
-                insert(rel).values(
-                    paper_id=paper_id,
-                    question_id=it["question_id"],
-                    question_sort=it["question_sort"],
-                    question_score=it["question_score"],
-                    create_time=now,
-                )
-            )
+        insert_rows(
+            session,
+            rel,
+            [
+                {
+                    "paper_id": paper_id,
+                    "question_id": it["question_id"],
+                    "question_sort": it["question_sort"],
+                    "question_score": it["question_score"],
+                    "create_time": now,
+                }
+                for it in sorted(normalized_items, key=lambda x: x["question_sort"])
+            ],
+        )
+        record_papers(current_app, session, [it["question_id"] for it in normalized_items], now)
+        refresh_snapshots(current_app, session, [paper_id], now)
 
         session.commit()
         return jsonify({"paper_id": paper_id, "total_score": total_score, "question_count": len(normalized_items)})
@@ -352,6 +616,11 @@ def list_papers():
     publisher = request.args.get("publisher")
     review_status = request.args.get("review_status", type=int)
     include_export_count = request.args.get("include_export_count", type=int) == 1
+    # 不传分页参数时与旧接口一致：最多返回最近 200 份；传 cursor 可继续向后翻页
+    try:
+        page_req = parse_page_args(request.args, default_size=200, max_size=200, total_default=False)
+    except ValueError as err:
+        return jsonify({"error": {"message": str(err), "type": "BadRequest"}}), 400
 
     base_select = [
         paper.c.paper_id,
@@ -404,43 +673,35 @@ def list_papers():
             
         stmt = stmt.where(sub.exists())
 
-    stmt = stmt.order_by(paper.c.paper_id.desc()).limit(200)
     try:
-        rows = get_session(current_app).execute(stmt).mappings().all()
-        return jsonify({"items": [dict(r) for r in rows]})
+        session = get_read_session(current_app)
+        data = {}
+        if page_req.with_total:
+            data["total"] = session.execute(select(func.count()).select_from(stmt.subquery())).scalar_one()
+        rows, next_cursor = fetch_page(session, stmt, paper.c.paper_id, page_req)
+        data.update({"items": rows, "next_cursor": next_cursor})
+        return jsonify(data)
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
 
 @papers_bp.get("/<int:paper_id>")
 def get_paper(paper_id: int):
-    paper = _table("exam_paper")
-    rel = _table("paper_question_relation")
-    qb = _table("question_bank")
     session = get_session(current_app)
     try:
-        p = session.execute(select(paper).where(paper.c.paper_id == paper_id)).mappings().first()
-        if p is None:
+        loaded = load_paper(current_app, session, paper_id)
+        if loaded is None:
             return jsonify({"error": {"message": "试卷不存在", "type": "NotFound"}}), 404
-
-        q_stmt = (
-            select(
-                rel.c.question_sort,
-                rel.c.question_score,
-                qb.c.question_id,
-                qb.c.question_content,
-                qb.c.question_answer,
-                qb.c.question_analysis,
-                qb.c.type_id,
-                qb.c.difficulty_id,
-                qb.c.chapter_id,
-            )
-            .join(qb, qb.c.question_id == rel.c.question_id)
-            .where(rel.c.paper_id == paper_id)
-            .order_by(rel.c.question_sort.asc())
-        )
-        questions = session.execute(q_stmt).mappings().all()
-        return jsonify({"paper": dict(p), "questions": [dict(r) for r in questions]})
+        p, questions, content_hash = loaded
+
+        # 试卷字段的修改都会刷新 update_time，题目部分由快照哈希标识；两者都未变化时不必序列化响应体
+        etag = None
+        if p.get("update_time") is not None:
+            etag = hashlib.sha1(f"{content_hash}:{p['update_time']}".encode("utf-8")).hexdigest()
+            resp = not_modified(etag)
+            if resp is not None:
+                return resp
+        return conditional_json({"paper": p, "questions": questions}, etag=etag)
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
@@ -451,6 +712,8 @@ def delete_paper(paper_id: int):
     rel = _table("paper_question_relation")
     session = get_session(current_app)
     try:
+        release_papers(current_app, session, [paper_id])
+        drop_snapshots(current_app, session, [paper_id])
         session.execute(delete(rel).where(rel.c.paper_id == paper_id))
         session.execute(delete(paper).where(paper.c.paper_id == paper_id))
         session.commit()
@@ -471,6 +734,8 @@ def batch_delete_papers():
     rel = _table("paper_question_relation")
     session = get_session(current_app)
     try:
+        release_papers(current_app, session, ids)
+        drop_snapshots(current_app, session, ids)
         session.execute(delete(rel).where(rel.c.paper_id.in_(ids)))
         session.execute(delete(paper).where(paper.c.paper_id.in_(ids)))
         session.commit()
@@ -509,20 +774,18 @@ def update_paper_questions(paper_id: int):
     rel = _table("paper_question_relation")
     session = get_session(current_app)
     try:
+        rows = []
         for it in items:
             if not it.get("question_id"):
                 continue
-            data = {}
+            data = {"question_id": int(it["question_id"])}
             if "question_sort" in it:
                 data["question_sort"] = int(it["question_sort"])
             if "question_score" in it:
                 data["question_score"] = it["question_score"]
-            if data:
-                session.execute(
-                    update(rel)
-                    .where(and_(rel.c.paper_id == paper_id, rel.c.question_id == int(it["question_id"])))
-                    .values(**data)
-                )
+            rows.append(data)
+        update_rows(session, rel, "question_id", rows, where=rel.c.paper_id == paper_id)
+        refresh_snapshots(current_app, session, [paper_id])
         session.commit()
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
@@ -668,30 +931,13 @@ def export_word(paper_id: int):
     payload_questions = payload.get("questions")
 
     session = get_session(current_app)
-    paper = _table("exam_paper")
-    rel = _table("paper_question_relation")
-    qb = _table("question_bank")
     history = _table("paper_export_history")
 
     try:
-        p = session.execute(select(paper).where(paper.c.paper_id == paper_id)).mappings().first()
-        if p is None:
+        loaded = load_paper(current_app, session, paper_id)
+        if loaded is None:
             return jsonify({"error": {"message": "试卷不存在", "type": "NotFound"}}), 404
-
-        q_stmt = (
-            select(
-                rel.c.question_sort,
-                rel.c.question_score,
-                qb.c.question_id,
-                qb.c.question_content,
-                qb.c.question_answer,
-                qb.c.question_analysis,
-            )
-            .join(qb, qb.c.question_id == rel.c.question_id)
-            .where(rel.c.paper_id == paper_id)
-            .order_by(rel.c.question_sort.asc())
-        )
-        questions = [dict(r) for r in session.execute(q_stmt).mappings().all()]
+        p, questions, _ = loaded
         if isinstance(payload_questions, list) and payload_questions:
             normalized = []
             for idx, q in enumerate(payload_questions):
@@ -759,30 +1005,13 @@ def export_pdf(paper_id: int):
     payload_questions = payload.get("questions")
 
     session = get_session(current_app)
-    paper = _table("exam_paper")
-    rel = _table("paper_question_relation")
-    qb = _table("question_bank")
     history = _table("paper_export_history")
 
     try:
-        p = session.execute(select(paper).where(paper.c.paper_id == paper_id)).mappings().first()
-        if p is None:
+        loaded = load_paper(current_app, session, paper_id)
+        if loaded is None:
             return jsonify({"error": {"message": "试卷不存在", "type": "NotFound"}}), 404
-
-        q_stmt = (
-            select(
-                rel.c.question_sort,
-                rel.c.question_score,
-                qb.c.question_id,
-                qb.c.question_content,
-                qb.c.question_answer,
-                qb.c.question_analysis,
-            )
-            .join(qb, qb.c.question_id == rel.c.question_id)
-            .where(rel.c.paper_id == paper_id)
-            .order_by(rel.c.question_sort.asc())
-        )
-        questions = [dict(r) for r in session.execute(q_stmt).mappings().all()]
+        p, questions, _ = loaded
         if isinstance(payload_questions, list) and payload_questions:
             normalized = []
             for idx, q in enumerate(payload_questions):
@@ -5,10 +5,20 @@ import re
 from decimal import Decimal
 
 from flask import Blueprint, current_app, jsonify, request
-from sqlalchemy import and_, delete, func, insert, or_, select, update
+from sqlalchemy import and_, delete, func, insert, select, update
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.db import get_db, get_session
+from app.db import get_read_session, get_session, get_table
+from app.services.bulk_writer import insert_questions
+from app.services.chapter_tree import descendant_ids, subtree_condition
+from app.services.count_cache import cached_total, cached_value, filter_key
+from app.services.dict_cache import NAME_FIELDS, get_dict_cache
+from app.services.exposure import exposure_of, forget_questions
+from app.services.near_dup import get_near_dup_index
+from app.services.pagination import fetch_page, parse_page_args
+from app.services.paper_snapshot import QUESTION_FIELDS, papers_containing, refresh_snapshots
+from app.services.question_search import keyword_filter
+from app.services.similar_index import get_similar_index
 from docx import Document
 from openpyxl import load_workbook
 
@@ -16,10 +26,7 @@ questions_bp = Blueprint("questions", __name__)
 
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 def _to_jsonable(v):
@@ -61,139 +68,362 @@ def _parse_csv_ints(v: str | None) -> list[int]:
     return []
 
 
-@questions_bp.get("")
-def search_questions():
-    q = request.args.get("q", type=str)
-    subject_id = request.args.get("subject_id", type=int)
-    chapter_ids_str = request.args.get("chapter_id", type=str)
-    ids_str = request.args.get("ids", type=str)
-
-    type_ids_str = request.args.get("type_id", type=str)
-    difficulty_ids_str = request.args.get("difficulty_id", type=str)
-    textbook_id = request.args.get("textbook_id", type=int)
-    author = request.args.get("author", type=str)
-    publisher = request.args.get("publisher", type=str)
-    review_status = request.args.get("review_status", type=int)
-    reviewer = request.args.get("reviewer", type=str)
-
-    page = max(1, request.args.get("page", default=1, type=int))
-    page_size = min(1000, max(1, request.args.get("page_size", default=20, type=int)))
-
-    t = _table("question_bank")
-    ch = _table("textbook_chapter")
-    tb = _table("textbook")
-    sd = _table("subject_dict")
-    qtd = _table("question_type_dict")
-    qdd = _table("question_difficulty_dict")
-
-    from_ = (
-        t.outerjoin(ch, ch.c.chapter_id == t.c.chapter_id)
-        .outerjoin(tb, tb.c.textbook_id == ch.c.textbook_id)
-        .outerjoin(sd, sd.c.subject_id == t.c.subject_id)
-        .outerjoin(qtd, qtd.c.type_id == t.c.type_id)
-        .outerjoin(qdd, qdd.c.difficulty_id == t.c.difficulty_id)
-    )
-
+# 题目列表可返回的字段：名称 -> (来源表, 列名)。来源为 ch/tb 时按需外连接，
+# 来源为 dict 的名称字段不连接字典表，查询后按对应ID从字典缓存补充
+_LIST_FIELDS = {
+    "question_id": ("qb", "question_id"),
+    "subject_id": ("qb", "subject_id"),
+    "chapter_id": ("qb", "chapter_id"),
+    "type_id": ("qb", "type_id"),
+    "difficulty_id": ("qb", "difficulty_id"),
+    "subject_name": ("dict", "subject_id"),
+    "chapter_name": ("ch", "chapter_name"),
+    "type_name": ("dict", "type_id"),
+    "difficulty_name": ("dict", "difficulty_id"),
+    "textbook_id": ("tb", "textbook_id"),
+    "textbook_name": ("tb", "textbook_name"),
+    "author": ("tb", "author"),
+    "publisher": ("tb", "publisher"),
+    "question_content": ("qb", "question_content"),
+    "question_answer": ("qb", "question_answer"),
+    "question_analysis": ("qb", "question_analysis"),
+    "question_score": ("qb", "question_score"),
+    "is_ai_generated": ("qb", "is_ai_generated"),
+    "source_question_ids": ("qb", "source_question_ids"),
+    "reviewer": ("qb", "reviewer"),
+    "review_time": ("qb", "review_time"),
+    "review_status": ("qb", "review_status"),
+    "create_user": ("qb", "create_user"),
+    "create_time": ("qb", "create_time"),
+    "update_time": ("qb", "update_time"),
+    "exposure_count": ("exposure", "paper_count"),
+    "last_used_at": ("exposure", "last_used_at"),
+}
+
+# 预览模式不返回的字段
+_PREVIEW_OMIT = {"question_answer", "question_analysis"}
+
+
+def _parse_fields(value: str | None) -> list[str]:
+    """解析 fields=a,b,c；未传时返回全部字段，question_id 始终返回。未知字段抛出 ValueError。"""
+    if not value:
+        return list(_LIST_FIELDS.keys())
+    names = [x.strip() for x in value.split(",") if x.strip()]
+    unknown = [x for x in names if x not in _LIST_FIELDS]
+    if unknown:
+        raise ValueError(f"未知字段：{','.join(unknown)}")
+    if "question_id" not in names:
+        names.insert(0, "question_id")
+    return list(dict.fromkeys(names))
+
+
+def _question_columns(names: list[str], preview_len: int | None = None):
+    """
+    按字段名生成 select 列，返回 (列, 需要连接的表, 表)。
+    preview_len 不为空时题干在数据库端截断，减少传输与序列化的数据量。
+    """
+    tables = {
+        "qb": _table("question_bank"),
+        "ch": _table("textbook_chapter"),
+        "tb": _table("textbook"),
+    }
+    cols = []
+    selected = set()
+    joins = set()
+    for name in names:
+        src, col = _LIST_FIELDS[name]
+        if src == "exposure":
+            # 曝光计数按本页题目ID另查，由 _question_items 补充
+            continue
+        if src == "dict":
+            # 只取ID列，名称由 _question_items 补充
+            name, src = col, "qb"
+        if name in selected:
+            continue
+        selected.add(name)
+        joins.add(src)
+        expr = tables[src].c[col]
+        if name == "question_content" and preview_len:
+            expr = func.substr(expr, 1, preview_len)
+        cols.append(expr.label(name))
+    return cols, joins, tables
+
+
+def _question_from(tables: dict, joins: set[str]):
+    t = tables["qb"]
+    ch, tb = tables["ch"], tables["tb"]
+    from_ = t
+    if "ch" in joins or "tb" in joins:
+        from_ = from_.outerjoin(ch, ch.c.chapter_id == t.c.chapter_id)
+    if "tb" in joins:
+        from_ = from_.outerjoin(tb, tb.c.textbook_id == ch.c.textbook_id)
+    return from_
+
+
+def _question_items(rows: list[dict], names: list[str]) -> list[dict]:
+    """补充字典名称与曝光计数，去掉仅为补充名称而查询的ID列。"""
+    get_dict_cache(current_app).decorate(rows, [n for n in names if n in NAME_FIELDS])
+    wanted = set(names)
+    exposure = {}
+    if wanted & {"exposure_count", "last_used_at"}:
+        exposure = exposure_of(current_app, get_read_session(current_app), [r["question_id"] for r in rows])
+    items = []
+    for r in rows:
+        item = {k: v for k, v in r.items() if k in wanted}
+        if "question_score" in item:
+            item["question_score"] = _to_jsonable(item["question_score"])
+        count, last_used = exposure.get(int(r["question_id"]), (0, None))
+        if "exposure_count" in wanted:
+            item["exposure_count"] = count
+        if "last_used_at" in wanted:
+            item["last_used_at"] = last_used
+        items.append(item)
+    return items
+
+
+# 可做分面统计的筛选维度
+_FACET_DIMS = ["subject_id", "textbook_id", "chapter_id", "type_id", "difficulty_id", "review_status"]
+
+
+def _eq_or_in(col, values: list[int]):
+    return col == values[0] if len(values) == 1 else col.in_(values)
+
+
+def _question_filters(tables: dict, args, skip_dims=()):
+    """
+    解析题目列表的筛选参数，返回 (where 条件, 需要连接的表, 相关度表达式, 各维度取值)。
+    skip_dims 中的维度不生成 SQL 条件（由调用方自行处理），取值仍在返回的维度字典中。
+    """
+    t = tables["qb"]
+    tb = tables["tb"]
+    q = args.get("q", type=str)
+    ids_str = args.get("ids", type=str)
+    author = args.get("author", type=str)
+    publisher = args.get("publisher", type=str)
+    reviewer = args.get("reviewer", type=str)
+
+    dims: dict[str, list[int]] = {}
+    for name in ["subject_id", "textbook_id", "review_status"]:
+        v = args.get(name, type=int)
+        if v is not None:
+            dims[name] = [v]
+    for name in ["chapter_id", "type_id", "difficulty_id"]:
+        values = _parse_csv_ints(args.get(name, type=str))
+        if values:
+            dims[name] = values
+
+    # chapter_subtree=1：chapter_id 表示“这些章节及其全部子章节”，通过章节闭包表一次连接完成
+    subtree = args.get("chapter_subtree", type=int) == 1 and "chapter_id" in dims
+    if subtree and "chapter_id" in skip_dims:
+        dims["chapter_id"] = descendant_ids(current_app, get_read_session(current_app), dims["chapter_id"])
+
+    joins = set()
     where = []
-    if subject_id is not None:
-        where.append(t.c.subject_id == subject_id)
-    
-    # 新增：处理多选章节
-    if chapter_ids_str:
-        # 尝试逗号分割
-        try:
-            c_ids = [int(x) for x in chapter_ids_str.split(",") if x.strip()]
-            if c_ids:
-                if len(c_ids) == 1:
-                    where.append(t.c.chapter_id == c_ids[0])
-                else:
-                    where.append(t.c.chapter_id.in_(c_ids))
-        except ValueError:
-            pass
+    for name, values in dims.items():
+        if name in skip_dims:
+            continue
+        if name == "textbook_id":
+            where.append(_eq_or_in(tb.c.textbook_id, values))
+            joins.add("tb")
+        elif name == "chapter_id" and subtree:
+            where.append(subtree_condition(current_app, get_read_session(current_app), t.c.chapter_id, values))
+        else:
+            where.append(_eq_or_in(t.c[name], values))
 
     # 新增：处理 IDs 筛选
     if ids_str:
         try:
             ids = [int(x) for x in ids_str.split(",") if x.strip()]
             if ids:
-                if len(ids) == 1:
-                    where.append(t.c.question_id == ids[0])
-                else:
-                    where.append(t.c.question_id.in_(ids))
+                where.append(_eq_or_in(t.c.question_id, ids))
         except ValueError:
             pass
 
-    type_ids = _parse_csv_ints(type_ids_str)
-    if type_ids:
-        if len(type_ids) == 1:
-            where.append(t.c.type_id == type_ids[0])
-        else:
-            where.append(t.c.type_id.in_(type_ids))
-
-    difficulty_ids = _parse_csv_ints(difficulty_ids_str)
-    if difficulty_ids:
-        if len(difficulty_ids) == 1:
-            where.append(t.c.difficulty_id == difficulty_ids[0])
-        else:
-            where.append(t.c.difficulty_id.in_(difficulty_ids))
-
-    if textbook_id is not None:
-        where.append(tb.c.textbook_id == textbook_id)
     if author:
         where.append(tb.c.author.like(f"%{author}%"))
+        joins.add("tb")
     if publisher:
         where.append(tb.c.publisher.like(f"%{publisher}%"))
-    if review_status is not None:
-        where.append(t.c.review_status == review_status)
+        joins.add("tb")
     if reviewer:
         where.append(t.c.reviewer == reviewer)
+    relevance = None
     if q:
-        like = f"%{q}%"
-        where.append(or_(t.c.question_content.like(like), t.c.question_analysis.like(like)))
+        cond, relevance = keyword_filter(current_app, t, q)
+        if cond is not None:
+            where.append(cond)
+    return where, joins, relevance, dims
 
-    stmt = (
-        select(
-            t.c.question_id,
-            t.c.subject_id,
-            t.c.chapter_id,
-            t.c.type_id,
-            t.c.difficulty_id,
-            sd.c.subject_name.label("subject_name"),
-            ch.c.chapter_name.label("chapter_name"),
-            qtd.c.type_name.label("type_name"),
-            qdd.c.difficulty_name.label("difficulty_name"),
-            tb.c.textbook_id.label("textbook_id"),
-            tb.c.textbook_name.label("textbook_name"),
-            tb.c.author.label("author"),
-            tb.c.publisher.label("publisher"),
-            t.c.question_content,
-            t.c.question_answer,
-            t.c.question_analysis,
-            t.c.question_score,
-            t.c.is_ai_generated,
-            t.c.source_question_ids,
-            t.c.reviewer,
-            t.c.review_time,
-            t.c.review_status,
-            t.c.create_user,
-            t.c.create_time,
-            t.c.update_time,
+
+@questions_bp.get("")
+def search_questions():
+    # 有关键词时默认按相关度排序，sort=newest 保持按题目ID倒序
+    sort = request.args.get("sort", default="relevance", type=str)
+    # 预览模式：题干截断为 preview_len 个字符，不返回答案与解析，完整内容走 /batch-detail
+    preview = request.args.get("preview", type=int) == 1
+    preview_len = min(1000, max(10, request.args.get("preview_len", default=120, type=int)))
+
+    try:
+        page_req = parse_page_args(request.args, default_size=20, max_size=1000)
+        names = _parse_fields(request.args.get("fields", type=str))
+    except ValueError as err:
+        return jsonify({"error": {"message": str(err), "type": "BadRequest"}}), 400
+    if preview:
+        names = [n for n in names if n not in _PREVIEW_OMIT]
+
+    cols, joins, tables = _question_columns(names, preview_len if preview else None)
+    t = tables["qb"]
+    where, filter_joins, relevance, _ = _question_filters(tables, request.args)
+
+    # 按相关度排序时无法 seek 分页，游标退化为偏移量；默认按题目ID倒序 seek
+    order_by = None
+    if relevance is not None and sort != "newest":
+        order_by = [relevance.desc(), t.c.question_id.desc()]
+
+    cond = and_(*where) if where else True
+    stmt = select(*cols).select_from(_question_from(tables, joins | filter_joins)).where(cond)
+    # 总数只需要参与筛选的表
+    filter_from = _question_from(tables, filter_joins)
+    count_stmt = select(func.count()).select_from(filter_from).where(cond)
+
+    try:
+        session = get_read_session(current_app)
+        total, estimated = None, False
+        if page_req.with_total:
+            total, estimated = cached_total(
+                current_app,
+                session,
+                filter_key("questions.search", request.args),
+                count_stmt,
+                select(t.c.question_id).select_from(filter_from).where(cond),
+                ["question_bank", "textbook_chapter", "textbook"],
+                mode=request.args.get("total_mode", default="exact", type=str),
+            )
+        rows, next_cursor = fetch_page(session, stmt, t.c.question_id, page_req, order_by=order_by)
+        items = _question_items(rows, names)
+        return jsonify(
+            {
+                "items": items,
+                "total": total,
+                "total_estimated": estimated,
+                "page": page_req.page,
+                "page_size": page_req.page_size,
+                "next_cursor": next_cursor,
+            }
         )
-        .select_from(from_)
+    except SQLAlchemyError as err:
+        return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
+
+
+@questions_bp.get("/facets")
+def question_facets():
+    """
+    题库筛选面板的分面统计，参数与列表接口相同。
+    一次 GROUP BY (subject_id, chapter_id, type_id, difficulty_id, review_status) 取回分组计数，
+    各维度在内存中按“其它维度的筛选条件”过滤后汇总，因此某维度的计数不受自身已选值影响（便于多选）。
+    教材维度通过章节归属换算，不连接教材表。
+    """
+    tables = {
+        "qb": _table("question_bank"),
+        "ch": _table("textbook_chapter"),
+        "tb": _table("textbook"),
+    }
+    t, ch, tb = tables["qb"], tables["ch"], tables["tb"]
+    where, joins, _, dims = _question_filters(tables, request.args, skip_dims=_FACET_DIMS)
+    group_cols = [t.c.subject_id, t.c.chapter_id, t.c.type_id, t.c.difficulty_id, t.c.review_status]
+    stmt = (
+        select(*group_cols, func.count().label("cnt"))
+        .select_from(_question_from(tables, joins))
         .where(and_(*where) if where else True)
-        .order_by(t.c.question_id.desc())
-        .offset((page - 1) * page_size)
-        .limit(page_size)
+        .group_by(*group_cols)
     )
 
-    count_stmt = select(func.count()).select_from(from_).where(and_(*where) if where else True)
+    def compute():
+        session = get_read_session(current_app)
+        groups = session.execute(stmt).all()
+        chapters = {
+            int(r.chapter_id): r
+            for r in session.execute(select(ch.c.chapter_id, ch.c.chapter_name, ch.c.textbook_id)).all()
+        }
+        textbooks = {int(r.textbook_id): r.textbook_name for r in session.execute(select(tb.c.textbook_id, tb.c.textbook_name)).all()}
+
+        selected = {k: set(v) for k, v in dims.items()}
+        counts = {k: {} for k in _FACET_DIMS}
+        total = 0
+        for subject_id, chapter_id, type_id, difficulty_id, review_status, cnt in groups:
+            chapter = chapters.get(int(chapter_id)) if chapter_id is not None else None
+            values = {
+                "subject_id": subject_id,
+                "textbook_id": chapter.textbook_id if chapter is not None else None,
+                "chapter_id": chapter_id,
+                "type_id": type_id,
+                "difficulty_id": difficulty_id,
+                "review_status": review_status,
+            }
+            misses = [k for k, sel in selected.items() if values[k] not in sel]
+            if not misses:
+                total += cnt
+            for dim in _FACET_DIMS:
+                # 只有当前维度自身不满足（或全部满足）时才计入该维度
+                if misses and misses != [dim]:
+                    continue
+                v = values[dim]
+                if v is not None:
+                    counts[dim][v] = counts[dim].get(v, 0) + int(cnt)
+
+        dicts = get_dict_cache(current_app)
+        names = {
+            "subject_id": lambda v: dicts.name("subject_name", v),
+            "type_id": lambda v: dicts.name("type_name", v),
+            "difficulty_id": lambda v: dicts.name("difficulty_name", v),
+            "chapter_id": lambda v: chapters[v].chapter_name if v in chapters else None,
+            "textbook_id": lambda v: textbooks.get(v),
+            "review_status": lambda v: None,
+        }
+        facets = {
+            dim: [
+                {"id": v, "name": names[dim](v), "count": c}
+                for v, c in sorted(counts[dim].items(), key=lambda x: (-x[1], x[0]))
+            ]
+            for dim in _FACET_DIMS
+        }
+        return {"total": total, "facets": facets}
 
     try:
-        session = get_session(current_app)
-        total = session.execute(count_stmt).scalar_one()
-        rows = session.execute(stmt).mappings().all()
-        items = [{k: _to_jsonable(v) for k, v in dict(r).items()} for r in rows]
-        return jsonify({"items": items, "total": total, "page": page, "page_size": page_size})
+        data = cached_value(
+            current_app,
+            filter_key("questions.facets", request.args),
+            ["question_bank", "textbook_chapter", "textbook"],
+            compute,
+        )
+        return jsonify(data)
+    except SQLAlchemyError as err:
+        return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
+
+
+@questions_bp.post("/batch-detail")
+def batch_question_detail():
+    """按ID批量取题目完整内容（列表预览模式的补充），按请求顺序返回，不存在的ID忽略。"""
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get("ids")
+    if not isinstance(ids, list) or not ids:
+        return jsonify({"error": {"message": "ids 必须是非空数组", "type": "BadRequest"}}), 400
+    try:
+        ids = list(dict.fromkeys(int(x) for x in ids))
+        fields = payload.get("fields")
+        names = _parse_fields(",".join(fields) if isinstance(fields, list) else fields)
+    except (TypeError, ValueError) as err:
+        return jsonify({"error": {"message": str(err), "type": "BadRequest"}}), 400
+    if len(ids) > 500:
+        return jsonify({"error": {"message": "ids 最多 500 个", "type": "BadRequest"}}), 400
+
+    cols, joins, tables = _question_columns(names)
+    t = tables["qb"]
+    stmt = select(*cols).select_from(_question_from(tables, joins)).where(t.c.question_id.in_(ids))
+    try:
+        rows = [dict(r) for r in get_read_session(current_app).execute(stmt).mappings().all()]
+        by_id = {int(r["question_id"]): r for r in _question_items(rows, names)}
+        return jsonify({"items": [by_id[i] for i in ids if i in by_id]})
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
@@ -267,6 +497,48 @@ def get_question(question_id: int):
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
 
+@questions_bp.get("/<int:question_id>/similar")
+def similar_questions(question_id: int):
+    """
+    与指定题目相似的已有题目（字符 2-gram TF-IDF 余弦相似度），供审核 AI 生成题时对照。
+    默认只在同科目内查找，all_subjects=1 时不限科目。
+    """
+    k = min(50, max(1, request.args.get("k", default=10, type=int)))
+    all_subjects = request.args.get("all_subjects", type=int) == 1
+    t = _table("question_bank")
+    try:
+        session = get_read_session(current_app)
+        src = session.execute(
+            select(t.c.subject_id, t.c.question_content).where(t.c.question_id == question_id)
+        ).first()
+        if src is None:
+            return jsonify({"error": {"message": "题目不存在", "type": "NotFound"}}), 404
+
+        hits = get_similar_index(current_app).search(
+            src.question_content or "",
+            k=k,
+            subject_id=None if all_subjects else src.subject_id,
+            exclude=[question_id],
+        )
+        if hits is None:
+            # 索引在后台首次构建中
+            return jsonify({"items": [], "building": True})
+        if not hits:
+            return jsonify({"items": []})
+        scores = {h.question_id: h.score for h in hits}
+        names = ["question_id", "subject_name", "chapter_name", "type_name", "difficulty_name", "question_content", "review_status"]
+        cols, joins, tables = _question_columns(names)
+        stmt = select(*cols).select_from(_question_from(tables, joins)).where(tables["qb"].c.question_id.in_(list(scores)))
+        rows = [dict(r) for r in session.execute(stmt).mappings().all()]
+        items = _question_items(rows, names)
+        for it in items:
+            it["score"] = round(scores[it["question_id"]], 4)
+        items.sort(key=lambda x: (-x["score"], x["question_id"]))
+        return jsonify({"items": items})
+    except SQLAlchemyError as err:
+        return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
+
+
 @questions_bp.put("/<int:question_id>")
 def update_question(question_id: int):
     payload = request.get_json(silent=True) or {}
@@ -304,7 +576,16 @@ def update_question(question_id: int):
     try:
         session = get_session(current_app)
         session.execute(update(t).where(t.c.question_id == question_id).values(**data))
+        if QUESTION_FIELDS.intersection(data):
+            refresh_snapshots(current_app, session, papers_containing(current_app, session, [question_id]))
+        subject_id = None
+        if "question_content" in data:
+            # 只改题干时 payload 不带 subject_id，索引按题目已存的科目归类
+            subject_id = session.execute(select(t.c.subject_id).where(t.c.question_id == question_id)).scalar()
         session.commit()
+        if "question_content" in data:
+            get_near_dup_index(current_app).update(question_id, data["question_content"], subject_id)
+            get_similar_index(current_app).update(question_id, data["question_content"], subject_id)
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
         get_session(current_app).rollback()
@@ -317,9 +598,14 @@ def delete_question(question_id: int):
     pqr = _table("paper_question_relation")
     try:
         session = get_session(current_app)
+        paper_ids = papers_containing(current_app, session, [question_id])
         session.execute(delete(pqr).where(pqr.c.question_id == question_id))
         session.execute(delete(t).where(t.c.question_id == question_id))
+        forget_questions(current_app, session, [question_id])
+        refresh_snapshots(current_app, session, paper_ids)
         session.commit()
+        get_near_dup_index(current_app).remove([question_id])
+        get_similar_index(current_app).remove([question_id])
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
         get_session(current_app).rollback()
@@ -337,15 +623,81 @@ def batch_delete_questions():
     pqr = _table("paper_question_relation")
     try:
         session = get_session(current_app)
+        paper_ids = papers_containing(current_app, session, ids)
         session.execute(delete(pqr).where(pqr.c.question_id.in_(ids)))
         session.execute(delete(t).where(t.c.question_id.in_(ids)))
+        forget_questions(current_app, session, ids)
+        refresh_snapshots(current_app, session, paper_ids)
         session.commit()
+        get_near_dup_index(current_app).remove(ids)
+        get_similar_index(current_app).remove(ids)
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
         session.rollback()
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
 
+def _dedup_rows(rows: list[dict], mode: str) -> tuple[list[dict], list[dict]]:
+    """
+    导入前查重。mode=flag 只报告近似重复项，mode=skip 丢弃近似重复项，mode=off 不检查。
+    返回 (待写入的行, 重复项列表)；重复项中 question_id 为 None 表示与同一文件中前面的题目重复。
+    """
+    if mode == "off" or not rows:
+        return rows, []
+    index = get_near_dup_index(current_app)
+    checkers = {}
+    kept = []
+    duplicates = []
+    for i, row in enumerate(rows):
+        subject_id = row.get("subject_id")
+        if subject_id not in checkers:
+            checkers[subject_id] = index.checker(subject_id)
+        hit = checkers[subject_id].check(row.get("question_content") or "")
+        if hit is not None:
+            duplicates.append({"index": i, "question_id": hit.question_id, "similarity": round(hit.similarity, 3)})
+            if mode == "skip":
+                continue
+        kept.append(row)
+    return kept, duplicates
+
+
+def _dedup_mode(value: str | None) -> str:
+    mode = (value or "flag").strip().lower()
+    if mode not in ("flag", "skip", "off"):
+        raise ValueError("dedup 只能是 flag / skip / off")
+    return mode
+
+
+@questions_bp.post("/near-duplicates")
+def find_near_duplicates():
+    """按题干查找题库中的近似重复题（MinHash LSH），用于录入前提示。"""
+    payload = request.get_json(silent=True) or {}
+    content = payload.get("question_content")
+    if not content or not str(content).strip():
+        return jsonify({"error": {"message": "缺少字段: question_content", "type": "BadRequest"}}), 400
+    subject_id = _int_or_none(payload.get("subject_id"))
+    try:
+        threshold = float(payload["threshold"]) if payload.get("threshold") is not None else None
+        limit = min(50, max(1, int(payload.get("limit") or 5)))
+    except (TypeError, ValueError):
+        return jsonify({"error": {"message": "threshold / limit 格式错误", "type": "BadRequest"}}), 400
+
+    t = _table("question_bank")
+    try:
+        hits = get_near_dup_index(current_app).find(str(content), subject_id=subject_id, threshold=threshold, limit=limit)
+        if not hits:
+            return jsonify({"items": []})
+        sims = {h.question_id: h.similarity for h in hits}
+        rows = get_read_session(current_app).execute(
+            select(t.c.question_id, t.c.subject_id, t.c.chapter_id, t.c.question_content).where(t.c.question_id.in_(list(sims)))
+        ).mappings().all()
+        items = [dict(r, similarity=round(sims[r["question_id"]], 3)) for r in rows]
+        items.sort(key=lambda x: (-x["similarity"], x["question_id"]))
+        return jsonify({"items": items})
+    except SQLAlchemyError as err:
+        return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
+
+
 @questions_bp.post("/batch-create")
 def batch_create_questions():
     payload = request.get_json(silent=True) or {}
@@ -353,9 +705,8 @@ def batch_create_questions():
     if not isinstance(items, list) or not items:
         return jsonify({"error": {"message": "items 必须是非空数组", "type": "BadRequest"}}), 400
 
-    t = _table("question_bank")
     session = get_session(current_app)
-    inserted_ids = []
+    rows = []
     
     try:
         for item in items:
@@ -385,10 +736,9 @@ def batch_create_questions():
                 "reviewer": None,
                 "create_user": item.get("create_user") or "import",
             }
-            res = session.execute(insert(t).values(**data))
-            if res.inserted_primary_key:
-                inserted_ids.append(res.inserted_primary_key[0])
-        
+            rows.append(data)
+
+        inserted_ids = insert_questions(session, rows, return_ids=True)
         session.commit()
         return jsonify({"ok": True, "inserted_count": len(inserted_ids), "ids": inserted_ids})
     except SQLAlchemyError as err:
@@ -430,6 +780,10 @@ def import_questions_excel():
     default_type_id = _int_or_none(request.form.get("type_id"))
     default_difficulty_id = _int_or_none(request.form.get("difficulty_id"))
     create_user = request.form.get("create_user") or "import"
+    try:
+        dedup = _dedup_mode(request.form.get("dedup"))
+    except ValueError as err:
+        return jsonify({"error": {"message": str(err), "type": "BadRequest"}}), 400
 
     wb = load_workbook(filename=io.BytesIO(file.read()), data_only=True)
     ws = wb.active
@@ -445,9 +799,8 @@ def import_questions_excel():
                     return v
         return None
 
-    t = _table("question_bank")
     session = get_session(current_app)
-    inserted = 0
+    rows = []
     skipped = 0
 
     try:
@@ -480,11 +833,12 @@ def import_questions_excel():
                 "reviewer": create_user,
                 "create_user": create_user,
             }
-            session.execute(insert(t).values(**data))
-            inserted += 1
+            rows.append(data)
 
+        rows, duplicates = _dedup_rows(rows, dedup)
+        insert_questions(session, rows)
         session.commit()
-        return jsonify({"ok": True, "inserted": inserted, "skipped": skipped})
+        return jsonify({"ok": True, "inserted": len(rows), "skipped": skipped, "duplicates": duplicates})
     except SQLAlchemyError as err:
         session.rollback()
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
@@ -501,6 +855,10 @@ def import_questions_word():
     default_type_id = _int_or_none(request.form.get("type_id"))
     default_difficulty_id = _int_or_none(request.form.get("difficulty_id"))
     create_user = request.form.get("create_user") or "import"
+    try:
+        dedup = _dedup_mode(request.form.get("dedup"))
+    except ValueError as err:
+        return jsonify({"error": {"message": str(err), "type": "BadRequest"}}), 400
 
     doc = Document(io.BytesIO(file.read()))
     paragraphs = [p.text.strip() for p in doc.paragraphs if p.text and p.text.strip()]
@@ -550,9 +908,8 @@ def import_questions_word():
 
     flush()
 
-    t = _table("question_bank")
     session = get_session(current_app)
-    inserted = 0
+    rows = []
     skipped = 0
 
     try:
@@ -580,11 +937,12 @@ def import_questions_word():
                 "reviewer": create_user,
                 "create_user": create_user,
             }
-            session.execute(insert(t).values(**data))
-            inserted += 1
+            rows.append(data)
 
+        rows, duplicates = _dedup_rows(rows, dedup)
+        insert_questions(session, rows)
         session.commit()
-        return jsonify({"ok": True, "inserted": inserted, "skipped": skipped})
+        return jsonify({"ok": True, "inserted": len(rows), "skipped": skipped, "duplicates": duplicates})
     except SQLAlchemyError as err:
         session.rollback()
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
@@ -7,7 +7,9 @@ from flask import Blueprint, current_app, jsonify, request
 from sqlalchemy import delete, insert, select, update
 from sqlalchemy.exc import SQLAlchemyError
 
-from app.db import get_db, get_session
+from app.db import get_read_session, get_session, get_table
+from app.http_cache import conditional_json
+from app.services.chapter_tree import refresh_closure
 from app.services.deepseek import get_deepseek_client
 from openpyxl import load_workbook
 
@@ -15,10 +17,7 @@ textbooks_bp = Blueprint("textbooks", __name__)
 
 
 def _table(name: str):
-    db = get_db(current_app)
-    if name not in db.metadata.tables:
-        db.metadata.reflect(bind=db.engine, only=[name])
-    return db.metadata.tables[name]
+    return get_table(current_app, name)
 
 
 def _build_chapter_tree(rows: list[dict]) -> list[dict]:
@@ -67,8 +66,9 @@ def list_textbooks():
     stmt = stmt.order_by(t.c.textbook_id.desc())
 
     try:
-        rows = get_session(current_app).execute(stmt).mappings().all()
-        return jsonify({"items": [dict(r) for r in rows]})
+        rows = get_read_session(current_app).execute(stmt).mappings().all()
+        # Last-Modified 跟随 ETag（内容哈希）变化，删除教材后也会更新；MAX(update_time) 察觉不到删除
+        return conditional_json({"items": [dict(r) for r in rows]}, changed_key=("textbooks", subject_id))
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
@@ -142,6 +142,7 @@ def delete_textbook(textbook_id: int):
     try:
         session = get_session(current_app)
         session.execute(delete(t).where(t.c.textbook_id == textbook_id))
+        refresh_closure(current_app, session, [textbook_id])
         session.commit()
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
@@ -166,9 +167,9 @@ def list_chapters(textbook_id: int):
         .order_by(ch.c.chapter_sort.asc(), ch.c.chapter_id.asc())
     )
     try:
-        rows = get_session(current_app).execute(stmt).mappings().all()
+        rows = get_read_session(current_app).execute(stmt).mappings().all()
         items = [dict(r) for r in rows]
-        return jsonify({"items": items, "tree": _build_chapter_tree(items)})
+        return conditional_json({"items": items, "tree": _build_chapter_tree(items)})
     except SQLAlchemyError as err:
         return jsonify({"error": {"message": str(err), "type": err.__class__.__name__}}), 500
 
@@ -192,6 +193,7 @@ def create_chapter(textbook_id: int):
     try:
         session = get_session(current_app)
         res = session.execute(insert(ch).values(**data))
+        refresh_closure(current_app, session, [textbook_id])
         session.commit()
         chapter_id = res.inserted_primary_key[0] if res.inserted_primary_key else None
         return jsonify({"chapter_id": chapter_id})
@@ -255,6 +257,7 @@ def import_chapters_excel(textbook_id: int):
             session.execute(insert(ch).values(**data))
             inserted += 1
 
+        refresh_closure(current_app, session, [textbook_id])
         session.commit()
         return jsonify({"ok": True, "inserted": inserted, "skipped": skipped})
     except SQLAlchemyError as err:
@@ -278,6 +281,9 @@ def update_chapter(chapter_id: int):
     try:
         session = get_session(current_app)
         session.execute(update(ch).where(ch.c.chapter_id == chapter_id).values(**data))
+        if "parent_chapter_id" in data:
+            textbook_id = session.execute(select(ch.c.textbook_id).where(ch.c.chapter_id == chapter_id)).scalar_one_or_none()
+            refresh_closure(current_app, session, [textbook_id])
         session.commit()
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
@@ -290,7 +296,9 @@ def delete_chapter(chapter_id: int):
     ch = _table("textbook_chapter")
     try:
         session = get_session(current_app)
+        textbook_id = session.execute(select(ch.c.textbook_id).where(ch.c.chapter_id == chapter_id)).scalar_one_or_none()
         session.execute(delete(ch).where(ch.c.chapter_id == chapter_id))
+        refresh_closure(current_app, session, [textbook_id])
         session.commit()
         return jsonify({"ok": True})
     except SQLAlchemyError as err:
@@ -374,6 +382,8 @@ def generate_chapter_summary(chapter_id: int):
         for i, q in enumerate(questions, start=1):
             user_prompt += f"\n{i}. 题干：{q.get('question_content')}\n   答案：{q.get('question_answer')}\n   解析：{q.get('question_analysis')}\n"
 
+        # 等待模型返回期间不占用连接，写回概要时会重新获取
+        session.close()
         client = get_deepseek_client()
         summary = client.chat(system_prompt=system_prompt, user_prompt=user_prompt, temperature=0.2)
 
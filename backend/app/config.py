@@ -15,8 +15,54 @@ class Config:
     MYSQL_USER = os.getenv("MYSQL_USER", "root")
     MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "201225")
 
+    # 只读从库（可选）：留空 MYSQL_REPLICA_HOST 即全部走主库，其余参数缺省沿用主库配置
+    MYSQL_REPLICA_HOST = os.getenv("MYSQL_REPLICA_HOST", "")
+    MYSQL_REPLICA_PORT = int(os.getenv("MYSQL_REPLICA_PORT") or os.getenv("MYSQL_PORT", "3306"))
+    MYSQL_REPLICA_DB = os.getenv("MYSQL_REPLICA_DB", "")
+    MYSQL_REPLICA_USER = os.getenv("MYSQL_REPLICA_USER", "")
+    MYSQL_REPLICA_PASSWORD = os.getenv("MYSQL_REPLICA_PASSWORD", "")
+    DB_REPLICA_STICKY_SECONDS = float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5"))
+
     SQLALCHEMY_ECHO = os.getenv("SQLALCHEMY_ECHO", "0") == "1"
 
+    # 连接池：AI 后台线程、SSE 长连接与普通请求共用同一个池
+    DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+    DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+    # 表结构快照（默认关闭，需显式开启）：off=每次启动完整反射，verify=按库结构指纹校验快照，trust=直接使用快照。
+    # 快照为 JSON 格式的反射信息，开启后启动时读写 SCHEMA_SNAPSHOT_PATH
+    SCHEMA_SNAPSHOT = os.getenv("SCHEMA_SNAPSHOT", "off")
+    SCHEMA_SNAPSHOT_PATH = os.getenv("SCHEMA_SNAPSHOT_PATH") or os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache", "schema_snapshot.json"))
+
+    # 题目关键词检索：auto=存在 ngram 全文索引时使用 MATCH ... AGAINST，like=始终使用 LIKE
+    QUESTION_SEARCH_BACKEND = os.getenv("QUESTION_SEARCH_BACKEND", "auto")
+
+    # 列表总数缓存：按筛选条件缓存 COUNT 结果，题库写入后失效；total_mode=auto 且估算行数超过阈值时返回估算值
+    COUNT_CACHE_SIZE = int(os.getenv("COUNT_CACHE_SIZE", "512"))
+    COUNT_CACHE_TTL = float(os.getenv("COUNT_CACHE_TTL", "60"))
+    COUNT_ESTIMATE_MIN_ROWS = int(os.getenv("COUNT_ESTIMATE_MIN_ROWS", "50000"))
+
+    # 科目/题型/难度字典的进程内缓存刷新间隔（秒），本进程内的写入立即失效
+    DICT_CACHE_REFRESH_SECONDS = float(os.getenv("DICT_CACHE_REFRESH_SECONDS", "300"))
+
+    # 题干近似重复检测：MinHash 估计的 Jaccard 相似度阈值；其它进程的删改在全量重建（秒）后生效
+    NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.8"))
+    NEAR_DUP_REBUILD_SECONDS = float(os.getenv("NEAR_DUP_REBUILD_SECONDS", "3600"))
+
+    # 相似题检索（字符 2-gram TF-IDF）：全量重建间隔（秒）与增量区上限，到期或超过上限时在后台线程重建
+    SIMILAR_INDEX_REBUILD_SECONDS = float(os.getenv("SIMILAR_INDEX_REBUILD_SECONDS", "3600"))
+    SIMILAR_INDEX_MAX_DELTA = int(os.getenv("SIMILAR_INDEX_MAX_DELTA", "5000"))
+
+    # 组卷预览令牌：预览结果在进程内保留的时长（秒）与条数上限，保存时凭令牌直接入库
+    PAPER_PREVIEW_TTL = float(os.getenv("PAPER_PREVIEW_TTL", "1800"))
+    PAPER_PREVIEW_CACHE_SIZE = int(os.getenv("PAPER_PREVIEW_CACHE_SIZE", "256"))
+
+    # 组卷候选题目ID列表缓存：按筛选条件缓存，题库或章节写入后失效
+    CANDIDATE_CACHE_SIZE = int(os.getenv("CANDIDATE_CACHE_SIZE", "64"))
+    CANDIDATE_CACHE_TTL = float(os.getenv("CANDIDATE_CACHE_TTL", "300"))
+
     DEEPSEEK_API_KEY = os.getenv("DEEPSEEK_API_KEY", "sk-3123383874c042e8a16e8d3e93c80810")
     DEEPSEEK_BASE_URL = os.getenv("DEEPSEEK_BASE_URL", "https://api.deepseek.com")
     DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek-chat")
@@ -1,12 +1,185 @@
 from __future__ import annotations
 
+import threading
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
 from dataclasses import dataclass
+from typing import Optional
 
-from flask import Flask, g
-from sqlalchemy import MetaData, create_engine
+from flask import Flask, g, has_request_context
+from sqlalchemy import MetaData, Table, create_engine, event
 from sqlalchemy.engine import Engine
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+from app.schema_snapshot import load_snapshot, save_snapshot, schema_fingerprint
+
+
+class TableRegistry:
+    """
+    所有蓝图共享的表注册中心。
+    只有反射完成的表才会对外可见，缺失的表在锁内按需反射，避免多线程同时向 MetaData 写入。
+    """
+
+    def __init__(self, engine: Engine, metadata: MetaData, snapshot_path: Optional[str] = None, fingerprint: Optional[str] = None):
+        self.engine = engine
+        self.metadata = metadata
+        self.snapshot_path = snapshot_path
+        self.fingerprint = fingerprint
+        self._lock = threading.Lock()
+        self._tables: dict[str, Table] = dict(metadata.tables)
+
+    def get(self, name: str) -> Table:
+        table = self._tables.get(name)
+        if table is not None:
+            return table
+        with self._lock:
+            table = self._tables.get(name)
+            if table is not None:
+                return table
+            self.metadata.reflect(bind=self.engine, only=[name])
+            self._tables = dict(self.metadata.tables)
+            if self.snapshot_path:
+                save_snapshot(self.snapshot_path, self.metadata, self.fingerprint)
+            return self._tables[name]
+
+    def names(self) -> list[str]:
+        return sorted(self._tables.keys())
+
+
+class PoolMetrics:
+    """连接池借出统计：等待次数/耗时、超时次数、借出峰值。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.checked_out_peak = 0
+
+    def record(self, waited: float, checked_out: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+            if checked_out > self.checked_out_peak:
+                self.checked_out_peak = checked_out
+
+    def record_timeout(self, waited: float) -> None:
+        with self._lock:
+            self.timeouts += 1
+            self.wait_total += waited
+            if waited > self.wait_max:
+                self.wait_max = waited
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            attempts = self.checkouts + self.timeouts
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_avg_ms": round(self.wait_total * 1000 / attempts, 3) if attempts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "checked_out_peak": self.checked_out_peak,
+            }
+
+
+class MeteredQueuePool(QueuePool):
+    """在 QueuePool 借出连接时记录等待时间，engine.dispose() 重建连接池后统计延续。"""
+
+    def __init__(self, *args, metrics: Optional[PoolMetrics] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics or PoolMetrics()
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            conn = super()._do_get()
+        except PoolTimeoutError:
+            self.metrics.record_timeout(time.perf_counter() - start)
+            raise
+        self.metrics.record(time.perf_counter() - start, self.checkedout())
+        return conn
+
+    def recreate(self) -> "MeteredQueuePool":
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+class RecentWriters:
+    """
+    记录最近在主库提交过写操作的用户。
+    从库存在复制延迟，这些用户在 window 秒内的只读查询仍走主库，保证读己之写。
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._lock = threading.Lock()
+        self._last_write: dict[int, float] = {}
+
+    def mark(self, uid: int) -> None:
+        now = time.monotonic()
+        with self._lock:
+            self._last_write[uid] = now
+            if len(self._last_write) > 10000:
+                self._last_write = {k: v for k, v in self._last_write.items() if now - v < self.window}
+
+    def is_recent(self, uid: int) -> bool:
+        with self._lock:
+            ts = self._last_write.get(uid)
+        return ts is not None and time.monotonic() - ts < self.window
+
+
+# 已审核题目集合的版本号：question_bank 的写入除非声明 pending_only 执行选项（只写待审核题目），都同时递增它。
+# 只关心已审核题目的缓存（组卷候选ID）以它代替 question_bank 的版本，AI 批量生成待审核题目时不必失效
+APPROVED_QUESTIONS = "question_bank:approved"
+
+
+class TableVersions:
+    """
+    各表的写入版本号：通过会话写入某表的事务提交后递增。
+    进程内缓存（计数、字典等）以版本号作为失效依据；其它进程的写入由缓存自身的 TTL 兜底。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._versions: dict[str, int] = {}
+
+    def bump(self, names) -> None:
+        with self._lock:
+            for name in names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get(self, *names: str) -> tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(n, 0) for n in names)
+
+
+def _track_table_writes(session_factory: sessionmaker, versions: TableVersions) -> None:
+    @event.listens_for(session_factory, "do_orm_execute")
+    def _record_write(state):
+        if state.is_insert or state.is_update or state.is_delete:
+            table = getattr(state.statement, "table", None)
+            if table is not None:
+                names = state.session.info.setdefault("written_tables", set())
+                names.add(table.name)
+                if table.name == "question_bank" and not state.execution_options.get("pending_only"):
+                    names.add(APPROVED_QUESTIONS)
+
+    @event.listens_for(session_factory, "after_commit")
+    def _bump_versions(session):
+        names = session.info.pop("written_tables", None)
+        if names:
+            versions.bump(names)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def _discard_writes(session):
+        session.info.pop("written_tables", None)
 
 
 @dataclass(frozen=True)
@@ -14,6 +187,11 @@ class DbState:
     engine: Engine
     session_factory: sessionmaker[Session]
     metadata: MetaData
+    tables: TableRegistry
+    replica_engine: Optional[Engine] = None
+    replica_session_factory: Optional[sessionmaker[Session]] = None
+    recent_writers: Optional[RecentWriters] = None
+    table_versions: Optional[TableVersions] = None
 
 
 def build_mysql_url(app: Flask) -> str:
@@ -25,31 +203,167 @@ def build_mysql_url(app: Flask) -> str:
     return f"mysql+pymysql://{user}:{pwd}@{host}:{port}/{db}?charset=utf8mb4"
 
 
-def init_db(app: Flask) -> None:
-    url = build_mysql_url(app)
-    engine = create_engine(url, echo=app.config.get("SQLALCHEMY_ECHO", False), pool_pre_ping=True)
-    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
-    metadata = MetaData()
+def build_replica_url(app: Flask) -> Optional[str]:
+    host = app.config.get("MYSQL_REPLICA_HOST")
+    if not host:
+        return None
+    port = app.config.get("MYSQL_REPLICA_PORT") or app.config["MYSQL_PORT"]
+    db = app.config.get("MYSQL_REPLICA_DB") or app.config["MYSQL_DB"]
+    user = app.config.get("MYSQL_REPLICA_USER") or app.config["MYSQL_USER"]
+    pwd = app.config.get("MYSQL_REPLICA_PASSWORD") or app.config["MYSQL_PASSWORD"]
+    return f"mysql+pymysql://{user}:{pwd}@{host}:{port}/{db}?charset=utf8mb4"
+
+
+def _load_metadata(app: Flask, engine: Engine) -> tuple[MetaData, Optional[str], Optional[str]]:
+    """
+    按 SCHEMA_SNAPSHOT 模式加载表结构：
+    - off：每次启动完整反射（旧行为）
+    - verify：比对库结构指纹，一致则直接使用快照，否则重新反射并覆盖快照
+    - trust：不访问数据库，快照存在即使用
+    返回 (metadata, 快照路径, 指纹)，快照路径为 None 表示不维护快照。
+    """
+    mode = (app.config.get("SCHEMA_SNAPSHOT") or "off").lower()
+    path = app.config.get("SCHEMA_SNAPSHOT_PATH") if mode in ["verify", "trust"] else None
 
+    fingerprint = None
+    if path:
+        fingerprint = schema_fingerprint(engine) if mode == "verify" else None
+        if mode == "verify" and fingerprint is None:
+            path = None
+        else:
+            metadata = load_snapshot(path, fingerprint)
+            if metadata is not None:
+                return metadata, path, fingerprint
+
+    metadata = MetaData()
     try:
         metadata.reflect(bind=engine, views=False)
     except SQLAlchemyError:
-        pass
+        return metadata, None, None
+
+    if path:
+        if mode == "trust":
+            fingerprint = schema_fingerprint(engine)
+        save_snapshot(path, metadata, fingerprint)
+    return metadata, path, fingerprint
+
 
-    app.extensions["db_state"] = DbState(engine=engine, session_factory=session_factory, metadata=metadata)
+def _create_engine(app: Flask, url: str) -> Engine:
+    return create_engine(
+        url,
+        echo=app.config.get("SQLALCHEMY_ECHO", False),
+        pool_pre_ping=True,
+        poolclass=MeteredQueuePool,
+        pool_size=app.config.get("DB_POOL_SIZE", 5),
+        max_overflow=app.config.get("DB_MAX_OVERFLOW", 10),
+        pool_timeout=app.config.get("DB_POOL_TIMEOUT", 30),
+        pool_recycle=app.config.get("DB_POOL_RECYCLE", -1),
+    )
+
+
+def pool_status(engine: Engine) -> dict:
+    pool = engine.pool
+    status = {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "max_overflow": getattr(pool, "_max_overflow", None),
+        "timeout": pool.timeout(),
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.snapshot())
+    return status
+
+
+def init_db(app: Flask) -> None:
+    url = build_mysql_url(app)
+    engine = _create_engine(app, url)
+    session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False, expire_on_commit=False)
+    metadata, snapshot_path, fingerprint = _load_metadata(app, engine)
+    tables = TableRegistry(engine, metadata, snapshot_path=snapshot_path, fingerprint=fingerprint)
+    table_versions = TableVersions()
+    _track_table_writes(session_factory, table_versions)
+
+    replica_engine = None
+    replica_session_factory = None
+    recent_writers = None
+    replica_url = build_replica_url(app)
+    if replica_url:
+        replica_engine = _create_engine(app, replica_url)
+        replica_session_factory = sessionmaker(bind=replica_engine, autoflush=False, autocommit=False, expire_on_commit=False)
+        recent_writers = RecentWriters(float(app.config.get("DB_REPLICA_STICKY_SECONDS", 5)))
+
+        @event.listens_for(session_factory, "after_commit")
+        def _mark_writer(session):
+            if has_request_context():
+                uid = (g.get("auth") or {}).get("uid")
+                if uid:
+                    recent_writers.mark(int(uid))
+
+    app.extensions["db_state"] = DbState(
+        engine=engine,
+        session_factory=session_factory,
+        metadata=metadata,
+        tables=tables,
+        replica_engine=replica_engine,
+        replica_session_factory=replica_session_factory,
+        recent_writers=recent_writers,
+        table_versions=table_versions,
+    )
 
 
 def get_db(app: Flask) -> DbState:
     return app.extensions["db_state"]
 
 
+def get_table(app: Flask, name: str) -> Table:
+    return get_db(app).tables.get(name)
+
+
 def get_session(app: Flask) -> Session:
     if "db_session" not in g:
         g.db_session = get_db(app).session_factory()
     return g.db_session
 
 
-def close_session(err=None) -> None:
-    session = g.pop("db_session", None)
-    if session is not None:
+@contextmanager
+def session_scope(app: Flask) -> Iterator[Session]:
+    """
+    后台任务使用的短事务：退出时提交并立即归还连接，异常时回滚。
+    不依赖请求上下文，适合在等待模型返回等长耗时操作之间分段访问数据库。
+    """
+    session = get_db(app).session_factory()
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
         session.close()
+
+
+def get_read_session(app: Flask) -> Session:
+    """
+    只读接口使用的会话。未配置从库时与 get_session 相同；以下情况仍走主库：
+    - 本次请求已打开主库会话（可能刚写入，需读到自己的修改）
+    - 当前用户在 DB_REPLICA_STICKY_SECONDS 内提交过写操作
+    """
+    db = get_db(app)
+    if db.replica_session_factory is None or "db_session" in g:
+        return get_session(app)
+    uid = (g.get("auth") or {}).get("uid")
+    if uid and db.recent_writers is not None and db.recent_writers.is_recent(int(uid)):
+        return get_session(app)
+    if "db_read_session" not in g:
+        g.db_read_session = db.replica_session_factory()
+    return g.db_read_session
+
+
+def close_session(err=None) -> None:
+    for key in ["db_session", "db_read_session"]:
+        session = g.pop(key, None)
+        if session is not None:
+            session.close()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from flask import Response, current_app, request
+
+# 浏览器可以缓存，但每次使用前都要带 If-None-Match 回源校验；响应与登录用户相关，禁止共享缓存
+CACHE_CONTROL = "private, no-cache"
+
+
+def not_modified(etag: str, last_modified: Optional[datetime] = None) -> Optional[Response]:
+    """
+    在生成响应体之前做条件请求判断：ETag（或 Last-Modified）未变化时直接返回 304，否则返回 None。
+    适用于不查询数据即可得到版本号的场景（如字典缓存的内容哈希）。
+    """
+    resp = current_app.response_class(status=200)
+    resp.set_etag(etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = CACHE_CONTROL
+    resp.make_conditional(request)
+    return resp if resp.status_code == 304 else None
+
+
+class _ChangeClock:
+    """
+    记录每个资源的 ETag 最近一次变化的时间，作为 Last-Modified。
+    行被删除时 MAX(update_time) 不会变，但响应体与 ETag 会变，按 ETag 变化计时才能让只带 If-Modified-Since 的请求拿到新数据。
+    时间取整到秒并严格递增（HTTP 日期只精确到秒）；进程内首次见到某资源时记为当前时间，只会多回一次 200，不会误回 304。
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: dict = {}
+
+    def since(self, key, etag: str) -> datetime:
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] == etag:
+                return item[1]
+            now = datetime.now(timezone.utc).replace(microsecond=0) + timedelta(seconds=1)
+            if item is not None and now <= item[1]:
+                now = item[1] + timedelta(seconds=1)
+            if item is None and len(self._data) >= self.maxsize:
+                self._data.pop(next(iter(self._data)))
+            self._data[key] = (etag, now)
+            return now
+
+
+_change_clock = _ChangeClock()
+
+
+def conditional_json(
+    payload, etag: Optional[str] = None, last_modified: Optional[datetime] = None, changed_key=None
+) -> Response:
+    """
+    序列化 JSON 并附带 ETag / Last-Modified，命中 If-None-Match / If-Modified-Since 时返回 304。
+    未给出 etag 时使用响应体的内容哈希，JSON 只序列化一次。
+    给出 changed_key（资源标识，如列表的筛选条件）时，Last-Modified 取该资源 ETag 最近一次变化的时间。
+    """
+    body = current_app.json.dumps(payload)
+    resp = current_app.response_class(body + "\n", mimetype="application/json")
+    etag = etag or hashlib.sha1(body.encode("utf-8")).hexdigest()
+    resp.set_etag(etag)
+    if changed_key is not None:
+        last_modified = _change_clock.since(changed_key, etag)
+    if last_modified is not None:
+        resp.last_modified = last_modified
+    resp.headers["Cache-Control"] = CACHE_CONTROL
+    return resp.make_conditional(request)
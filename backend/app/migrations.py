@@ -0,0 +1,326 @@
+"""
+数据库结构迁移与热点查询执行计划检查。
+
+用法（在 backend 目录下）：
+    python -m app.migrations status     # 查看已执行 / 待执行的迁移
+    python -m app.migrations upgrade    # 执行全部待执行迁移
+    python -m app.migrations check      # 对热点查询执行 EXPLAIN，出现全表扫描时以退出码 1 结束
+
+执行计划与数据分布有关，check 应在数据量接近线上的库上运行。
+"""
+from __future__ import annotations
+
+import sys
+from collections.abc import Callable
+from dataclasses import dataclass
+from datetime import datetime
+
+from flask import Flask
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, Text, and_, func, inspect, insert, select
+from sqlalchemy.dialects.mysql import LONGTEXT
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import InvalidRequestError, NoSuchTableError
+
+from app.db import get_db, get_table
+from app.services.chapter_tree import CLOSURE_TABLE, compute_closure
+from app.services.exposure import EXPOSURE_TABLE
+from app.services.paper_snapshot import SNAPSHOT_TABLE, encode, fetch_questions
+from app.services.question_search import FULLTEXT_COLUMNS, FULLTEXT_INDEX
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String(128), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    upgrade: Callable[[Connection], None]
+
+
+def _reflect(conn: Connection, name: str) -> Table:
+    return Table(name, MetaData(), autoload_with=conn)
+
+
+def create_index(conn: Connection, table: str, name: str, columns: list[str], **kw) -> bool:
+    """索引不存在时创建，已存在则跳过（兼容手工建过同名索引的库）。返回是否新建。"""
+    if name in {ix["name"] for ix in inspect(conn).get_indexes(table)}:
+        return False
+    t = _reflect(conn, table)
+    Index(name, *[t.c[c] for c in columns], **kw).create(conn)
+    return True
+
+
+def _v1_hot_query_indexes(conn: Connection) -> None:
+    # 组卷候选：review_status / subject_id / type_id 为等值条件，difficulty_id 可选，chapter_id 为 IN 列表
+    create_index(conn, "question_bank", "ix_qb_pick", ["review_status", "subject_id", "type_id", "difficulty_id", "chapter_id"])
+    # 待审核列表：review_status = 0 ORDER BY question_id DESC
+    create_index(conn, "question_bank", "ix_qb_review_qid", ["review_status", "question_id"])
+    # 试卷题目按题号读取；按题目反查所在试卷（删除前依赖检查）
+    create_index(conn, "paper_question_relation", "ix_pqr_paper_sort", ["paper_id", "question_sort"])
+    create_index(conn, "paper_question_relation", "ix_pqr_question", ["question_id"])
+    # 导出历史：paper_id = ? ORDER BY created_at DESC
+    create_index(conn, "paper_export_history", "ix_peh_paper_created", ["paper_id", "created_at"])
+
+
+def _v2_question_fulltext(conn: Connection) -> None:
+    # 题干/解析的 ngram 全文索引（MySQL 5.7.6+），中文按 2 字切分；其它数据库检索退回 LIKE
+    if conn.dialect.name != "mysql":
+        return
+    create_index(
+        conn,
+        "question_bank",
+        FULLTEXT_INDEX,
+        FULLTEXT_COLUMNS,
+        mysql_prefix="FULLTEXT",
+        mysql_with_parser="ngram",
+    )
+
+
+def _v3_chapter_closure(conn: Connection) -> None:
+    # 章节闭包表：“某章节及其全部子章节”变为按 ancestor_id 的主键范围查询，由章节接口在写入时按教材重算
+    closure = Table(
+        CLOSURE_TABLE,
+        MetaData(),
+        Column("ancestor_id", Integer, primary_key=True, autoincrement=False),
+        Column("descendant_id", Integer, primary_key=True, autoincrement=False),
+        Column("depth", Integer, nullable=False),
+        Column("textbook_id", Integer, nullable=True),
+        mysql_engine="InnoDB",
+    )
+    closure.create(conn, checkfirst=True)
+    create_index(conn, CLOSURE_TABLE, "ix_tcc_descendant", ["descendant_id", "depth"])
+    create_index(conn, CLOSURE_TABLE, "ix_tcc_textbook", ["textbook_id"])
+
+    ch = _reflect(conn, "textbook_chapter")
+    chapters = conn.execute(select(ch.c.chapter_id, ch.c.textbook_id, ch.c.parent_chapter_id)).all()
+    conn.execute(closure.delete())
+    rows = compute_closure(chapters)
+    for i in range(0, len(rows), 1000):
+        conn.execute(insert(closure), rows[i : i + 1000])
+
+
+def _v4_question_exposure(conn: Connection) -> None:
+    # 题目曝光计数：由试卷的新建/删除在同一事务中增减，组卷时按计数降权或排除，无需实时 COUNT 关联表
+    exposure = Table(
+        EXPOSURE_TABLE,
+        MetaData(),
+        Column("question_id", Integer, primary_key=True, autoincrement=False),
+        Column("paper_count", Integer, nullable=False, server_default="0"),
+        Column("last_used_at", DateTime, nullable=True),
+        mysql_engine="InnoDB",
+    )
+    exposure.create(conn, checkfirst=True)
+    create_index(conn, EXPOSURE_TABLE, "ix_qe_paper_count", ["paper_count"])
+
+    rel = _reflect(conn, "paper_question_relation")
+    paper = _reflect(conn, "exam_paper")
+    rows = conn.execute(
+        select(rel.c.question_id, func.count(), func.max(paper.c.create_time))
+        .select_from(rel.outerjoin(paper, paper.c.paper_id == rel.c.paper_id))
+        .group_by(rel.c.question_id)
+    ).all()
+    conn.execute(exposure.delete())
+    data = [{"question_id": int(qid), "paper_count": int(n), "last_used_at": last} for qid, n, last in rows]
+    for i in range(0, len(data), 1000):
+        conn.execute(insert(exposure), data[i : i + 1000])
+
+
+def _v5_paper_snapshot(conn: Connection) -> None:
+    # 试卷快照：查看 / 导出 / 答题卡等读路径按主键读一行 JSON，不再每次关联题库；由试卷与题目的写接口在同一事务中重建
+    snapshot = Table(
+        SNAPSHOT_TABLE,
+        MetaData(),
+        Column("paper_id", Integer, primary_key=True, autoincrement=False),
+        Column("content_hash", String(40), nullable=False),
+        Column("questions", Text().with_variant(LONGTEXT(), "mysql"), nullable=False),
+        Column("updated_at", DateTime, nullable=False),
+        mysql_engine="InnoDB",
+    )
+    snapshot.create(conn, checkfirst=True)
+
+    rel = _reflect(conn, "paper_question_relation")
+    qb = _reflect(conn, "question_bank")
+    paper = _reflect(conn, "exam_paper")
+    paper_ids = [int(x) for x in conn.execute(select(paper.c.paper_id).order_by(paper.c.paper_id)).scalars()]
+    conn.execute(snapshot.delete())
+    now = datetime.now()
+    for i in range(0, len(paper_ids), 500):
+        chunk = paper_ids[i : i + 500]
+        by_paper = fetch_questions(conn, rel, qb, chunk)
+        rows = []
+        for pid in chunk:
+            body, digest = encode(by_paper.get(pid, []))
+            rows.append({"paper_id": pid, "content_hash": digest, "questions": body, "updated_at": now})
+        conn.execute(insert(snapshot), rows)
+
+
+# 只能追加，不要修改已发布的版本号
+MIGRATIONS: list[Migration] = [
+    Migration(1, "hot_query_indexes", _v1_hot_query_indexes),
+    Migration(2, "question_fulltext", _v2_question_fulltext),
+    Migration(3, "chapter_closure", _v3_chapter_closure),
+    Migration(4, "question_exposure", _v4_question_exposure),
+    Migration(5, "paper_snapshot", _v5_paper_snapshot),
+]
+
+
+def applied_versions(engine: Engine) -> set[int]:
+    with engine.begin() as conn:
+        schema_migrations.create(conn, checkfirst=True)
+        return {int(v) for v in conn.execute(select(schema_migrations.c.version)).scalars()}
+
+
+def pending_migrations(engine: Engine) -> list[Migration]:
+    done = applied_versions(engine)
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m.version) if m.version not in done]
+
+
+def upgrade(engine: Engine) -> list[Migration]:
+    """
+    按版本号依次执行待执行迁移，每个迁移单独一个事务并记录到 schema_migrations。
+    MySQL 的 DDL 会隐式提交，迁移内的步骤都写成可重复执行的形式，中途失败后重跑即可。
+    """
+    applied = []
+    for m in pending_migrations(engine):
+        with engine.begin() as conn:
+            m.upgrade(conn)
+            conn.execute(insert(schema_migrations).values(version=m.version, name=m.name, applied_at=datetime.now()))
+        applied.append(m)
+    return applied
+
+
+@dataclass(frozen=True)
+class HotQuery:
+    name: str
+    table: str
+    build: Callable[[Callable[[str], Table]], object]
+
+
+def _q_pick_questions(t):
+    qb = t("question_bank")
+    return select(qb.c.question_id).where(
+        and_(
+            qb.c.review_status == 1,
+            qb.c.subject_id == 1,
+            qb.c.type_id == 1,
+            qb.c.difficulty_id == 1,
+            qb.c.chapter_id.in_([1, 2, 3]),
+        )
+    )
+
+
+def _q_list_pending(t):
+    qb = t("question_bank")
+    return select(qb.c.question_id).where(qb.c.review_status == 0).order_by(qb.c.question_id.desc()).limit(20)
+
+
+def _q_paper_questions(t):
+    pqr = t("paper_question_relation")
+    return select(pqr.c.question_id, pqr.c.question_score).where(pqr.c.paper_id == 1).order_by(pqr.c.question_sort.asc())
+
+
+def _q_question_papers(t):
+    pqr = t("paper_question_relation")
+    return select(pqr.c.paper_id).where(pqr.c.question_id.in_([1, 2, 3]))
+
+
+def _q_chapter_subtree(t):
+    qb = t("question_bank")
+    closure = t(CLOSURE_TABLE)
+    sub = select(closure.c.descendant_id).where(closure.c.ancestor_id.in_([1]))
+    return select(qb.c.question_id).where(and_(qb.c.review_status == 1, qb.c.subject_id == 1, qb.c.type_id == 1, qb.c.chapter_id.in_(sub)))
+
+
+def _q_export_history(t):
+    h = t("paper_export_history")
+    return select(h).where(h.c.paper_id == 1).order_by(h.c.created_at.desc())
+
+
+HOT_QUERIES: list[HotQuery] = [
+    HotQuery("pick_questions", "question_bank", _q_pick_questions),
+    HotQuery("list_pending", "question_bank", _q_list_pending),
+    HotQuery("paper_questions", "paper_question_relation", _q_paper_questions),
+    HotQuery("question_papers", "paper_question_relation", _q_question_papers),
+    HotQuery("export_history", "paper_export_history", _q_export_history),
+    HotQuery("chapter_subtree", "question_bank", _q_chapter_subtree),
+]
+
+
+def explain(conn: Connection, stmt) -> list[dict]:
+    sql = str(stmt.compile(dialect=conn.dialect, compile_kwargs={"literal_binds": True}))
+    prefix = "EXPLAIN QUERY PLAN " if conn.dialect.name == "sqlite" else "EXPLAIN "
+    return [dict(r) for r in conn.exec_driver_sql(prefix + sql).mappings().all()]
+
+
+def is_full_scan(dialect_name: str, table: str, plan: list[dict]) -> bool:
+    """全表扫描（MySQL type=ALL）与全索引扫描（type=index）都视为退化。"""
+    for row in plan:
+        if dialect_name == "sqlite":
+            if str(row.get("detail") or "").startswith(f"SCAN {table}"):
+                return True
+        elif row.get("table") == table and str(row.get("type") or "").lower() in ["all", "index"]:
+            return True
+    return False
+
+
+def check_hot_queries(app: Flask) -> list[dict]:
+    engine = get_db(app).engine
+    results = []
+    with engine.connect() as conn:
+        for q in HOT_QUERIES:
+            try:
+                stmt = q.build(lambda name: get_table(app, name))
+            except (NoSuchTableError, InvalidRequestError):
+                # 依赖的表由尚未执行的迁移创建
+                results.append({"name": q.name, "table": q.table, "ok": True, "skipped": True, "plan": []})
+                continue
+            plan = explain(conn, stmt)
+            results.append({"name": q.name, "table": q.table, "ok": not is_full_scan(conn.dialect.name, q.table, plan), "plan": plan})
+    return results
+
+
+def main(argv: list[str]) -> int:
+    from app import create_app
+
+    cmd = argv[0] if argv else "status"
+    app = create_app()
+    engine = get_db(app).engine
+
+    if cmd == "status":
+        done = applied_versions(engine)
+        for m in sorted(MIGRATIONS, key=lambda m: m.version):
+            print(f"{m.version:>4}  {'已执行' if m.version in done else '待执行'}  {m.name}")
+        return 0
+
+    if cmd == "upgrade":
+        applied = upgrade(engine)
+        for m in applied:
+            print(f"已执行迁移 {m.version} {m.name}")
+        if not applied:
+            print("没有待执行的迁移")
+        return 0
+
+    if cmd == "check":
+        failed = 0
+        for r in check_hot_queries(app):
+            status = "SKIP" if r.get("skipped") else ("OK" if r["ok"] else "FULL SCAN")
+            print(f"[{status}] {r['name']} ({r['table']})")
+            if not r["ok"]:
+                failed += 1
+                for row in r["plan"]:
+                    print(f"    {row}")
+        return 1 if failed else 0
+
+    print(f"未知命令：{cmd}（可用：status / upgrade / check）")
+    return 2
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,225 @@
+from __future__ import annotations
+
+import hashlib
+import importlib
+import inspect
+import json
+import os
+from datetime import datetime
+from typing import Optional
+
+import sqlalchemy
+from sqlalchemy import Column, DefaultClause, ForeignKeyConstraint, Index, MetaData, PrimaryKeyConstraint, Table, UniqueConstraint, text
+from sqlalchemy import types as sqltypes
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.types import TypeEngine
+
+# 快照格式版本：快照结构变化时递增，旧文件会被自动丢弃并重新生成。
+# 2：由 pickle 改为 JSON（表 / 列 / 主键 / 外键 / 索引的反射信息），读取快照不会执行文件中的任何内容
+SNAPSHOT_FORMAT = 2
+
+_FINGERPRINT_QUERIES = [
+    """
+    SELECT c.TABLE_NAME, c.COLUMN_NAME, c.ORDINAL_POSITION, c.COLUMN_TYPE, c.IS_NULLABLE,
+           c.COLUMN_DEFAULT, c.COLUMN_KEY, c.EXTRA
+    FROM information_schema.COLUMNS c
+    JOIN information_schema.TABLES t ON t.TABLE_SCHEMA = c.TABLE_SCHEMA AND t.TABLE_NAME = c.TABLE_NAME
+    WHERE c.TABLE_SCHEMA = DATABASE() AND t.TABLE_TYPE = 'BASE TABLE'
+    ORDER BY c.TABLE_NAME, c.ORDINAL_POSITION
+    """,
+    """
+    SELECT TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX, COLUMN_NAME, NON_UNIQUE, INDEX_TYPE
+    FROM information_schema.STATISTICS
+    WHERE TABLE_SCHEMA = DATABASE()
+    ORDER BY TABLE_NAME, INDEX_NAME, SEQ_IN_INDEX
+    """,
+    """
+    SELECT TABLE_NAME, CONSTRAINT_NAME, COLUMN_NAME, REFERENCED_TABLE_NAME, REFERENCED_COLUMN_NAME
+    FROM information_schema.KEY_COLUMN_USAGE
+    WHERE TABLE_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME IS NOT NULL
+    ORDER BY TABLE_NAME, CONSTRAINT_NAME, ORDINAL_POSITION
+    """,
+]
+
+
+def schema_fingerprint(engine: Engine) -> Optional[str]:
+    """
+    计算当前库结构指纹（列 / 索引 / 外键），一次连接内完成。
+    非 MySQL 或查询失败时返回 None，调用方应退回到完整反射。
+    """
+    if engine.dialect.name != "mysql":
+        return None
+    h = hashlib.sha256()
+    try:
+        with engine.connect() as conn:
+            for sql in _FINGERPRINT_QUERIES:
+                for row in conn.execute(text(sql)):
+                    h.update(repr(tuple(row)).encode("utf-8"))
+                h.update(b"\x00")
+    except SQLAlchemyError:
+        return None
+    return h.hexdigest()
+
+
+# MySQL 字符串 / 数值类型经 **kw 接收、签名中看不到的选项
+_MYSQL_TYPE_KWARGS = ("charset", "collation", "unsigned", "zerofill", "national", "binary", "ascii", "unicode")
+
+
+def _type_to_json(t: TypeEngine) -> dict:
+    """列类型记为 类名 + 构造参数中的标量值（长度、精度、fsp 等），不含可执行内容。"""
+    cls = type(t)
+    names = [n for n, p in inspect.signature(cls.__init__).parameters.items() if n != "self" and p.kind not in (p.VAR_POSITIONAL, p.VAR_KEYWORD)]
+    kwargs = {}
+    for name in names + [n for n in _MYSQL_TYPE_KWARGS if n not in names]:
+        value = getattr(t, name, None)
+        if isinstance(value, (str, int, float, bool)) or (value is None and name in names):
+            kwargs[name] = value
+    out = {"module": cls.__module__, "name": cls.__name__, "kwargs": kwargs}
+    # ENUM / SET 的取值按位置参数传入
+    values = t.enums if isinstance(t, sqltypes.Enum) else getattr(t, "values", None)
+    if isinstance(values, (list, tuple)):
+        out["args"] = list(values)
+    return out
+
+
+def _type_from_json(data: dict) -> TypeEngine:
+    """只实例化 sqlalchemy 自带的类型类；无法识别时退回 NullType（结果按原样返回）。"""
+    module = data.get("module") or ""
+    if module != "sqlalchemy" and not module.startswith("sqlalchemy."):
+        return sqltypes.NullType()
+    try:
+        cls = getattr(importlib.import_module(module), data["name"])
+        if not (isinstance(cls, type) and issubclass(cls, TypeEngine)):
+            return sqltypes.NullType()
+        return cls(*data.get("args", ()), **data.get("kwargs", {}))
+    except Exception:
+        return sqltypes.NullType()
+
+
+def _table_to_json(table: Table) -> dict:
+    columns = []
+    for c in table.columns:
+        default = c.server_default.arg if isinstance(c.server_default, DefaultClause) else None
+        columns.append(
+            {
+                "name": c.name,
+                "type": _type_to_json(c.type),
+                "nullable": c.nullable,
+                "autoincrement": c.autoincrement,
+                "server_default": getattr(default, "text", default),
+                "comment": c.comment,
+            }
+        )
+    return {
+        "name": table.name,
+        "columns": columns,
+        "primary_key": {"name": table.primary_key.name, "columns": [c.name for c in table.primary_key.columns]},
+        "foreign_keys": [
+            {
+                "name": fk.name,
+                "columns": list(fk.column_keys),
+                "refcolumns": [e.target_fullname for e in fk.elements],
+                "ondelete": fk.ondelete,
+                "onupdate": fk.onupdate,
+            }
+            for fk in table.foreign_key_constraints
+        ],
+        "unique_constraints": [
+            {"name": uc.name, "columns": [c.name for c in uc.columns]} for uc in table.constraints if isinstance(uc, UniqueConstraint)
+        ],
+        "indexes": [
+            {
+                "name": ix.name,
+                "columns": [c.name for c in ix.columns],
+                "unique": bool(ix.unique),
+                "dialect_kwargs": {k: v for k, v in ix.dialect_kwargs.items() if isinstance(v, (str, int, bool))},
+            }
+            for ix in table.indexes
+        ],
+    }
+
+
+def _table_from_json(metadata: MetaData, data: dict) -> Table:
+    args = []
+    for c in data["columns"]:
+        default = c.get("server_default")
+        args.append(
+            Column(
+                c["name"],
+                _type_from_json(c["type"]),
+                nullable=c.get("nullable", True),
+                autoincrement=c.get("autoincrement", "auto"),
+                server_default=text(default) if default is not None else None,
+                comment=c.get("comment"),
+            )
+        )
+    pk = data.get("primary_key") or {}
+    if pk.get("columns"):
+        args.append(PrimaryKeyConstraint(*pk["columns"], name=pk.get("name")))
+    for fk in data.get("foreign_keys", []):
+        args.append(
+            ForeignKeyConstraint(fk["columns"], fk["refcolumns"], name=fk.get("name"), ondelete=fk.get("ondelete"), onupdate=fk.get("onupdate"))
+        )
+    for uc in data.get("unique_constraints", []):
+        args.append(UniqueConstraint(*uc["columns"], name=uc.get("name")))
+    table = Table(data["name"], metadata, *args)
+    for ix in data.get("indexes", []):
+        Index(ix["name"], *[table.c[n] for n in ix["columns"]], unique=ix.get("unique", False), **ix.get("dialect_kwargs", {}))
+    return table
+
+
+def load_snapshot(path: str, fingerprint: Optional[str]) -> Optional[MetaData]:
+    """
+    读取快照（JSON）。格式版本、SQLAlchemy 版本或库结构指纹任一不一致都视为失效。
+    fingerprint 为 None 时不校验指纹（trust 模式）。
+    """
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(data, dict):
+        return None
+    if data.get("format") != SNAPSHOT_FORMAT or data.get("sqlalchemy") != sqlalchemy.__version__:
+        return None
+    if fingerprint is not None and data.get("fingerprint") != fingerprint:
+        return None
+    metadata = MetaData()
+    try:
+        for t in data.get("tables", []):
+            _table_from_json(metadata, t)
+    except Exception:
+        return None
+    return metadata
+
+
+def save_snapshot(path: str, metadata: MetaData, fingerprint: Optional[str]) -> bool:
+    if not path:
+        return False
+    try:
+        data = {
+            "format": SNAPSHOT_FORMAT,
+            "sqlalchemy": sqlalchemy.__version__,
+            "fingerprint": fingerprint,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "tables": [_table_to_json(metadata.tables[name]) for name in sorted(metadata.tables)],
+        }
+    except Exception:
+        return False
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+        return True
+    except Exception:
+        try:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        except OSError:
+            pass
+        return False
@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+from collections.abc import Iterable, Sequence
+from typing import Optional
+
+from flask import current_app
+from sqlalchemy import Table, and_, case, insert, literal, text, update
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import Session
+
+from app.db import get_table
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+def _runs(rows: Sequence[dict]) -> Iterable[list[dict]]:
+    """
+    按列集合把连续的行分组。
+    列集合不同的行不能共用一条多行 VALUES 语句，也不能用 None 补齐（会覆盖服务端默认值）。
+    """
+    run: list[dict] = []
+    keys = None
+    for row in rows:
+        row_keys = frozenset(row.keys())
+        if run and row_keys != keys:
+            yield run
+            run = []
+        keys = row_keys
+        run.append(row)
+    if run:
+        yield run
+
+
+def _autoincrement_step(session: Session) -> Optional[int]:
+    """
+    MySQL 单条多行 INSERT 分得的自增值间隔；不保证连续分配时返回 None。
+    innodb_autoinc_lock_mode 为 0/1 时单条“简单插入”的自增值连续，
+    为 2（MySQL 8 默认）时并发写入的语句交错分配，不能由首行ID推算。
+    """
+    step, mode = session.execute(text("SELECT @@auto_increment_increment, @@innodb_autoinc_lock_mode")).one()
+    if mode is None or int(mode) not in (0, 1):
+        return None
+    return int(step or 1)
+
+
+def insert_rows(
+    session: Session,
+    table: Table,
+    rows: Sequence[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    return_ids: bool = False,
+    options: Optional[dict] = None,
+) -> list[int]:
+    """
+    分块批量写入，每块一次往返。不提交事务，由调用方决定提交时机。
+    options 为附加到每条 INSERT 上的执行选项（如 pending_only）。
+
+    return_ids=False 时使用 executemany（PyMySQL 会把它改写成多行 INSERT）；
+    return_ids=True 时按输入顺序返回自增主键：
+    - 支持 INSERT ... RETURNING 批量返回的方言（SQLite、MariaDB）直接取回
+    - MySQL 在 innodb_autoinc_lock_mode 为 0/1 时每块使用一条多行 INSERT，InnoDB 为其分配连续自增值，
+      由 LAST_INSERT_ID()（首行ID）与 auto_increment_increment 推算出每行ID
+    - 其它情况（含 lock_mode=2，MySQL 8 默认）逐行写入，仍在同一事务中
+    """
+    if not rows:
+        return []
+
+    ids: list[int] = []
+    pk = list(table.primary_key.columns)
+    dialect = session.get_bind().dialect
+    use_returning = return_ids and len(pk) == 1 and dialect.insert_executemany_returning_sort_by_parameter_order
+    step = _autoincrement_step(session) if return_ids and not use_returning and dialect.name == "mysql" else None
+    use_last_id = step is not None
+    stmt = insert(table).execution_options(**options) if options else insert(table)
+
+    for run in _runs(rows):
+        for start in range(0, len(run), chunk_size):
+            chunk = run[start : start + chunk_size]
+            if not return_ids:
+                session.execute(stmt, chunk)
+                continue
+            if use_returning:
+                try:
+                    res = session.execute(stmt.returning(pk[0], sort_by_parameter_order=True), chunk)
+                    ids.extend(int(x) for x in res.scalars().all())
+                    continue
+                except InvalidRequestError:
+                    # 反射得到的主键无法作为排序哨兵列（编译期报错，语句未执行），改用下面的方式
+                    use_returning = False
+            if use_last_id:
+                res = session.execute(stmt.values(chunk))
+                first_id = int(res.lastrowid or 0)
+                if not first_id or res.rowcount != len(chunk):
+                    raise RuntimeError("批量写入未返回自增主键")
+                ids.extend(first_id + i * step for i in range(len(chunk)))
+                continue
+            # 无法可靠推算批量主键（其它方言，或 MySQL lock_mode=2），退回逐行写入
+            for data in chunk:
+                res = session.execute(stmt.values(**data))
+                ids.append(res.inserted_primary_key[0])
+
+    return ids
+
+
+def update_rows(
+    session: Session,
+    table: Table,
+    key: str,
+    rows: Sequence[dict],
+    *,
+    where=None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> int:
+    """
+    按主键批量更新：每块生成一条
+    UPDATE t SET c = CASE key WHEN k1 THEN v1 ... ELSE c END ... WHERE <where> AND key IN (...)
+
+    rows 中每行必须包含 key 列，其余键为要更新的列。同一 key 出现多次时按先后顺序合并，
+    与逐条执行 UPDATE 的结果一致；更新列集合相同的行合并到同一条语句。返回受影响行数。
+    """
+    merged: dict = {}
+    for row in rows:
+        k = row.get(key)
+        if k is None:
+            continue
+        values = {c: v for c, v in row.items() if c != key}
+        if values:
+            merged.setdefault(k, {}).update(values)
+
+    groups: dict[tuple[str, ...], list] = {}
+    for k, values in merged.items():
+        groups.setdefault(tuple(sorted(values.keys())), []).append((k, values))
+
+    key_col = table.c[key]
+    affected = 0
+    for cols, items in groups.items():
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start : start + chunk_size]
+            assignments = {
+                c: case(
+                    {k: literal(values[c], table.c[c].type) for k, values in chunk},
+                    value=key_col,
+                    else_=table.c[c],
+                )
+                for c in cols
+            }
+            cond = key_col.in_([k for k, _ in chunk])
+            if where is not None:
+                cond = and_(where, cond)
+            res = session.execute(update(table).where(cond).values(**assignments))
+            affected += res.rowcount or 0
+    return affected
+
+
+def insert_questions(
+    session: Session,
+    rows: Sequence[dict],
+    *,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    return_ids: bool = False,
+) -> list[int]:
+    """
+    question_bank 的统一批量写入入口，手工录入、Excel/Word 导入与 AI 生成共用。
+    全部为待审核题目（显式给出 review_status 且不为 1）时标记 pending_only，不使组卷候选缓存失效。
+    """
+    qb = get_table(current_app, "question_bank")
+    pending_only = bool(rows) and all(r.get("review_status") is not None and int(r["review_status"]) != 1 for r in rows)
+    options = {"pending_only": True} if pending_only else None
+    return insert_rows(session, qb, rows, chunk_size=chunk_size, return_ids=return_ids, options=options)
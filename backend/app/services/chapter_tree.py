@@ -0,0 +1,154 @@
+from __future__ import annotations
+
+import time
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import Table, delete, select
+from sqlalchemy.exc import InvalidRequestError, NoSuchTableError
+from sqlalchemy.orm import Session
+
+from app.db import get_table
+from app.services.bulk_writer import insert_rows
+
+# 章节闭包表（由 app.migrations 第 3 版创建）：每个章节与其自身及全部祖先各一行，depth 为层级差
+CLOSURE_TABLE = "textbook_chapter_closure"
+
+# 闭包表不存在（迁移未执行）的检测结果缓存时间（秒），执行迁移后无需重启即可生效
+_PROBE_TTL = 300
+
+
+def closure_table(app: Flask) -> Optional[Table]:
+    """返回闭包表；迁移尚未执行时返回 None，调用方退回按 parent_chapter_id 逐层展开。"""
+    missing_at = app.extensions.get("chapter_closure_missing")
+    if missing_at is not None and time.monotonic() - missing_at < _PROBE_TTL:
+        return None
+    try:
+        t = get_table(app, CLOSURE_TABLE)
+    except (NoSuchTableError, InvalidRequestError):
+        app.extensions["chapter_closure_missing"] = time.monotonic()
+        return None
+    app.extensions.pop("chapter_closure_missing", None)
+    return t
+
+
+def compute_closure(chapters) -> list[dict]:
+    """
+    由 (chapter_id, textbook_id, parent_chapter_id) 列表计算闭包行。
+    父章节缺失时该章节视为根；parent 链成环时在回到已访问节点处截断。
+    """
+    parent = {int(cid): (int(pid) if pid else None) for cid, _, pid in chapters}
+    rows = []
+    for cid, textbook_id, _ in chapters:
+        cid = int(cid)
+        node, depth, seen = cid, 0, set()
+        while node is not None and node in parent and node not in seen:
+            seen.add(node)
+            rows.append({"ancestor_id": node, "descendant_id": cid, "depth": depth, "textbook_id": textbook_id})
+            node, depth = parent[node], depth + 1
+    return rows
+
+
+def refresh_closure(app: Flask, session: Session, textbook_ids) -> None:
+    """
+    在调用方的事务中重算指定教材的闭包行。章节的增删改都调用它：单本教材的章节通常只有几十到几百个，
+    整本重算比按移动子树增量维护简单可靠。闭包表不存在时不做任何事。
+    """
+    closure = closure_table(app)
+    ids = sorted({int(x) for x in textbook_ids if x is not None})
+    if closure is None or not ids:
+        return
+    ch = get_table(app, "textbook_chapter")
+    chapters = session.execute(
+        select(ch.c.chapter_id, ch.c.textbook_id, ch.c.parent_chapter_id).where(ch.c.textbook_id.in_(ids))
+    ).all()
+    session.execute(delete(closure).where(closure.c.textbook_id.in_(ids)))
+    insert_rows(session, closure, compute_closure(chapters))
+
+
+def subtree_condition(app: Flask, session: Session, col, chapter_ids: list[int]):
+    """
+    “这些章节及其全部子章节”的筛选条件。
+    有闭包表时为一个走主键的子查询：col IN (SELECT descendant_id FROM closure WHERE ancestor_id IN (...))；
+    否则按 parent_chapter_id 逐层展开成 ID 列表。
+    """
+    closure = closure_table(app)
+    if closure is not None:
+        sub = select(closure.c.descendant_id).where(closure.c.ancestor_id.in_(chapter_ids))
+        return col.in_(sub)
+    return col.in_(descendant_ids(app, session, chapter_ids))
+
+
+def descendant_ids(app: Flask, session: Session, chapter_ids: list[int]) -> list[int]:
+    """章节及其全部子章节的ID（含自身）。"""
+    ids = {int(x) for x in chapter_ids}
+    if not ids:
+        return []
+    closure = closure_table(app)
+    if closure is not None:
+        rows = session.execute(select(closure.c.descendant_id).where(closure.c.ancestor_id.in_(list(ids)))).scalars()
+        return sorted(ids | {int(x) for x in rows})
+
+    ch = get_table(app, "textbook_chapter")
+    frontier = set(ids)
+    while frontier:
+        children = {
+            int(x)
+            for x in session.execute(select(ch.c.chapter_id).where(ch.c.parent_chapter_id.in_(list(frontier)))).scalars()
+        }
+        frontier = children - ids
+        ids |= frontier
+    return sorted(ids)
+
+
+def load_subtrees(app: Flask, session: Session, chapter_ids: list[int], columns: list[str]) -> dict[int, list[dict]]:
+    """
+    读取每个章节的子树：{根章节ID: [子树内章节行, ...]}，行按层级、排序号排列，含根自身。
+    每行带 is_leaf（在子树内没有子章节）。columns 为额外读取的 textbook_chapter 列。
+    """
+    roots = [int(x) for x in chapter_ids]
+    if not roots:
+        return {}
+    ch = get_table(app, "textbook_chapter")
+    cols = [ch.c.chapter_id, ch.c.parent_chapter_id, ch.c.chapter_sort] + [ch.c[c] for c in columns if c not in ("chapter_id", "parent_chapter_id", "chapter_sort")]
+
+    closure = closure_table(app)
+    if closure is not None:
+        stmt = (
+            select(closure.c.ancestor_id, closure.c.depth, *cols)
+            .join(ch, ch.c.chapter_id == closure.c.descendant_id)
+            .where(closure.c.ancestor_id.in_(roots))
+        )
+        pairs = [dict(r) for r in session.execute(stmt).mappings().all()]
+    else:
+        members = {root: descendant_ids(app, session, [root]) for root in roots}
+        all_ids = sorted({cid for ids in members.values() for cid in ids})
+        by_id = {
+            r["chapter_id"]: dict(r)
+            for r in session.execute(select(*cols).where(ch.c.chapter_id.in_(all_ids))).mappings().all()
+        }
+        pairs = []
+        for root, ids in members.items():
+            for cid in ids:
+                if cid in by_id:
+                    pairs.append(dict(by_id[cid], ancestor_id=root, depth=_depth(by_id, root, cid)))
+
+    subtrees: dict[int, list[dict]] = {root: [] for root in roots}
+    for p in pairs:
+        subtrees.setdefault(int(p.pop("ancestor_id")), []).append(p)
+    for root, rows in subtrees.items():
+        parents = {r["parent_chapter_id"] for r in rows}
+        for r in rows:
+            r["is_leaf"] = r["chapter_id"] not in parents
+        rows.sort(key=lambda r: (r["depth"], r.get("chapter_sort") or 0, r["chapter_id"]))
+    return subtrees
+
+
+def _depth(by_id: dict, root: int, cid: int) -> int:
+    depth, node = 0, cid
+    while node != root and depth < len(by_id):
+        node = (by_id.get(node) or {}).get("parent_chapter_id")
+        if node is None:
+            break
+        depth += 1
+    return depth
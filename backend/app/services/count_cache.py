@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db import get_db
+
+# 与分页、排序有关的参数不影响总数，不参与缓存键
+_NON_FILTER_ARGS = {"page", "page_size", "cursor", "with_total", "total_mode", "sort", "fields", "preview", "preview_len", "token"}
+
+
+class CountCache:
+    """
+    列表总数 / 分面统计缓存（LRU + TTL）。
+    键为规范化后的筛选条件，值附带相关表的写入版本号，版本变化即视为失效。
+    """
+
+    def __init__(self, maxsize: int = 512, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: OrderedDict = OrderedDict()
+
+    def get(self, key, versions: tuple):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, item_versions, ts = item
+            if item_versions != versions or time.monotonic() - ts > self.ttl:
+                self._data.pop(key, None)
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, versions: tuple, value) -> None:
+        with self._lock:
+            self._data[key] = (value, versions, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+
+def _get_cache(app: Flask) -> CountCache:
+    cache = app.extensions.get("count_cache")
+    if cache is None:
+        cache = CountCache(
+            maxsize=int(app.config.get("COUNT_CACHE_SIZE", 512)),
+            ttl=float(app.config.get("COUNT_CACHE_TTL", 60)),
+        )
+        app.extensions["count_cache"] = cache
+    return cache
+
+
+def _normalize_value(v: str):
+    parts = [x.strip() for x in str(v).split(",") if x.strip()]
+    if parts and all(x.lstrip("-").isdigit() for x in parts):
+        return tuple(sorted({int(x) for x in parts}))
+    return str(v).strip()
+
+
+def filter_key(scope: str, args) -> tuple:
+    """把查询参数规范化为缓存键：忽略分页参数与空值，逗号分隔的ID列表去重排序。"""
+    items = []
+    for k in sorted(set(args.keys()) - _NON_FILTER_ARGS):
+        v = args.get(k)
+        if v is None or str(v).strip() == "":
+            continue
+        items.append((k, _normalize_value(v)))
+    return (scope, tuple(items))
+
+
+def estimate_count(session: Session, stmt, table: str) -> Optional[int]:
+    """用 EXPLAIN 的行数估计（rows × filtered%）代替 COUNT，仅 MySQL 可用。"""
+    bind = session.get_bind()
+    if bind.dialect.name != "mysql":
+        return None
+    sql = str(stmt.compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True}))
+    try:
+        plan = session.connection().exec_driver_sql("EXPLAIN " + sql).mappings().all()
+    except SQLAlchemyError:
+        return None
+    for row in plan:
+        if row.get("table") == table and row.get("rows") is not None:
+            filtered = float(row.get("filtered") or 100)
+            return int(float(row["rows"]) * filtered / 100)
+    return None
+
+
+def cached_total(
+    app: Flask,
+    session: Session,
+    key: tuple,
+    count_stmt,
+    rows_stmt,
+    tables: list[str],
+    mode: str = "exact",
+) -> tuple[int, bool]:
+    """
+    返回 (总数, 是否为估算值)。
+    mode=auto 时先用执行计划估算，估算值不小于 COUNT_ESTIMATE_MIN_ROWS（筛选条件很宽）则直接返回估算值；
+    其余情况返回精确总数，并按筛选条件缓存到相关表下一次写入为止。
+    """
+    if mode == "auto":
+        estimate = estimate_count(session, rows_stmt, tables[0])
+        if estimate is not None and estimate >= int(app.config.get("COUNT_ESTIMATE_MIN_ROWS", 50000)):
+            return estimate, True
+
+    cache = _get_cache(app)
+    versions = get_db(app).table_versions.get(*tables)
+    total = cache.get(key, versions)
+    if total is None:
+        total = int(session.execute(count_stmt).scalar_one())
+        cache.put(key, versions, total)
+    return total, False
+
+
+def cached_value(app: Flask, key: tuple, tables: list[str], compute):
+    """通用版本：按筛选条件缓存 compute() 的结果，直到相关表下一次写入或 TTL 过期。"""
+    cache = _get_cache(app)
+    versions = get_db(app).table_versions.get(*tables)
+    value = cache.get(key, versions)
+    if value is None:
+        value = compute()
+        cache.put(key, versions, value)
+    return value
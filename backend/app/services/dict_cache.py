@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import threading
+import time
+from dataclasses import dataclass
+
+from flask import Flask
+from sqlalchemy import select
+
+from app.db import get_db, get_table
+
+# 字典名 -> (表名, 主键, 对外返回的列)
+DICTS = {
+    "subjects": (
+        "subject_dict",
+        "subject_id",
+        ["subject_id", "subject_name", "subject_code", "target_grade", "start_semester", "teach_type", "is_enable"],
+    ),
+    "question_types": ("question_type_dict", "type_id", ["type_id", "type_name", "type_code"]),
+    "difficulties": ("question_difficulty_dict", "difficulty_id", ["difficulty_id", "difficulty_name", "difficulty_level"]),
+}
+
+# 列表行补充名称：名称字段 -> (字典名, 行中的ID字段, 字典中的名称列)
+NAME_FIELDS = {
+    "subject_name": ("subjects", "subject_id", "subject_name"),
+    "type_name": ("question_types", "type_id", "type_name"),
+    "difficulty_name": ("difficulties", "difficulty_id", "difficulty_name"),
+}
+
+
+@dataclass(frozen=True)
+class DictSnapshot:
+    items: list[dict]
+    by_id: dict[int, dict]
+    etag: str
+    loaded_at: float
+    table_version: tuple
+
+
+class DictCache:
+    """
+    进程内字典缓存：科目、题型、难度三张小表整表常驻内存。
+    本进程通过会话写入字典表后按表版本号失效；其它进程的修改在 refresh_interval 秒内生效。
+    """
+
+    def __init__(self, app: Flask, refresh_interval: float = 300):
+        self.app = app
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._snapshots: dict[str, DictSnapshot] = {}
+
+    def _fresh(self, snap: DictSnapshot | None, table: str) -> bool:
+        if snap is None:
+            return False
+        if time.monotonic() - snap.loaded_at > self.refresh_interval:
+            return False
+        return snap.table_version == get_db(self.app).table_versions.get(table)
+
+    def _load(self, kind: str) -> DictSnapshot:
+        table_name, key, cols = DICTS[kind]
+        version = get_db(self.app).table_versions.get(table_name)
+        t = get_table(self.app, table_name)
+        with get_db(self.app).engine.connect() as conn:
+            rows = [dict(r) for r in conn.execute(select(*[t.c[c] for c in cols]).order_by(t.c[key])).mappings().all()]
+        etag = hashlib.sha1(json.dumps(rows, sort_keys=True, default=str, ensure_ascii=False).encode("utf-8")).hexdigest()
+        return DictSnapshot(
+            items=rows,
+            by_id={int(r[key]): r for r in rows},
+            etag=etag,
+            loaded_at=time.monotonic(),
+            table_version=version,
+        )
+
+    def get(self, kind: str) -> DictSnapshot:
+        table_name = DICTS[kind][0]
+        snap = self._snapshots.get(kind)
+        if self._fresh(snap, table_name):
+            return snap
+        with self._lock:
+            snap = self._snapshots.get(kind)
+            if not self._fresh(snap, table_name):
+                snap = self._load(kind)
+                self._snapshots[kind] = snap
+            return snap
+
+    def items(self, kind: str) -> list[dict]:
+        return self.get(kind).items
+
+    def name(self, field: str, value) -> str | None:
+        kind, _, name_col = NAME_FIELDS[field]
+        if value is None:
+            return None
+        row = self.get(kind).by_id.get(int(value))
+        return row.get(name_col) if row else None
+
+    def decorate(self, rows: list[dict], fields=None) -> list[dict]:
+        """按行中的 subject_id / type_id / difficulty_id 补充对应名称，替代 SQL 外连接字典表。"""
+        fields = list(fields) if fields is not None else list(NAME_FIELDS.keys())
+        for field in fields:
+            kind, id_field, name_col = NAME_FIELDS[field]
+            by_id = self.get(kind).by_id
+            for r in rows:
+                v = r.get(id_field)
+                d = by_id.get(int(v)) if v is not None else None
+                r[field] = d.get(name_col) if d else None
+        return rows
+
+
+def get_dict_cache(app: Flask) -> DictCache:
+    cache = app.extensions.get("dict_cache")
+    if cache is None:
+        cache = DictCache(app, refresh_interval=float(app.config.get("DICT_CACHE_REFRESH_SECONDS", 300)))
+        app.extensions["dict_cache"] = cache
+    return cache
@@ -0,0 +1,162 @@
+from __future__ import annotations
+
+import time
+from collections import Counter
+from collections.abc import Callable, Iterable
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import Table, case, delete, func, select, update
+from sqlalchemy.exc import InvalidRequestError, NoSuchTableError
+from sqlalchemy.orm import Session
+
+from app.db import get_table
+from app.services.bulk_writer import insert_rows
+from app.services.count_cache import cached_value
+
+# 题目曝光计数表（由 app.migrations 第 4 版创建）：每道题被多少份试卷使用过、最近一次组入试卷的时间
+EXPOSURE_TABLE = "question_exposure"
+
+# 计数表不存在（迁移未执行）的检测结果缓存时间（秒）
+_PROBE_TTL = 300
+
+
+def exposure_table(app: Flask) -> Optional[Table]:
+    """返回曝光计数表；迁移尚未执行时返回 None，计数的维护与读取都跳过。"""
+    missing_at = app.extensions.get("question_exposure_missing")
+    if missing_at is not None and time.monotonic() - missing_at < _PROBE_TTL:
+        return None
+    try:
+        t = get_table(app, EXPOSURE_TABLE)
+    except (NoSuchTableError, InvalidRequestError):
+        app.extensions["question_exposure_missing"] = time.monotonic()
+        return None
+    app.extensions.pop("question_exposure_missing", None)
+    return t
+
+
+def _upsert(session: Session, t: Table, rows: list[dict]) -> bool:
+    """
+    增量为正的行写入 INSERT ... ON DUPLICATE KEY UPDATE（SQLite 为 ON CONFLICT），计数行已存在时累加。
+    并发保存的试卷共用一道首次使用的题目时不会因主键冲突失败。方言不支持时返回 False。
+    """
+    name = session.get_bind().dialect.name
+    if name == "mysql":
+        from sqlalchemy.dialects.mysql import insert as dialect_insert
+
+        stmt = dialect_insert(t)
+        stmt = stmt.on_duplicate_key_update(
+            paper_count=t.c.paper_count + stmt.inserted.paper_count, last_used_at=stmt.inserted.last_used_at
+        )
+    elif name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+
+        stmt = dialect_insert(t)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[t.c.question_id],
+            set_={"paper_count": t.c.paper_count + stmt.excluded.paper_count, "last_used_at": stmt.excluded.last_used_at},
+        )
+    else:
+        return False
+    for i in range(0, len(rows), 500):
+        session.execute(stmt, rows[i : i + 500])
+    return True
+
+
+def _apply(session: Session, t: Table, deltas: Counter, now: Optional[datetime]) -> None:
+    """按 {题目ID: 增量} 更新计数；同一增量的题目合并为一条 UPDATE，增量为正的题目支持时走 upsert。"""
+    deltas = Counter({qid: n for qid, n in deltas.items() if n})
+    if not deltas:
+        return
+    if now is not None:
+        added = [{"question_id": qid, "paper_count": n, "last_used_at": now} for qid, n in deltas.items() if n > 0]
+        if added and _upsert(session, t, added):
+            deltas = Counter({qid: n for qid, n in deltas.items() if n < 0})
+            if not deltas:
+                return
+
+    existing = set()
+    ids = list(deltas)
+    for i in range(0, len(ids), 1000):
+        existing.update(int(x) for x in session.execute(select(t.c.question_id).where(t.c.question_id.in_(ids[i : i + 1000]))).scalars())
+
+    by_delta: dict[int, list[int]] = {}
+    for qid in existing:
+        by_delta.setdefault(deltas[qid], []).append(qid)
+    for n, qids in by_delta.items():
+        # 扣减不低于 0（计数可能是迁移回填前后不一致的旧数据）
+        values = {"paper_count": case((t.c.paper_count + n < 0, 0), else_=t.c.paper_count + n) if n < 0 else t.c.paper_count + n}
+        if n > 0 and now is not None:
+            values["last_used_at"] = now
+        session.execute(update(t).where(t.c.question_id.in_(qids)).values(**values))
+
+    insert_rows(
+        session,
+        t,
+        [{"question_id": qid, "paper_count": n, "last_used_at": now} for qid, n in deltas.items() if qid not in existing and n > 0],
+    )
+
+
+def record_papers(app: Flask, session: Session, question_ids: Iterable[int], now: datetime) -> None:
+    """新建试卷后在同一事务中调用：question_ids 为新试卷中的题目（多份试卷可合并传入，重复出现按次数计）。"""
+    t = exposure_table(app)
+    if t is not None:
+        _apply(session, t, Counter(int(x) for x in question_ids), now)
+
+
+def release_papers(app: Flask, session: Session, paper_ids: Iterable[int]) -> None:
+    """删除试卷前在同一事务中调用（须在删除 paper_question_relation 之前），扣减这些试卷中题目的计数。"""
+    t = exposure_table(app)
+    ids = [int(x) for x in paper_ids]
+    if t is None or not ids:
+        return
+    rel = get_table(app, "paper_question_relation")
+    rows = session.execute(
+        select(rel.c.question_id, func.count()).where(rel.c.paper_id.in_(ids)).group_by(rel.c.question_id)
+    ).all()
+    _apply(session, t, Counter({int(qid): -int(n) for qid, n in rows}), None)
+
+
+def forget_questions(app: Flask, session: Session, question_ids: Iterable[int]) -> None:
+    """删除题目时一并删除其计数行。"""
+    t = exposure_table(app)
+    ids = [int(x) for x in question_ids]
+    if t is not None and ids:
+        session.execute(delete(t).where(t.c.question_id.in_(ids)))
+
+
+def exposure_of(app: Flask, session: Session, question_ids: Iterable[int]) -> dict[int, tuple[int, Optional[datetime]]]:
+    """{题目ID: (使用过的试卷数, 最近使用时间)}，只含有计数行的题目。"""
+    t = exposure_table(app)
+    ids = sorted({int(x) for x in question_ids})
+    if t is None or not ids:
+        return {}
+    out = {}
+    for i in range(0, len(ids), 1000):
+        stmt = select(t.c.question_id, t.c.paper_count, t.c.last_used_at).where(t.c.question_id.in_(ids[i : i + 1000]))
+        out.update({int(qid): (int(n or 0), last) for qid, n, last in session.execute(stmt)})
+    return out
+
+
+def exposed_counts(app: Flask, session: Session) -> dict[int, int]:
+    """全部被使用过的题目的计数 {题目ID: 试卷数}，缓存到计数表下一次写入；组卷加权与曝光上限都用它。"""
+    t = exposure_table(app)
+    if t is None:
+        return {}
+
+    def compute():
+        stmt = select(t.c.question_id, t.c.paper_count).where(t.c.paper_count > 0)
+        return {int(qid): int(n) for qid, n in session.execute(stmt)}
+
+    return cached_value(app, ("exposure.counts",), [EXPOSURE_TABLE], compute)
+
+
+def exposure_weight(counts: dict[int, int], alpha: float) -> Optional[Callable[[int], float]]:
+    """
+    抽题权重 (1 + 试卷数)^-alpha，未使用过的题目权重为 1。alpha 为 0 或没有计数时返回 None（等概率）。
+    """
+    if alpha <= 0 or not counts:
+        return None
+    return lambda qid: (1 + counts.get(qid, 0)) ** -alpha
+
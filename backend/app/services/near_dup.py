@@ -0,0 +1,250 @@
+from __future__ import annotations
+
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from dataclasses import dataclass
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import select
+
+from app.db import get_db, get_table
+
+# 题干按字符 3-gram 切片；签名使用单次哈希分桶的 MinHash（one permutation hashing），
+# 每个切片只算一次哈希，纯 Python 下建 10 万题的索引也只需数秒。
+SHINGLE_SIZE = 3
+NUM_BINS = 32
+BANDS = 8
+ROWS_PER_BAND = NUM_BINS // BANDS
+
+_EMPTY = 0xFFFFFFFF
+_MASK64 = (1 << 64) - 1
+_BIN_BITS = NUM_BINS.bit_length() - 1
+_WS = re.compile(r"\s+")
+
+
+def normalize(text: str) -> str:
+    """去掉空白与标点、统一全半角和大小写；数字与运算符保留，避免把不同数值的题判为重复。"""
+    s = unicodedata.normalize("NFKC", text or "").lower()
+    s = _WS.sub("", s)
+    return "".join(ch for ch in s if not unicodedata.category(ch).startswith("P"))
+
+
+def _mix(h: int) -> int:
+    # crc32 是线性的，再做一次 64 位乘法混合让分桶更均匀
+    h = (h * 0x9E3779B97F4A7C15) & _MASK64
+    return h ^ (h >> 29)
+
+
+def signature(text: str) -> Optional[array]:
+    """计算题干的 MinHash 签名；规范化后为空返回 None。"""
+    s = normalize(text)
+    if not s:
+        return None
+    if len(s) <= SHINGLE_SIZE:
+        grams = {s}
+    else:
+        grams = {s[i : i + SHINGLE_SIZE] for i in range(len(s) - SHINGLE_SIZE + 1)}
+
+    sig = array("I", [_EMPTY]) * NUM_BINS
+    for g in grams:
+        h = _mix(zlib.crc32(g.encode("utf-8")))
+        b = h & (NUM_BINS - 1)
+        v = (h >> _BIN_BITS) & 0xFFFFFFFE
+        if v < sig[b]:
+            sig[b] = v
+    # 短文本会留下空桶：按环形顺序借用下一个非空桶的值（densification），保证相似度估计无偏
+    filled = [v != _EMPTY for v in sig]
+    for b in range(NUM_BINS):
+        if not filled[b]:
+            step = 1
+            while not filled[(b + step) % NUM_BINS]:
+                step += 1
+            sig[b] = (sig[(b + step) % NUM_BINS] + step * 0x61C88647) & 0xFFFFFFFE
+    return sig
+
+
+def similarity(a: array, b: array) -> float:
+    """两个签名的 Jaccard 相似度估计。"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_BINS
+
+
+def _band_keys(sig: array) -> list[int]:
+    return [hash((i, sig[i * ROWS_PER_BAND : (i + 1) * ROWS_PER_BAND].tobytes())) for i in range(BANDS)]
+
+
+@dataclass(frozen=True)
+class NearDup:
+    question_id: Optional[int]
+    similarity: float
+
+
+class NearDupIndex:
+    """
+    MinHash LSH 索引：签名按 BANDS 段分桶，查询只比较至少一段完全相同的候选，与题库规模无关。
+    相似度 0.8 的题目被召回的概率约 98%，0.5 以下的候选在精确比对签名时过滤。
+    """
+
+    def __init__(self):
+        self._sigs: dict[int, array] = {}
+        self._subjects: dict[int, Optional[int]] = {}
+        self._buckets: dict[int, list[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._sigs)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._sigs
+
+    def add(self, key: int, text: str, subject_id: Optional[int] = None, sig: Optional[array] = None) -> None:
+        if key in self._sigs:
+            self.remove(key)
+        sig = sig if sig is not None else signature(text)
+        if sig is None:
+            return
+        self._sigs[key] = sig
+        self._subjects[key] = subject_id
+        for bk in _band_keys(sig):
+            self._buckets.setdefault(bk, []).append(key)
+
+    def remove(self, key: int) -> None:
+        sig = self._sigs.pop(key, None)
+        self._subjects.pop(key, None)
+        if sig is None:
+            return
+        for bk in _band_keys(sig):
+            bucket = self._buckets.get(bk)
+            if bucket is None:
+                continue
+            try:
+                bucket.remove(key)
+            except ValueError:
+                pass
+            if not bucket:
+                del self._buckets[bk]
+
+    def query(self, sig: array, threshold: float, subject_id: Optional[int] = None, limit: int = 5) -> list[NearDup]:
+        seen = set()
+        hits = []
+        for bk in _band_keys(sig):
+            for key in self._buckets.get(bk, ()):
+                if key in seen:
+                    continue
+                seen.add(key)
+                if subject_id is not None and self._subjects.get(key) not in (None, subject_id):
+                    continue
+                sim = similarity(sig, self._sigs[key])
+                if sim >= threshold:
+                    hits.append(NearDup(question_id=key, similarity=sim))
+        hits.sort(key=lambda x: (-x.similarity, x.question_id))
+        return hits[:limit]
+
+
+class QuestionDupIndex:
+    """
+    题库题干的近似重复索引，进程内常驻。
+    首次查询时全量加载；之后每次查询前按 question_id 增量补入新题（包括其它进程写入的），
+    本进程内的修改与删除即时同步，其它进程的删改在 rebuild_interval 秒后的全量重建中生效。
+    """
+
+    def __init__(self, app: Flask, threshold: float = 0.8, rebuild_interval: float = 3600):
+        self.app = app
+        self.threshold = threshold
+        self.rebuild_interval = rebuild_interval
+        self._lock = threading.Lock()
+        self._index: Optional[NearDupIndex] = None
+        self._watermark = 0
+        self._built_at = 0.0
+
+    def _load(self, index: NearDupIndex, after: int) -> int:
+        t = get_table(self.app, "question_bank")
+        stmt = (
+            select(t.c.question_id, t.c.subject_id, t.c.question_content)
+            .where(t.c.question_id > after)
+            .order_by(t.c.question_id)
+        )
+        watermark = after
+        with get_db(self.app).engine.connect() as conn:
+            result = conn.execution_options(stream_results=True, yield_per=2000).execute(stmt)
+            for qid, subject_id, content in result:
+                index.add(int(qid), content, subject_id)
+                watermark = int(qid)
+        return watermark
+
+    def sync(self) -> None:
+        """增量补入新题；距上次全量构建超过 rebuild_interval 时重建。"""
+        with self._lock:
+            if self._index is None or time.monotonic() - self._built_at > self.rebuild_interval:
+                index = NearDupIndex()
+                self._watermark = self._load(index, 0)
+                self._index = index
+                self._built_at = time.monotonic()
+            else:
+                self._watermark = self._load(self._index, self._watermark)
+
+    def find(self, text: str, subject_id: Optional[int] = None, threshold: Optional[float] = None, limit: int = 5) -> list[NearDup]:
+        sig = signature(text)
+        if sig is None:
+            return []
+        self.sync()
+        with self._lock:
+            return self._index.query(sig, threshold or self.threshold, subject_id=subject_id, limit=limit)
+
+    def update(self, question_id: int, text: str, subject_id: Optional[int] = None) -> None:
+        """题干被修改后刷新签名；索引尚未加载时无需处理。"""
+        with self._lock:
+            if self._index is not None and question_id <= self._watermark:
+                self._index.add(question_id, text, subject_id)
+
+    def remove(self, question_ids) -> None:
+        with self._lock:
+            if self._index is not None:
+                for qid in question_ids:
+                    self._index.remove(int(qid))
+
+    def checker(self, subject_id: Optional[int] = None, threshold: Optional[float] = None) -> "DupChecker":
+        self.sync()
+        return DupChecker(self, subject_id, threshold or self.threshold)
+
+
+class DupChecker:
+    """
+    一批待入库题目的查重：同时比对题库与本批次已接受的题目。
+    check() 返回命中的重复项（本批次内的重复 question_id 为 None），未重复时记入本批次并返回 None。
+    """
+
+    def __init__(self, owner: QuestionDupIndex, subject_id: Optional[int], threshold: float):
+        self.owner = owner
+        self.subject_id = subject_id
+        self.threshold = threshold
+        self._local = NearDupIndex()
+
+    def check(self, text: str) -> Optional[NearDup]:
+        sig = signature(text)
+        if sig is None:
+            return None
+        local = self._local.query(sig, self.threshold, limit=1)
+        if local:
+            return NearDup(question_id=None, similarity=local[0].similarity)
+        with self.owner._lock:
+            hits = self.owner._index.query(sig, self.threshold, subject_id=self.subject_id, limit=1)
+        if hits:
+            return hits[0]
+        self._local.add(len(self._local), text, sig=sig)
+        return None
+
+
+def get_near_dup_index(app: Flask) -> QuestionDupIndex:
+    index = app.extensions.get("near_dup_index")
+    if index is None:
+        index = QuestionDupIndex(
+            app,
+            threshold=float(app.config.get("NEAR_DUP_THRESHOLD", 0.8)),
+            rebuild_interval=float(app.config.get("NEAR_DUP_REBUILD_SECONDS", 3600)),
+        )
+        app.extensions["near_dup_index"] = index
+    return index
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import base64
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy.orm import Session
+
+
+@dataclass(frozen=True)
+class PageRequest:
+    """
+    分页参数。cursor 为 None 表示传统的 page/page_size 分页；
+    请求中出现 cursor 参数（首页传空串）即切换为游标分页。
+    """
+
+    cursor: Optional[dict]
+    page: int
+    page_size: int
+    with_total: bool
+
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(value: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(value + "=" * (-len(value) % 4))
+        data = json.loads(raw.decode("utf-8"))
+    except Exception:
+        raise ValueError("cursor 格式错误")
+    if not isinstance(data, dict) or not set(data) <= {"k", "o"}:
+        raise ValueError("cursor 格式错误")
+    # k 为上一页最后一行的主键（各列表都按整数主键分页），o 为记录偏移量
+    k, o = data.get("k"), data.get("o")
+    if k is not None and (isinstance(k, bool) or not isinstance(k, int)):
+        raise ValueError("cursor 格式错误")
+    if o is not None and (isinstance(o, bool) or not isinstance(o, int) or o < 0):
+        raise ValueError("cursor 格式错误")
+    return data
+
+
+def parse_page_args(args, default_size: int = 20, max_size: int = 100, total_default: bool = True) -> PageRequest:
+    """解析 page / page_size / cursor / with_total，cursor 无法解析时抛出 ValueError。"""
+    page = max(1, args.get("page", default=1, type=int))
+    page_size = min(max_size, max(1, args.get("page_size", default=default_size, type=int)))
+    with_total = args.get("with_total", default=1 if total_default else 0, type=int) == 1
+    cursor = None
+    if "cursor" in args:
+        value = (args.get("cursor") or "").strip()
+        cursor = decode_cursor(value) if value else {}
+    return PageRequest(cursor=cursor, page=page, page_size=page_size, with_total=with_total)
+
+
+def fetch_page(session: Session, stmt, key_col, req: PageRequest, order_by: Optional[list] = None) -> tuple[list[dict], Optional[str]]:
+    """
+    取一页数据，返回 (行列表, 下一页游标)。没有下一页时游标为 None。
+
+    默认按 key_col 倒序做 seek 分页：WHERE key < 上一页最后一个 key，任意深度的页与首页代价相同。
+    传入 order_by（如按相关度排序）时排序值无法走索引定位，游标退化为记录偏移量。
+    """
+    size = req.page_size
+    if order_by is None:
+        stmt = stmt.order_by(key_col.desc())
+        if req.cursor is None:
+            stmt = stmt.offset((req.page - 1) * size)
+        elif req.cursor.get("k") is not None:
+            stmt = stmt.where(key_col < req.cursor["k"])
+        offset = None
+    else:
+        offset = (req.cursor.get("o") or 0) if req.cursor is not None else (req.page - 1) * size
+        stmt = stmt.order_by(*order_by).offset(offset)
+
+    rows = [dict(r) for r in session.execute(stmt.limit(size + 1)).mappings().all()]
+    has_more = len(rows) > size
+    rows = rows[:size]
+    if not has_more or not rows:
+        return rows, None
+    if offset is None:
+        return rows, encode_cursor({"k": rows[-1][key_col.key]})
+    return rows, encode_cursor({"o": offset + size})
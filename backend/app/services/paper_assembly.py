@@ -0,0 +1,340 @@
+"""
+约束组卷引擎：在各部分题型/难度/章节筛选之外，满足整卷层面的约束。
+
+支持的整卷约束（strategy.constraints）：
+    total_score       目标总分，score_tolerance 为允许偏差
+    difficulty_mix    难度占比 {difficulty_id: 比例}，按题数计算，四舍五入到整题
+    cover_chapters    必须覆盖的章节（含其子章节），每个至少一题
+    max_exposure      已被多少份试卷使用过的题目不再入选
+    time_limit_ms     求解时间上限
+
+求解分两步：先逐题贪心（每个空位从随机抽取的若干候选中选使违约最小的一题），
+再做局部搜索（随机选一个已选题，从同部分候选中抽样替换，接受不变差的替换），违约降为 0 或到时即停；
+局部搜索停滞时换一个贪心初解重来，最终返回违约最小的方案。
+求解部分只依赖内存中的候选列表，不访问数据库，便于单独压测。
+"""
+from __future__ import annotations
+
+import random
+import time
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from typing import Optional
+
+# 贪心与局部搜索每步评估的候选数
+SAMPLE_SIZE = 32
+DEFAULT_TIME_LIMIT_MS = 150
+# 局部搜索连续这么多步没有改进时，换一个贪心初解重新开始
+STALL_ITERATIONS = 150
+
+
+@dataclass(frozen=True)
+class Candidate:
+    question_id: int
+    score: float
+    difficulty_id: Optional[int]
+    chapter_id: Optional[int]
+
+
+@dataclass
+class SectionSpec:
+    name: str
+    count: int
+    candidates: list[Candidate]
+    score_each: Optional[float] = None
+
+
+@dataclass
+class Constraints:
+    total_score: Optional[float] = None
+    score_tolerance: float = 0.0
+    difficulty_mix: dict[int, float] = field(default_factory=dict)
+    cover_chapters: list[int] = field(default_factory=list)
+    max_exposure: Optional[int] = None
+    time_limit_ms: int = DEFAULT_TIME_LIMIT_MS
+
+    @property
+    def empty(self) -> bool:
+        return self.total_score is None and not self.difficulty_mix and not self.cover_chapters and self.max_exposure is None
+
+
+@dataclass
+class AssemblyResult:
+    sections: list[list[Candidate]]
+    total_score: float
+    overlap: dict[str, int]
+    violations: list[str]
+    iterations: int
+    elapsed_ms: float
+
+    @property
+    def ok(self) -> bool:
+        return not self.violations
+
+
+def parse_constraints(raw) -> Constraints:
+    """校验并规范化 strategy.constraints，格式错误抛出 ValueError。"""
+    if raw is None:
+        return Constraints()
+    if not isinstance(raw, dict):
+        raise ValueError("strategy.constraints 必须是对象")
+    try:
+        c = Constraints(
+            total_score=float(raw["total_score"]) if raw.get("total_score") is not None else None,
+            score_tolerance=float(raw.get("score_tolerance") or 0),
+            difficulty_mix={int(k): float(v) for k, v in (raw.get("difficulty_mix") or {}).items() if float(v) > 0},
+            cover_chapters=[int(x) for x in (raw.get("cover_chapters") or [])],
+            max_exposure=int(raw["max_exposure"]) if raw.get("max_exposure") is not None else None,
+            time_limit_ms=min(2000, max(10, int(raw.get("time_limit_ms") or DEFAULT_TIME_LIMIT_MS))),
+        )
+    except (TypeError, ValueError, AttributeError):
+        raise ValueError("strategy.constraints 格式错误")
+    if c.difficulty_mix and abs(sum(c.difficulty_mix.values()) - 1) > 0.01:
+        raise ValueError("constraints.difficulty_mix 各项比例之和必须为 1")
+    if c.max_exposure is not None and c.max_exposure < 1:
+        raise ValueError("constraints.max_exposure 必须大于 0")
+    return c
+
+
+def _difficulty_targets(mix: dict[int, float], n: int) -> dict[int, int]:
+    """最大余额法把比例换算成整题数，保证合计等于总题数。"""
+    if not mix:
+        return {}
+    raw = {d: r * n for d, r in mix.items()}
+    targets = {d: int(v) for d, v in raw.items()}
+    rest = n - sum(targets.values())
+    for d in sorted(raw, key=lambda d: raw[d] - targets[d], reverse=True)[:rest]:
+        targets[d] += 1
+    return targets
+
+
+class _State:
+    """已选题目与各约束的计数，支持 O(约束数) 的增量评估。"""
+
+    def __init__(
+        self,
+        specs: list[SectionSpec],
+        constraints: Constraints,
+        cover_map: dict[int, tuple[int, ...]],
+        reused: dict[int, tuple[str, ...]],
+        max_reuse: int,
+    ):
+        self.specs = specs
+        self.c = constraints
+        self.cover_map = cover_map
+        self.reused = reused
+        self.max_reuse = max_reuse
+        self.reuse = Counter()
+        self.chosen: list[list[Candidate]] = [[] for _ in specs]
+        self.used: set[int] = set()
+        self.total = 0.0
+        self.diff = Counter()
+        self.cover = Counter()
+        self.size = sum(s.count for s in specs)
+        self.filled = 0
+        self.diff_target = _difficulty_targets(constraints.difficulty_mix, self.size)
+
+    def score_of(self, s: int, cand: Candidate) -> float:
+        each = self.specs[s].score_each
+        return each if each is not None else cand.score
+
+    def _score_penalty(self, total: float, filled: int) -> float:
+        if self.c.total_score is None:
+            return 0.0
+        # 未选满时按比例折算目标分，贪心阶段也能朝总分靠拢
+        target = self.c.total_score * filled / self.size if self.size else 0.0
+        return max(0.0, abs(total - target) - self.c.score_tolerance)
+
+    def penalty(self) -> float:
+        p = self._score_penalty(self.total, self.filled)
+        p += sum(abs(self.diff.get(d, 0) - t) for d, t in self.diff_target.items())
+        p += sum(1 for ch in self.c.cover_chapters if self.cover.get(ch, 0) == 0)
+        p += sum(max(0, n - self.max_reuse) for n in self.reuse.values())
+        return p
+
+    def delta(self, s: int, out: Optional[Candidate], inc: Candidate) -> float:
+        """把 out 换成 inc（out 为 None 表示新增）后违约值的变化。局部搜索的热点，不分配临时对象。"""
+        filled = self.filled
+        new_filled = filled if out is not None else filled + 1
+        new_total = self.total + self.score_of(s, inc) - (self.score_of(s, out) if out is not None else 0.0)
+        d = self._score_penalty(new_total, new_filled) - self._score_penalty(self.total, filled)
+
+        if self.diff_target and (out is None or out.difficulty_id != inc.difficulty_id):
+            t = self.diff_target.get(inc.difficulty_id)
+            if t is not None:
+                cur = self.diff.get(inc.difficulty_id, 0)
+                d += abs(cur + 1 - t) - abs(cur - t)
+            if out is not None:
+                t = self.diff_target.get(out.difficulty_id)
+                if t is not None:
+                    cur = self.diff.get(out.difficulty_id, 0)
+                    d += abs(cur - 1 - t) - abs(cur - t)
+
+        if self.c.cover_chapters and (out is None or out.chapter_id != inc.chapter_id):
+            gained = self.cover_map.get(inc.chapter_id, ())
+            lost = self.cover_map.get(out.chapter_id, ()) if out is not None else ()
+            for key in gained:
+                if key not in lost and self.cover.get(key, 0) == 0:
+                    d -= 1
+            for key in lost:
+                if key not in gained and self.cover.get(key, 0) == 1:
+                    d += 1
+
+        if self.reused:
+            changes = Counter(self.reused.get(inc.question_id, ()))
+            if out is not None:
+                changes.subtract(self.reused.get(out.question_id, ()))
+            for key, ch in changes.items():
+                cur = self.reuse.get(key, 0)
+                d += max(0, cur + ch - self.max_reuse) - max(0, cur - self.max_reuse)
+        return d
+
+    def apply(self, s: int, pos: Optional[int], inc: Candidate) -> None:
+        if pos is None:
+            self.chosen[s].append(inc)
+            self.filled += 1
+        else:
+            out = self.chosen[s][pos]
+            self.chosen[s][pos] = inc
+            self.used.discard(out.question_id)
+            self.total -= self.score_of(s, out)
+            self.diff[out.difficulty_id] -= 1
+            for key in self.cover_map.get(out.chapter_id, ()):
+                self.cover[key] -= 1
+            self.reuse.subtract(self.reused.get(out.question_id, ()))
+        self.used.add(inc.question_id)
+        self.reuse.update(self.reused.get(inc.question_id, ()))
+        self.total += self.score_of(s, inc)
+        self.diff[inc.difficulty_id] += 1
+        for key in self.cover_map.get(inc.chapter_id, ()):
+            self.cover[key] += 1
+
+    def violations(self) -> list[str]:
+        out = []
+        if self.c.total_score is not None and abs(self.total - self.c.total_score) > self.c.score_tolerance:
+            out.append(f"总分 {self.total:g}，目标 {self.c.total_score:g}±{self.c.score_tolerance:g}")
+        for d, t in sorted(self.diff_target.items()):
+            if self.diff.get(d, 0) != t:
+                out.append(f"难度 {d} 共 {self.diff.get(d, 0)} 题，目标 {t} 题")
+        missing = [ch for ch in self.c.cover_chapters if self.cover.get(ch, 0) == 0]
+        if missing:
+            out.append(f"未覆盖章节：{', '.join(str(x) for x in missing)}")
+        for key, n in sorted(self.reuse.items()):
+            if n > self.max_reuse:
+                out.append(f"与{key}卷重复 {n} 题，上限 {self.max_reuse} 题")
+        return out
+
+
+def _sample_unused(
+    rng: random.Random, pool: list[Candidate], used: set[int], k: int, weight: Optional[Callable[[int], float]] = None
+) -> list[Candidate]:
+    """
+    从候选池随机取至多 k 个未被选用的候选；候选池通常远大于题数，拒绝采样即可。
+    weight 为抽中权重（0~1，曝光降权），按该概率接受。
+    拒绝采样一个都没取到（候选池快被用完）时退回过滤空闲候选，只有确实没有空闲候选才返回空列表。
+    """
+
+    def from_free() -> list[Candidate]:
+        free = [c for c in pool if c.question_id not in used]
+        return free if len(free) <= k else rng.sample(free, k)
+
+    if len(pool) <= k * 2:
+        return from_free()
+    out, seen = [], set()
+    for _ in range(k * 3):
+        c = pool[rng.randrange(len(pool))]
+        if c.question_id in used or c.question_id in seen:
+            continue
+        if weight is not None and rng.random() >= weight(c.question_id):
+            continue
+        seen.add(c.question_id)
+        out.append(c)
+        if len(out) >= k:
+            break
+    return out or from_free()
+
+
+def _greedy(
+    specs: list[SectionSpec],
+    constraints: Constraints,
+    cover_map: dict[int, tuple[int, ...]],
+    reused: dict[int, tuple[str, ...]],
+    max_reuse: int,
+    rng: random.Random,
+    weight: Optional[Callable[[int], float]],
+) -> _State:
+    """逐题贪心得到初解：每个空位从抽样候选中选使违约增加最少的一题。"""
+    state = _State(specs, constraints, cover_map, reused, max_reuse)
+    for s, spec in enumerate(specs):
+        for _ in range(spec.count):
+            sample = _sample_unused(rng, spec.candidates, state.used, SAMPLE_SIZE, weight)
+            if not sample:
+                free = sum(1 for c in spec.candidates if c.question_id not in state.used) + len(state.chosen[s])
+                raise ValueError(f"{spec.name} 可用题目不足：需要{spec.count}，实际{free}")
+            best = min(sample, key=lambda c: state.delta(s, None, c))
+            state.apply(s, None, best)
+    return state
+
+
+def assemble(
+    specs: list[SectionSpec],
+    constraints: Constraints,
+    cover_map: Optional[dict[int, tuple[int, ...]]] = None,
+    rng: Optional[random.Random] = None,
+    reused: Optional[dict[int, tuple[str, ...]]] = None,
+    max_reuse: int = 0,
+    weight: Optional[Callable[[int], float]] = None,
+) -> AssemblyResult:
+    """
+    求解。cover_map 为 {题目章节ID: 它满足的 cover_chapters}（由调用方按章节子树展开）。
+    reused 为 {题目ID: 已选入该题的其它版本}，本卷与每个其它版本至多重复 max_reuse 题（多版本组卷控制重复率）。
+    weight 为候选的抽样权重（曝光降权），只影响抽样，不计入违约值。
+    候选不足时抛出 ValueError；约束在时限内无法全部满足时返回违约最小的方案，violations 非空。
+    """
+    rng = rng or random.Random()
+    start = time.perf_counter()
+    deadline = start + constraints.time_limit_ms / 1000
+    state = _greedy(specs, constraints, cover_map or {}, reused or {}, max_reuse, rng, weight)
+
+    iterations = 0
+    penalty = state.penalty()
+    best, best_penalty = state, penalty
+    stalled = 0
+    movable = [s for s, spec in enumerate(specs) if spec.count and len(spec.candidates) > spec.count]
+    while best_penalty > 1e-9 and movable and time.perf_counter() < deadline:
+        if stalled >= STALL_ITERATIONS:
+            # 陷入局部最优：换一个贪心初解重新搜索，保留目前违约最小的方案
+            state = _greedy(specs, constraints, cover_map or {}, reused or {}, max_reuse, rng, weight)
+            penalty, stalled = state.penalty(), 0
+            if penalty < best_penalty:
+                best, best_penalty = state, penalty
+            continue
+        iterations += 1
+        stalled += 1
+        s = rng.choice(movable)
+        pos = rng.randrange(len(state.chosen[s]))
+        out = state.chosen[s][pos]
+        sample = _sample_unused(rng, specs[s].candidates, state.used, SAMPLE_SIZE, weight)
+        if not sample:
+            continue
+        scored = [(state.delta(s, out, c), c) for c in sample]
+        d, inc = min(scored, key=lambda x: x[0])
+        # 接受改进；违约不变时以一定概率接受，跳出平台
+        if d < -1e-9 or (d <= 1e-9 and rng.random() < 0.3):
+            state.apply(s, pos, inc)
+            penalty = state.penalty()
+            if d < -1e-9:
+                stalled = 0
+            if penalty < best_penalty:
+                best, best_penalty = state, penalty
+
+    state = best
+    return AssemblyResult(
+        sections=state.chosen,
+        total_score=state.total,
+        overlap={k: n for k, n in state.reuse.items() if n},
+        violations=state.violations(),
+        iterations=iterations,
+        elapsed_ms=(time.perf_counter() - start) * 1000,
+    )
@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from flask import Flask
+
+
+class SelectionCache:
+    """
+    组卷预览结果的进程内暂存（LRU + TTL）：预览时存入抽中的题目并返回令牌，保存时按令牌取回，
+    保存的就是预览看到的那一份，且不必再查询题库。只存题目ID、顺序和分值，不存题干。
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+
+    def put(self, selection: dict) -> str:
+        token = secrets.token_urlsafe(16)
+        with self._lock:
+            self._data[token] = (selection, time.monotonic())
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        return token
+
+    def take(self, token: str) -> Optional[dict]:
+        """
+        取出并作废令牌（原子操作）：同一令牌并发提交时只有一个请求拿到选题，避免存出两份相同的试卷。
+        保存失败时用 restore 放回。
+        """
+        with self._lock:
+            item = self._data.pop(token, None)
+        if item is None or time.monotonic() - item[1] > self.ttl:
+            return None
+        return item[0]
+
+    def restore(self, token: str, selection: dict) -> None:
+        """保存失败后放回令牌，用户可以重试提交。"""
+        with self._lock:
+            self._data[token] = (selection, time.monotonic())
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+def get_selection_cache(app: Flask) -> SelectionCache:
+    cache = app.extensions.get("paper_selection_cache")
+    if cache is None:
+        cache = SelectionCache(
+            maxsize=int(app.config.get("PAPER_PREVIEW_CACHE_SIZE", 256)),
+            ttl=float(app.config.get("PAPER_PREVIEW_TTL", 1800)),
+        )
+        app.extensions["paper_selection_cache"] = cache
+    return cache
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import time
+from collections.abc import Iterable
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask
+from sqlalchemy import Table, delete, select
+from sqlalchemy.exc import InvalidRequestError, NoSuchTableError
+from sqlalchemy.orm import Session
+
+from app.db import get_table
+from app.services.bulk_writer import insert_rows
+
+# 试卷快照表（由 app.migrations 第 5 版创建）：每份试卷按题号排好的题目列表（JSON）与其内容哈希
+SNAPSHOT_TABLE = "exam_paper_snapshot"
+
+# 快照中每道题的字段；question_score 为该题在试卷中的分值
+SNAPSHOT_FIELDS = (
+    "question_sort",
+    "question_score",
+    "question_id",
+    "question_content",
+    "question_answer",
+    "question_analysis",
+    "type_id",
+    "difficulty_id",
+    "chapter_id",
+)
+
+# 题库中会进入快照的字段，修改这些字段的题目需要重建所在试卷的快照
+QUESTION_FIELDS = frozenset(SNAPSHOT_FIELDS) - {"question_sort", "question_score"}
+
+# 快照表不存在（迁移未执行）的检测结果缓存时间（秒）
+_PROBE_TTL = 300
+
+
+def snapshot_table(app: Flask) -> Optional[Table]:
+    """返回快照表；迁移尚未执行时返回 None，读取退回关联查询，写入跳过。"""
+    missing_at = app.extensions.get("paper_snapshot_missing")
+    if missing_at is not None and time.monotonic() - missing_at < _PROBE_TTL:
+        return None
+    try:
+        t = get_table(app, SNAPSHOT_TABLE)
+    except (NoSuchTableError, InvalidRequestError):
+        app.extensions["paper_snapshot_missing"] = time.monotonic()
+        return None
+    app.extensions.pop("paper_snapshot_missing", None)
+    return t
+
+
+def encode(questions: list[dict]) -> tuple[str, str]:
+    """序列化题目列表，返回 (JSON, 内容哈希)。Decimal 等按 str 输出，与接口 JSON 的表示一致。"""
+    body = json.dumps(questions, sort_keys=True, default=str, ensure_ascii=False, separators=(",", ":"))
+    return body, hashlib.sha1(body.encode("utf-8")).hexdigest()
+
+
+def fetch_questions(conn, rel: Table, qb: Table, paper_ids: Iterable[int]) -> dict[int, list[dict]]:
+    """按 paper_question_relation ⋈ question_bank 读取题目，{试卷ID: 按题号排序的题目列表}；没有题目的试卷不出现。"""
+    ids = sorted({int(x) for x in paper_ids})
+    cols = [rel.c.question_sort, rel.c.question_score] + [qb.c[f] for f in SNAPSHOT_FIELDS[2:]]
+    out: dict[int, list[dict]] = {}
+    for i in range(0, len(ids), 500):
+        stmt = (
+            select(rel.c.paper_id, *cols)
+            .join(qb, qb.c.question_id == rel.c.question_id)
+            .where(rel.c.paper_id.in_(ids[i : i + 500]))
+            .order_by(rel.c.paper_id, rel.c.question_sort.asc())
+        )
+        for r in conn.execute(stmt).mappings():
+            out.setdefault(int(r["paper_id"]), []).append({f: r[f] for f in SNAPSHOT_FIELDS})
+    return out
+
+
+def question_rows(app: Flask, session: Session, paper_ids: Iterable[int]) -> dict[int, list[dict]]:
+    return fetch_questions(session, get_table(app, "paper_question_relation"), get_table(app, "question_bank"), paper_ids)
+
+
+def refresh_snapshots(app: Flask, session: Session, paper_ids: Iterable[int], now: Optional[datetime] = None) -> None:
+    """试卷题目或题目内容变化后在同一事务中调用，按当前数据重建这些试卷的快照。"""
+    t = snapshot_table(app)
+    ids = sorted({int(x) for x in paper_ids})
+    if t is None or not ids:
+        return
+    now = now or datetime.now()
+    by_paper = question_rows(app, session, ids)
+    rows = []
+    for pid in ids:
+        body, digest = encode(by_paper.get(pid, []))
+        rows.append({"paper_id": pid, "content_hash": digest, "questions": body, "updated_at": now})
+    for i in range(0, len(ids), 1000):
+        session.execute(delete(t).where(t.c.paper_id.in_(ids[i : i + 1000])))
+    insert_rows(session, t, rows)
+
+
+def drop_snapshots(app: Flask, session: Session, paper_ids: Iterable[int]) -> None:
+    """删除试卷时一并删除快照。"""
+    t = snapshot_table(app)
+    ids = [int(x) for x in paper_ids]
+    if t is not None and ids:
+        session.execute(delete(t).where(t.c.paper_id.in_(ids)))
+
+
+def papers_containing(app: Flask, session: Session, question_ids: Iterable[int]) -> list[int]:
+    """包含这些题目的试卷ID（删除题目时须在删除 paper_question_relation 之前调用）。"""
+    ids = sorted({int(x) for x in question_ids})
+    if not ids or snapshot_table(app) is None:
+        return []
+    rel = get_table(app, "paper_question_relation")
+    out: set[int] = set()
+    for i in range(0, len(ids), 1000):
+        out.update(int(x) for x in session.execute(select(rel.c.paper_id).where(rel.c.question_id.in_(ids[i : i + 1000]))).scalars())
+    return sorted(out)
+
+
+def load_paper(app: Flask, session: Session, paper_id: int) -> Optional[tuple[dict, list[dict], str]]:
+    """
+    读取试卷行与题目列表，返回 (试卷, 题目列表, 内容哈希)；试卷不存在时返回 None。
+    有快照时只按主键读一行；没有快照（迁移未执行或快照缺失）时退回关联查询现算，不在读路径上写入。
+    """
+    paper = get_table(app, "exam_paper")
+    t = snapshot_table(app)
+    if t is None:
+        p = session.execute(select(paper).where(paper.c.paper_id == paper_id)).mappings().first()
+        body = None
+    else:
+        row = session.execute(
+            select(paper, t.c.questions.label("_snapshot"), t.c.content_hash.label("_snapshot_hash"))
+            .outerjoin(t, t.c.paper_id == paper.c.paper_id)
+            .where(paper.c.paper_id == paper_id)
+        ).mappings().first()
+        p = row
+        body = row["_snapshot"] if row is not None else None
+        digest = row["_snapshot_hash"] if row is not None else None
+    if p is None:
+        return None
+    p = {k: v for k, v in p.items() if k not in ("_snapshot", "_snapshot_hash")}
+    if body is None:
+        questions = question_rows(app, session, [paper_id]).get(int(paper_id), [])
+        body, digest = encode(questions)
+    return p, json.loads(body), digest
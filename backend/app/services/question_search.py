@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import heapq
+import math
+import re
+import threading
+import time
+
+from flask import Flask
+from sqlalchemy import and_, case, or_, select, text
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.db import get_db
+
+# 与 app.migrations 中创建的全文索引保持一致
+FULLTEXT_INDEX = "ftx_qb_content_ngram"
+FULLTEXT_COLUMNS = ["question_content", "question_analysis"]
+
+# 索引是否存在的检测结果缓存时间（秒），执行迁移后无需重启即可生效
+_PROBE_TTL = 300
+_probe_lock = threading.Lock()
+
+
+def fulltext_available(app: Flask) -> bool:
+    """题库是否可以使用 MySQL ngram 全文索引检索。"""
+    if (app.config.get("QUESTION_SEARCH_BACKEND") or "auto").lower() != "auto":
+        return False
+    engine = get_db(app).engine
+    if engine.dialect.name != "mysql":
+        return False
+
+    cached = app.extensions.get("question_fulltext")
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < _PROBE_TTL:
+        return cached[0]
+    with _probe_lock:
+        cached = app.extensions.get("question_fulltext")
+        if cached is not None and now - cached[1] < _PROBE_TTL:
+            return cached[0]
+        try:
+            with engine.connect() as conn:
+                n = conn.execute(
+                    text(
+                        "SELECT COUNT(*) FROM information_schema.STATISTICS "
+                        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'question_bank' "
+                        "AND INDEX_NAME = :name AND INDEX_TYPE = 'FULLTEXT'"
+                    ),
+                    {"name": FULLTEXT_INDEX},
+                ).scalar_one()
+            ok = int(n or 0) == len(FULLTEXT_COLUMNS)
+        except SQLAlchemyError:
+            ok = False
+        app.extensions["question_fulltext"] = (ok, now)
+        return ok
+
+
+def search_terms(q: str) -> list[str]:
+    """按空白拆分关键词，去掉会破坏布尔检索语法的双引号。"""
+    return [x for x in (re.sub(r'"', " ", p).strip() for p in (q or "").split()) if x]
+
+
+def _boolean_query(terms: list[str]) -> str:
+    # 每个关键词作为必须出现的短语，ngram 分词下等价于子串匹配
+    return " ".join(f'+"{x}"' for x in terms)
+
+
+def keyword_filter(app: Flask, t, q: str):
+    """
+    返回 (where 条件, 相关度排序表达式)。
+    - 全文索引可用且每个关键词至少 2 个字符（ngram_token_size 默认 2）时使用 MATCH ... AGAINST
+    - 否则退回 LIKE，每个关键词都须出现在题干或解析中，题干命中的排在前面
+    """
+    terms = search_terms(q)
+    if not terms:
+        return None, None
+
+    cols = [t.c[c] for c in FULLTEXT_COLUMNS]
+    if fulltext_available(app) and all(len(x) >= 2 for x in terms):
+        cond = match(*cols, against=_boolean_query(terms)).in_boolean_mode()
+        score = match(*cols, against=" ".join(terms)).in_natural_language_mode()
+        return cond, score
+
+    conds = [or_(*[c.like(f"%{x}%") for c in cols]) for x in terms]
+    cond = conds[0] if len(conds) == 1 else and_(*conds)
+    score = sum(case((t.c.question_content.like(f"%{x}%"), 1), else_=0) for x in terms)
+    return cond, score
+
+
+# 题目所在章节的名称命中关键词时，相关度乘以该系数
+CHAPTER_BOOST = 1.5
+
+
+def keyword_rank(app: Flask, session, t, where: list, keywords: list[str], boost_chapter_ids=(), limit: int = 50) -> list[int]:
+    """
+    在 where 限定的题目中按关键词相关度排序，返回至多 limit 个题目ID（高到低），命中任一关键词即入选。
+    - 全文索引可用时用 MATCH ... AGAINST 的自然语言模式相关度（题干 + 解析，TF-IDF），走全文索引
+    - 否则先用 LIKE 取出命中题目，再按词频计分：题干出现次数权重 2、解析 1，按命中文档数取 IDF
+    boost_chapter_ids 中章节的题目相关度乘以 CHAPTER_BOOST。
+    """
+    terms = list(dict.fromkeys(x for k in keywords for x in search_terms(k)))
+    if not terms:
+        return []
+    cols = [t.c[c] for c in FULLTEXT_COLUMNS]
+    boost_ids = [int(x) for x in boost_chapter_ids]
+
+    if fulltext_available(app) and all(len(x) >= 2 for x in terms):
+        rel = match(*cols, against=" ".join(terms)).in_natural_language_mode()
+        score = rel * case((t.c.chapter_id.in_(boost_ids), CHAPTER_BOOST), else_=1.0) if boost_ids else rel
+        stmt = select(t.c.question_id).where(and_(*where, rel)).order_by(score.desc(), t.c.question_id.desc()).limit(limit)
+        return [int(x) for x in session.execute(stmt).scalars()]
+
+    stmt = select(t.c.question_id, t.c.chapter_id, *cols).where(and_(*where, or_(*[c.like(f"%{x}%") for x in terms for c in cols])))
+    rows = session.execute(stmt).all()
+    if not rows:
+        return []
+    lowered = [((content or "").lower(), (analysis or "").lower()) for _, _, content, analysis in rows]
+    idf = {}
+    for x in terms:
+        df = sum(1 for c, a in lowered if x.lower() in c or x.lower() in a)
+        idf[x] = math.log(1 + len(rows) / df) if df else 0.0
+    boost = set(boost_ids)
+    scored = []
+    for (qid, chapter_id, _, _), (content, analysis) in zip(rows, lowered):
+        s = sum(idf[x] * (2 * math.log1p(content.count(x.lower())) + math.log1p(analysis.count(x.lower()))) for x in terms)
+        if chapter_id in boost:
+            s *= CHAPTER_BOOST
+        scored.append((s, int(qid)))
+    return [qid for _, qid in heapq.nlargest(limit, scored)]
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import heapq
+import random
+from array import array
+from collections.abc import Callable, Collection, Sequence
+
+from flask import Flask
+from sqlalchemy.orm import Session
+
+from app.db import APPROVED_QUESTIONS, get_db
+from app.services.count_cache import CountCache
+
+# 候选ID列表随这些写入失效：已审核题目的增删改、审核状态变化，章节调整（闭包表与章节表在同一事务写入）。
+# 只写入待审核题目（AI 生成）不影响候选集，不会使缓存失效
+_TABLES = (APPROVED_QUESTIONS, "textbook_chapter")
+
+
+def _get_cache(app: Flask) -> CountCache:
+    cache = app.extensions.get("candidate_id_cache")
+    if cache is None:
+        cache = CountCache(
+            maxsize=int(app.config.get("CANDIDATE_CACHE_SIZE", 64)),
+            ttl=float(app.config.get("CANDIDATE_CACHE_TTL", 300)),
+        )
+        app.extensions["candidate_id_cache"] = cache
+    return cache
+
+
+def fetch_ids(session: Session, stmt) -> array:
+    """执行只查 question_id 的语句，结果存成紧凑的 array（10 万个ID约 800KB）。"""
+    return array("q", (int(x) for x in session.execute(stmt).scalars()))
+
+
+def candidate_ids(app: Flask, session: Session, key: tuple, stmt) -> Sequence[int]:
+    """
+    按筛选条件缓存候选题目ID列表，直到题库或章节下一次写入、或 TTL 过期。
+    key 须完整描述 stmt 的筛选条件；同一策略反复组卷（预览、多版本、重新生成）只查一次库。
+    """
+    cache = _get_cache(app)
+    versions = get_db(app).table_versions.get(*_TABLES)
+    ids = cache.get(key, versions)
+    if ids is None:
+        ids = fetch_ids(session, stmt)
+        cache.put(key, versions, ids)
+    return ids
+
+
+def invalidate(app: Flask, key: tuple) -> None:
+    """
+    丢弃一个候选缓存项，下次按条件重新查库。
+    其它进程的删除、撤销审核不会递增本进程的版本号，抽中后读取题目时发现这类ID再调用，避免在 TTL 内反复抽中。
+    """
+    _get_cache(app).discard(key)
+
+
+def sample_ids(
+    ids: Sequence[int],
+    k: int,
+    exclude: Collection[int] = (),
+    rng: random.Random | None = None,
+    weight: Callable[[int], float] | None = None,
+) -> list[int]:
+    """
+    从 ids 中不放回随机抽取至多 k 个不在 exclude 中的ID。
+    k 远小于候选数时按随机下标拒绝采样，不复制整个列表；否则先过滤再抽样。
+    weight 给出每个ID的抽中权重（0~1，如曝光降权），拒绝采样时以该概率接受，效果等同按权重抽样。
+    """
+    rng = rng or random
+    n = len(ids)
+    if k <= 0 or n == 0:
+        return []
+    if k * 4 <= n and len(exclude) * 2 <= n:
+        picked: list[int] = []
+        seen: set[int] = set()
+        for _ in range(k * 20):
+            i = rng.randrange(n)
+            if i in seen:
+                continue
+            qid = ids[i]
+            if weight is not None and rng.random() >= weight(qid):
+                continue
+            seen.add(i)
+            if qid not in exclude:
+                picked.append(qid)
+                if len(picked) == k:
+                    return picked
+    # 候选少或排除项多：过滤后整体抽样
+    pool = [x for x in ids if x not in exclude]
+    if weight is None:
+        return rng.sample(pool, min(k, len(pool)))
+    # 按权重不放回抽样（Efraimidis–Spirakis：取 u^(1/w) 最大的 k 个）
+    keys = [(rng.random() ** (1.0 / w) if (w := weight(qid)) > 0 else 0.0, qid) for qid in pool]
+    return [qid for _, qid in heapq.nlargest(min(k, len(pool)), keys)]
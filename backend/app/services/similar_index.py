@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+from flask import Flask
+from sqlalchemy import select
+
+from app.db import get_db, get_table
+from app.services.near_dup import normalize
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# 文档频率超过该比例的 n-gram（如“的是”“求解”）区分度很低，查询时跳过以缩短倒排链
+MAX_DF_RATIO = 0.3
+
+
+def grams(text: str) -> Counter:
+    """题干的字符 2-gram 词频；中文题干按字切分即可，无需分词。"""
+    s = normalize(text)
+    if len(s) < 2:
+        return Counter([s]) if s else Counter()
+    return Counter(s[i : i + 2] for i in range(len(s) - 1))
+
+
+def _tf(n: int) -> float:
+    return 1.0 + math.log(n)
+
+
+@dataclass(frozen=True)
+class SimilarHit:
+    question_id: int
+    score: float
+
+
+class SimilarIndex:
+    """
+    字符 2-gram TF-IDF 向量的余弦相似度检索。
+
+    构建时生成按 n-gram 组织的倒排表（行号数组 + 归一化权重数组），查询只累加与查询共有的 n-gram 的倒排链，
+    安装了 NumPy 时用向量化累加，否则退化为纯 Python 字典累加。
+    构建之后新增或修改的题目进入增量区（沿用构建时的 IDF），查询时线性扫描，由调用方在增量区过大时重建。
+    """
+
+    def __init__(self, docs: Iterable[tuple[int, Optional[int], str]]):
+        ids = array("q")
+        subjects = array("q")
+        tmp: dict[str, tuple[array, array]] = {}
+        for qid, subject_id, text in docs:
+            row = len(ids)
+            ids.append(int(qid))
+            subjects.append(int(subject_id) if subject_id is not None else -1)
+            for g, n in grams(text).items():
+                posting = tmp.get(g)
+                if posting is None:
+                    posting = tmp[g] = (array("i"), array("f"))
+                posting[0].append(row)
+                posting[1].append(_tf(n))
+
+        self.size = n_docs = len(ids)
+        self._row_of = {qid: row for row, qid in enumerate(ids)}
+        self._ids = ids
+        self._idf = {g: math.log((n_docs + 1) / (len(p[0]) + 1)) + 1.0 for g, p in tmp.items()}
+        self._idf_unknown = math.log(n_docs + 1) + 1.0
+        self._max_df = max(1, int(n_docs * MAX_DF_RATIO))
+        self._delta: dict[int, tuple[Optional[int], dict[str, float]]] = {}
+
+        if np is not None:
+            self._subjects = np.frombuffer(subjects, dtype=np.int64)
+            self._alive = np.ones(n_docs, dtype=bool)
+            norm2 = np.zeros(n_docs, dtype=np.float64)
+            arrays = {}
+            for g, (rows, weights) in tmp.items():
+                r = np.frombuffer(rows, dtype=np.int32)
+                w = np.frombuffer(weights, dtype=np.float32) * np.float32(self._idf[g])
+                norm2[r] += w.astype(np.float64) ** 2
+                arrays[g] = (r, w)
+            inv = (1.0 / np.sqrt(np.maximum(norm2, 1e-12))).astype(np.float32)
+            self._postings = {g: (r, w * inv[r]) for g, (r, w) in arrays.items()}
+        else:
+            self._subjects = subjects
+            self._alive = bytearray(b"\x01") * n_docs
+            norm2 = [0.0] * n_docs
+            for g, (rows, weights) in tmp.items():
+                idf = self._idf[g]
+                for r, w in zip(rows, weights):
+                    norm2[r] += (w * idf) ** 2
+            inv = [1.0 / math.sqrt(x) if x > 0 else 0.0 for x in norm2]
+            for g, (rows, weights) in tmp.items():
+                idf = self._idf[g]
+                for i, r in enumerate(rows):
+                    weights[i] = weights[i] * idf * inv[r]
+            self._postings = tmp
+
+    @property
+    def delta_size(self) -> int:
+        return len(self._delta)
+
+    def _vector(self, text: str) -> dict[str, float]:
+        vec = {g: _tf(n) * self._idf.get(g, self._idf_unknown) for g, n in grams(text).items()}
+        norm = math.sqrt(sum(w * w for w in vec.values()))
+        return {g: w / norm for g, w in vec.items()} if norm > 0 else {}
+
+    def add(self, qid: int, subject_id: Optional[int], text: str) -> None:
+        """新增或修改题目：主索引中的旧向量作废，新向量写入增量区。未给出科目时沿用原科目。"""
+        if subject_id is None:
+            if qid in self._delta:
+                subject_id = self._delta[qid][0]
+            elif qid in self._row_of and self._subjects[self._row_of[qid]] >= 0:
+                subject_id = int(self._subjects[self._row_of[qid]])
+        self._kill(qid)
+        vec = self._vector(text)
+        if vec:
+            self._delta[qid] = (subject_id, vec)
+
+    def remove(self, qid: int) -> None:
+        self._kill(qid)
+        self._delta.pop(qid, None)
+
+    def _kill(self, qid: int) -> None:
+        row = self._row_of.get(qid)
+        if row is not None:
+            self._alive[row] = False if np is not None else 0
+
+    def search(self, text: str, k: int = 10, subject_id: Optional[int] = None, exclude: Iterable[int] = ()) -> list[SimilarHit]:
+        qvec = self._vector(text)
+        if not qvec:
+            return []
+        exclude = set(exclude)
+        terms = [(g, w) for g, w in qvec.items() if g in self._postings and len(self._postings[g][0]) <= self._max_df]
+
+        hits: list[SimilarHit] = []
+        if self.size and terms:
+            hits = self._search_main(terms, k + len(exclude), subject_id)
+        for qid, (sid, dvec) in self._delta.items():
+            if subject_id is not None and sid != subject_id:
+                continue
+            small, large = (dvec, qvec) if len(dvec) < len(qvec) else (qvec, dvec)
+            score = sum(w * large.get(g, 0.0) for g, w in small.items())
+            if score > 0:
+                hits.append(SimilarHit(question_id=qid, score=score))
+        hits = [h for h in hits if h.question_id not in exclude]
+        return heapq.nlargest(k, hits, key=lambda h: (h.score, -h.question_id))
+
+    def _search_main(self, terms: list[tuple[str, float]], k: int, subject_id: Optional[int]) -> list[SimilarHit]:
+        if np is not None:
+            scores = np.zeros(self.size, dtype=np.float32)
+            for g, qw in terms:
+                rows, weights = self._postings[g]
+                scores[rows] += np.float32(qw) * weights
+            scores[~self._alive] = 0
+            if subject_id is not None:
+                scores[self._subjects != subject_id] = 0
+            k = min(k, self.size)
+            top = np.argpartition(-scores, k - 1)[:k]
+            return [SimilarHit(question_id=self._ids[int(r)], score=float(scores[r])) for r in top if scores[r] > 0]
+
+        acc: dict[int, float] = {}
+        for g, qw in terms:
+            rows, weights = self._postings[g]
+            for r, w in zip(rows, weights):
+                acc[r] = acc.get(r, 0.0) + qw * w
+        best = heapq.nlargest(
+            k,
+            (
+                (s, r)
+                for r, s in acc.items()
+                if self._alive[r] and (subject_id is None or self._subjects[r] == subject_id)
+            ),
+        )
+        return [SimilarHit(question_id=self._ids[r], score=s) for s, r in best]
+
+
+class QuestionSimilarIndex:
+    """
+    题库的相似题检索索引，进程内常驻。
+    首次查询时在后台线程全量构建，构建完成前查询返回 None（调用方提示稍后重试）；
+    之后每次查询前按 question_id 增量补入新题，本进程内的修改与删除即时同步。
+    增量区超过 max_delta 条或距上次构建超过 rebuild_interval 秒时在后台重建（同时刷新 IDF 与其它进程的删改），
+    重建期间旧索引照常服务，构建期间发生的修改与删除在换入前重放到新索引上。
+    """
+
+    def __init__(self, app: Flask, rebuild_interval: float = 3600, max_delta: int = 5000):
+        # 传入的可能是 current_app 代理，后台线程中没有应用上下文，取出实际的应用对象
+        self.app = app._get_current_object() if hasattr(app, "_get_current_object") else app
+        self.rebuild_interval = rebuild_interval
+        self.max_delta = max_delta
+        self._lock = threading.Lock()
+        self._index: Optional[SimilarIndex] = None
+        self._watermark = 0
+        self._built_at = 0.0
+        # 后台重建进行中时记录本进程的修改与删除：[(question_id, subject_id, text)]，text 为 None 表示删除
+        self._pending: Optional[list[tuple[int, Optional[int], Optional[str]]]] = None
+
+    def _rows(self, after: int):
+        t = get_table(self.app, "question_bank")
+        stmt = (
+            select(t.c.question_id, t.c.subject_id, t.c.question_content)
+            .where(t.c.question_id > after)
+            .order_by(t.c.question_id)
+        )
+        with get_db(self.app).engine.connect() as conn:
+            for qid, subject_id, content in conn.execution_options(stream_results=True, yield_per=2000).execute(stmt):
+                yield int(qid), subject_id, content or ""
+
+    def _rebuild(self) -> None:
+        """后台线程：不持锁构建新索引，重放构建期间的修改后换入。"""
+        try:
+            mark = 0
+
+            def rows():
+                nonlocal mark
+                for qid, subject_id, content in self._rows(0):
+                    mark = qid
+                    yield qid, subject_id, content
+
+            index = SimilarIndex(rows())
+            with self._lock:
+                for qid, subject_id, text in self._pending or []:
+                    if text is None:
+                        index.remove(qid)
+                    elif qid <= mark:
+                        index.add(qid, subject_id, text)
+                self._index, self._watermark, self._built_at = index, mark, time.monotonic()
+        except Exception:
+            # 构建失败时保留旧索引，下一次查询重新触发
+            self.app.logger.exception("相似题索引构建失败")
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def sync(self) -> bool:
+        """补入新题，必要时触发后台重建。返回是否有可用索引。"""
+        with self._lock:
+            stale = time.monotonic() - self._built_at > self.rebuild_interval
+            if (self._index is None or stale or self._index.delta_size > self.max_delta) and self._pending is None:
+                self._pending = []
+                threading.Thread(target=self._rebuild, name="similar-index-rebuild", daemon=True).start()
+            if self._index is None:
+                return False
+            for qid, subject_id, content in list(self._rows(self._watermark)):
+                self._index.add(qid, subject_id, content)
+                self._watermark = max(self._watermark, qid)
+            return True
+
+    def search(
+        self, text: str, k: int = 10, subject_id: Optional[int] = None, exclude: Iterable[int] = ()
+    ) -> Optional[list[SimilarHit]]:
+        """索引尚未构建完成时返回 None。"""
+        if not self.sync():
+            return None
+        with self._lock:
+            return self._index.search(text, k=k, subject_id=subject_id, exclude=exclude)
+
+    def update(self, question_id: int, text: str, subject_id: Optional[int] = None) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((question_id, subject_id, text))
+            if self._index is not None and question_id <= self._watermark:
+                self._index.add(question_id, subject_id, text)
+
+    def remove(self, question_ids) -> None:
+        with self._lock:
+            for qid in question_ids:
+                if self._pending is not None:
+                    self._pending.append((int(qid), None, None))
+                if self._index is not None:
+                    self._index.remove(int(qid))
+
+
+def get_similar_index(app: Flask) -> QuestionSimilarIndex:
+    index = app.extensions.get("similar_index")
+    if index is None:
+        index = QuestionSimilarIndex(
+            app,
+            rebuild_interval=float(app.config.get("SIMILAR_INDEX_REBUILD_SECONDS", 3600)),
+            max_delta=int(app.config.get("SIMILAR_INDEX_MAX_DELTA", 5000)),
+        )
+        app.extensions["similar_index"] = index
+    return index
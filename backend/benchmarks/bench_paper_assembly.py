@@ -0,0 +1,82 @@
+"""
+约束组卷基准：在合成的 10 万题候选池上测量 paper_assembly.assemble 的求解耗时（P50 / P95 / 最大值）与约束满足率。
+
+用法（在 backend 目录下）：
+    python benchmarks/bench_paper_assembly.py                   # 10 万题，每种策略 50 次
+    python benchmarks/bench_paper_assembly.py --questions 20000 --runs 200
+
+“未满足”为时限内没能满足全部约束的次数及比例（接口对这类请求返回 400），应为 0。
+
+只测求解本身；候选读取是按部分的一次索引查询，耗时取决于数据库。
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.paper_assembly import Candidate, SectionSpec, assemble, parse_constraints
+
+N_TYPES = 5
+N_CHAPTERS = 40
+
+# (题型, 题数, 每题分值)；分值为 None 时取题目自带分值
+_SECTIONS = [(1, 20, 2.0), (2, 10, 3.0), (3, 5, None), (4, 4, None)]
+
+STRATEGIES = {
+    "总分": {"total_score": 150},
+    "总分+难度": {"total_score": 150, "difficulty_mix": {"1": 0.3, "2": 0.5, "3": 0.2}},
+    "总分+难度+章节覆盖": {
+        "total_score": 150,
+        "difficulty_mix": {"1": 0.3, "2": 0.5, "3": 0.2},
+        "cover_chapters": list(range(1, 13)),
+    },
+}
+
+
+def _pool(rnd: random.Random, n: int) -> dict[int, list[Candidate]]:
+    by_type: dict[int, list[Candidate]] = {t: [] for t in range(1, N_TYPES + 1)}
+    for qid in range(1, n + 1):
+        t = rnd.randint(1, N_TYPES)
+        by_type[t].append(
+            Candidate(question_id=qid, score=float(rnd.choice([5, 6, 8, 10, 12])), difficulty_id=rnd.randint(1, 3), chapter_id=rnd.randint(1, N_CHAPTERS))
+        )
+    return by_type
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="约束组卷基准")
+    parser.add_argument("--questions", type=int, default=100000)
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    by_type = _pool(rnd, args.questions)
+    specs = [SectionSpec(name=f"题型{t}", count=n, candidates=by_type[t], score_each=each) for t, n, each in _SECTIONS]
+    # 章节与覆盖目标一一对应（没有子章节）
+    cover_map = {cid: (cid,) for cid in range(1, N_CHAPTERS + 1)}
+    print(f"题目数: {args.questions}  每种策略运行 {args.runs} 次  试卷题数: {sum(s.count for s in specs)}")
+
+    for name, raw in STRATEGIES.items():
+        constraints = parse_constraints(raw)
+        latencies, failed, iterations = [], 0, 0
+        for _ in range(args.runs):
+            result = assemble(specs, constraints, cover_map, rng=random.Random(rnd.random()))
+            latencies.append(result.elapsed_ms)
+            iterations += result.iterations
+            failed += 0 if result.ok else 1
+        latencies.sort()
+        p50 = latencies[len(latencies) // 2]
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(
+            f"{name}: P50 {p50:.1f} ms  P95 {p95:.1f} ms  最大 {latencies[-1]:.1f} ms  "
+            f"平均迭代 {iterations / args.runs:.0f}  未满足 {failed}/{args.runs}（{failed / args.runs:.1%}）"
+        )
+
+
+if __name__ == "__main__":
+    main()
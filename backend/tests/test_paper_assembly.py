@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from app.services.paper_assembly import Candidate, SectionSpec, _greedy, assemble, parse_constraints
+
+
+def _pool(n: int) -> list[Candidate]:
+    return [Candidate(question_id=i, score=2.0, difficulty_id=1, chapter_id=1) for i in range(1, n + 1)]
+
+
+@pytest.mark.parametrize("pool_size,count", [(70, 70), (100, 100), (200, 199), (200, 200), (500, 498)])
+def test_section_can_use_whole_pool(pool_size, count):
+    # 候选池几乎或全部用完时不能误报“可用题目不足”
+    constraints = parse_constraints({"total_score": 2 * count})
+    for seed in range(20):
+        result = assemble([SectionSpec("A", count, _pool(pool_size))], constraints, rng=random.Random(seed))
+        ids = [c.question_id for c in result.sections[0]]
+        assert len(ids) == count
+        assert len(set(ids)) == count
+        assert result.ok
+
+
+def test_section_can_use_whole_pool_weighted():
+    constraints = parse_constraints({"total_score": 400})
+    result = assemble(
+        [SectionSpec("A", 200, _pool(200))], constraints, rng=random.Random(0), weight=lambda qid: 0.01
+    )
+    assert len({c.question_id for c in result.sections[0]}) == 200
+
+
+def test_pool_smaller_than_count_raises():
+    with pytest.raises(ValueError):
+        assemble([SectionSpec("A", 11, _pool(10))], parse_constraints({"total_score": 22}), rng=random.Random(0))
+
+
+def test_delta_matches_penalty_difference():
+    # 增量评估必须与整体重算的违约值之差一致
+    rng = random.Random(7)
+    pool = [
+        Candidate(question_id=i, score=float(rng.choice([2, 3, 5])), difficulty_id=rng.randint(1, 3), chapter_id=rng.randint(1, 6))
+        for i in range(1, 301)
+    ]
+    specs = [SectionSpec("A", 10, pool[:150]), SectionSpec("B", 5, pool[150:], score_each=4.0)]
+    constraints = parse_constraints(
+        {"total_score": 50, "difficulty_mix": {"1": 0.4, "2": 0.4, "3": 0.2}, "cover_chapters": [1, 2, 5]}
+    )
+    cover_map = {1: (1,), 2: (1, 2), 3: (1,), 5: (5,)}
+    state = _greedy(specs, constraints, cover_map, {}, 0, rng, None)
+    for _ in range(500):
+        s = rng.randrange(len(specs))
+        pos = rng.randrange(len(state.chosen[s]))
+        inc = rng.choice([c for c in specs[s].candidates if c.question_id not in state.used])
+        before = state.penalty()
+        d = state.delta(s, state.chosen[s][pos], inc)
+        state.apply(s, pos, inc)
+        assert state.penalty() - before == pytest.approx(d)